@@ -48,13 +48,33 @@ class collectionlist(recursemixin, querymixin, getslicefix, list):
 class collection(object):
     """
     Collection (set-like) for model elements' 1:n and n:m relationships.
+
+    The items are kept in order in a collectionlist. A set of the items
+    is kept next to it for membership tests, and a map of item positions
+    for index() and remove(). The positions are built when needed, and
+    again after an item is removed from the middle of the list.
     """
 
+    __slots__ = ('property', 'object', 'type', 'items', '_members', '_positions',
+                 '_bound')
+
     def __init__(self, property, object, type):
         self.property = property
         self.object = object
         self.type = type
         self.items = collectionlist()
+        self._members = set()
+        self._positions = None
+        # The unregister count of the owner's factory at which all members
+        # were found in the factory, or None
+        self._bound = None
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            setattr(self, name, value)
 
     def __len__(self):
         return len(self.items)
@@ -66,10 +86,38 @@ class collection(object):
         self.remove(key)
 
     def __getitem__(self, key):
+        if isinstance(key, basestring) or \
+                type(key) is tuple and isinstance(key[0], basestring):
+            return self.items.query(key, self._select)
         return self.items.__getitem__(key)
 
+    def _select(self, matcher):
+        """
+        Look up the items for a ``it.name == value`` query in the name
+        index of the element factory. The index is only used if all items
+        live in the same factory as the collection's owner. Return None if
+        the index can not be used.
+        """
+        from uml2 import NamedElement # uml2 imports this module
+        factory = self.object.factory
+        if matcher.attribute != 'name' or not factory \
+                or not isinstance(matcher.value, basestring) \
+                or not issubclass(self.type, NamedElement):
+            return None
+        members = self._members
+        if self._bound != factory._unregistered:
+            # Members can only leave the factory by being unregistered
+            for e in members:
+                if e not in factory:
+                    return None
+            self._bound = factory._unregistered
+        matched = [e for e in factory.lookup_name(matcher.value) if e in members]
+        if len(matched) > 1:
+            matched.sort(key=self.index)
+        return matched
+
     def __contains__(self, obj):
-        return self.items.__contains__(obj)
+        return obj in self._members
 
     def __iter__(self):
         return iter(self.items)
@@ -80,7 +128,7 @@ class collection(object):
     __repr__ = __str__
 
     def __nonzero__(self):
-        return self.items!=[]
+        return bool(self.items)
 
     def append(self, value):
         if isinstance(value, self.type):
@@ -89,7 +137,7 @@ class collection(object):
             raise TypeError, 'Object is not of type %s' % self.type.__name__
 
     def remove(self, value):
-        if value in self.items:
+        if value in self._members:
             self.property.__delete__(self.object, value)
         else:
             raise ValueError, '%s not in collection' % value
@@ -100,7 +148,48 @@ class collection(object):
         Given an object, return the position of that object in the
         collection.
         """
-        return self.items.index(key)
+        positions = self._positions
+        if positions is None:
+            positions = self._positions = dict((v, i) for i, v
+                                               in enumerate(self.items))
+        try:
+            return positions[key]
+        except KeyError:
+            raise ValueError, '%s not in collection' % key
+
+    def _add(self, value):
+        """
+        Add value to the end of the list. Return False if value is
+        already in the collection. Used by the association property.
+        """
+        if value in self._members:
+            return False
+        if self._positions is not None:
+            self._positions[value] = len(self.items)
+        self.items.append(value)
+        self._members.add(value)
+        self._bound = None
+        return True
+
+    def _remove(self, value):
+        """
+        Remove value from the list. Return False if value is not in the
+        collection. Used by the association property.
+        """
+        if value not in self._members:
+            return False
+        items = self.items
+        self._members.remove(value)
+        positions = self._positions
+        if positions is None:
+            items.remove(value)
+        else:
+            i = positions.pop(value)
+            del items[i]
+            if i < len(items):
+                # The items after value moved
+                self._positions = None
+        return True
 
 
     # OCL members (from SMW by Ivan Porres, http://www.abo.fi/~iporres/smw)
@@ -109,27 +198,23 @@ class collection(object):
         return len(self.items)
 
     def includes(self,o):
-        return o in self.items
+        return o in self._members
 
     def excludes(self,o):
         return not self.includes(o)
 
     def count(self,o):
-        c=0
-        for x in self.items:
-            if x==o:
-                c=c+1
-        return c
+        return int(o in self._members)
 
     def includesAll(self,c):
         for o in c:
-            if o not in self.items:
+            if o not in self._members:
                 return 0
         return 1
 
     def excludesAll(self,c):
         for o in c:
-            if o in self.items:
+            if o in self._members:
                 return 0
         return 1
 
@@ -232,9 +317,11 @@ class collection(object):
         Swap two elements. Return true if swap was successful.
         """
         try:
-            i1 = self.items.index(item1)
-            i2 = self.items.index(item2)
+            i1 = self.index(item1)
+            i2 = self.index(item2)
             self.items[i1], self.items[i2] = self.items[i2], self.items[i1]
+            positions = self._positions
+            positions[item1], positions[item2] = i2, i1
 
             # send a notification that this list has changed
             factory = self.object.factory
@@ -2,12 +2,61 @@
 """This module contains a model element Diagram which is the abstract
 representation of a UML diagram. Diagrams can be visualized and edited.
 
-The DiagramCanvas class extends the gaphas.Canvas class."""
+The DiagramCanvas class extends the gaphas.Canvas class.
+
+The canvas items of a diagram can be loaded lazily: a loader function is
+installed on the canvas with DiagramCanvas.load_lazily() and is invoked the
+first time the items are requested. Until then the diagram does not show up
+in the presentation of the model elements it presents. Element.presentation
+takes care of that by materializing the pending diagrams on access."""
 
 import gaphas
 import uuid
+from properties import association
 from uml2 import Namespace, PackageableElement
 
+# Lazily loaded canvases, by id of the elements presented on them:
+_pending = {}
+
+
+def materialize_presentation(element):
+    """Create the canvas items of all lazily loaded diagrams that present
+    the element."""
+
+    canvases = _pending.get(element.id)
+    if canvases:
+        for canvas in list(canvases):
+            canvas.materialize()
+
+
+def pending_canvases(element):
+    """Return the lazily loaded canvases that present the element, without
+    creating their canvas items."""
+
+    return _pending.get(element.id, ())
+
+
+class presentation(association):
+    """The Element.presentation association. Reading, saving or unlinking
+    the presentation of an element materializes the diagrams that have not
+    been loaded yet and present the element."""
+
+    def __get__(self, obj, class_=None):
+        if obj and obj._id in _pending:
+            materialize_presentation(obj)
+        return super(presentation, self).__get__(obj, class_)
+
+    def save(self, obj, save_func):
+        if obj._id in _pending:
+            materialize_presentation(obj)
+        super(presentation, self).save(obj, save_func)
+
+    def unlink(self, obj):
+        if obj._id in _pending:
+            materialize_presentation(obj)
+        super(presentation, self).unlink(obj)
+
+
 class DiagramCanvas(gaphas.Canvas):
     """DiagramCanvas extends the gaphas.Canvas class.  Updates to the canvas
     can be blocked by setting the block_updates property to true.  A save
@@ -21,6 +70,8 @@ class DiagramCanvas(gaphas.Canvas):
         super(DiagramCanvas, self).__init__()
         self._diagram = diagram
         self._block_updates = False
+        self._loader = None
+        self._subjects = ()
 
     diagram = property(lambda s: s._diagram)
 
@@ -41,6 +92,52 @@ class DiagramCanvas(gaphas.Canvas):
             return
         super(DiagramCanvas, self).update_now()
 
+    def load_lazily(self, loader, subjects=()):
+        """Defer the creation of the canvas items.  The loader is called with
+        the canvas as argument the first time the items are needed.  Subjects
+        is a list of ids of the model elements presented on the canvas."""
+
+        self._loader = loader
+        self._subjects = subjects
+        for id in subjects:
+            _pending.setdefault(id, set()).add(self)
+
+    def _discard_loader(self):
+        self._loader = None
+        for id in self._subjects:
+            canvases = _pending.get(id)
+            if canvases:
+                canvases.discard(self)
+                if not canvases:
+                    del _pending[id]
+        self._subjects = ()
+
+    materialized = property(lambda s: s._loader is None)
+
+    # The loader function, as long as the canvas items are not created:
+    loader = property(lambda s: s._loader)
+
+    def materialize(self):
+        """Create the canvas items, if they are loaded lazily."""
+
+        loader = self._loader
+        if loader:
+            self._discard_loader()
+            loader(self)
+
+    def cancel_load(self):
+        """Drop the lazy loader, the canvas items will never be created."""
+
+        self._discard_loader()
+
+    def get_all_items(self):
+        self.materialize()
+        return super(DiagramCanvas, self).get_all_items()
+
+    def get_root_items(self):
+        self.materialize()
+        return super(DiagramCanvas, self).get_root_items()
+
     def save(self, save_func):
         """Apply the supplied save function to all root diagram items."""
         
@@ -5,16 +5,133 @@ Base class for UML model elements.
 
 __all__ = [ 'Element' ]
 
-import threading
 import uuid
-from properties import umlproperty
+from properties import umlproperty, association, associationstub, \
+                       derived, redefine
+
+
+class propertytable(object):
+    """
+    The umlproperty descriptors of an Element class, in the order dir()
+    reports them.
+
+    all          - all umlproperty's
+    persistent   - properties that are saved (attribute, enumeration,
+                   association and redefine, if it eclipses the original)
+    derived      - derived and derivedunion properties
+    associations - properties that require unlinking and postload checks
+                   (association, associationstub and eclipsing redefine)
+    """
+
+    def __init__(self, class_):
+        self.all = []
+        self.persistent = []
+        self.derived = []
+        self.associations = []
+        for propname in dir(class_):
+            if not propname.startswith('_'):
+                prop = getattr(class_, propname)
+                if isinstance(prop, umlproperty):
+                    self.all.append(prop)
+                    self._add(prop)
+
+    def _add(self, prop):
+        if isinstance(prop, derived):
+            self.derived.append(prop)
+        elif isinstance(prop, associationstub):
+            self.associations.append(prop)
+        elif isinstance(prop, redefine):
+            if prop.original.name == prop.name:
+                self.persistent.append(prop)
+                self.associations.append(prop)
+        elif isinstance(prop, association):
+            self.persistent.append(prop)
+            self.associations.append(prop)
+        else:
+            self.persistent.append(prop)
+
+
+_propertytables = {}
+
+def propertytable_for(class_):
+    """
+    Return the (cached) propertytable for an Element class.
+    """
+    try:
+        return _propertytables[class_]
+    except KeyError:
+        table = _propertytables[class_] = propertytable(class_)
+        return table
+
+
+_slotnames = {}
+
+def slotnames_for(class_):
+    """
+    Return the (cached) names of the slots of an Element class, except
+    __dict__ and __weakref__.
+    """
+    try:
+        return _slotnames[class_]
+    except KeyError:
+        names = []
+        for c in reversed(class_.__mro__):
+            for name in c.__dict__.get('__slots__', ()):
+                if name not in ('__dict__', '__weakref__') and name not in names:
+                    names.append(name)
+        names = _slotnames[class_] = tuple(names)
+        return names
+
+
+def slotstate(obj):
+    """
+    Return a dict with the values held in the slots of obj.
+    """
+    state = {}
+    for name in slotnames_for(type(obj)):
+        try:
+            state[name] = getattr(obj, name)
+        except AttributeError:
+            pass
+    return state
+
+
+# Elements that are being unlinked
+_unlinking = set()
+
+
+class elementclass(type):
+    """
+    Meta class for Element. Properties are assigned to the model classes
+    after the classes are created (see uml2.py) and association stubs are
+    even added at run time. The cached property tables are dropped once
+    that happens.
+    """
+
+    def __setattr__(self, key, value):
+        if isinstance(value, umlproperty) or \
+                isinstance(self.__dict__.get(key), umlproperty):
+            _propertytables.clear()
+        type.__setattr__(self, key, value)
+
+    def __delattr__(self, key):
+        type.__delattr__(self, key)
+        _propertytables.clear()
 
 
 class Element(object):
     """
     Base class for UML data classes.
+
+    The generated model classes (uml2.py) store their property values in
+    slots. Values without a slot go to the instance __dict__, which Python
+    creates the first time it is needed.
     """
 
+    __metaclass__ = elementclass
+
+    __slots__ = ('_id', '_factory', '__dict__', '__weakref__')
+
     def __init__(self, id=None, factory=None):
         """
         Create an element. As optional parameters an id and factory can be
@@ -28,10 +145,19 @@ class Element(object):
         Factory can be provided to refer to the class that maintains the
         lifecycle of the element.
         """
-        self._id = id or (id is not False and str(uuid.uuid1()) or False)
+        if not id and id is not False:
+            id = str(uuid.uuid1())
+        if isinstance(id, unicode):
+            try:
+                id = str(id)
+            except UnicodeError:
+                pass
+        # Ids are used as keys all over the place
+        if type(id) is str:
+            id = intern(id)
+        self._id = id
         # The factory this element belongs to.
         self._factory = factory
-        self._unlink_lock = threading.Lock()
 
 
     id = property(lambda self: self._id, doc='Id')
@@ -45,20 +171,14 @@ class Element(object):
         """
         Iterate over all UML properties 
         """
-        umlprop = umlproperty
-        class_ = type(self)
-        for propname in dir(class_):
-            if not propname.startswith('_'):
-                prop = getattr(class_, propname)
-                if isinstance(prop, umlprop):
-                    yield prop
+        return iter(propertytable_for(type(self)).all)
 
 
     def save(self, save_func):
         """
         Save the state by calling save_func(name, value).
         """
-        for prop in self.umlproperties():
+        for prop in propertytable_for(type(self)).persistent:
             prop.save(self, save_func)
 
 
@@ -80,30 +200,32 @@ class Element(object):
         """
         Fix up the odds and ends.
         """
-        for prop in self.umlproperties():
+        table = propertytable_for(type(self))
+        for prop in table.associations:
+            prop.postload(self)
+        for prop in table.derived:
             prop.postload(self)
 
 
     def unlink(self):
-        
-        """Unlink the element. All the elements references are destroyed.
-        
-        The unlink lock is acquired while unlinking this elements properties
-        to avoid recursion problems."""
-        
-        if self._unlink_lock.locked():
-            
+        """
+        Unlink the element. All the elements references are destroyed.
+
+        The element is marked while its properties are unlinked, to avoid
+        recursion problems.
+        """
+        if self in _unlinking:
             return
-        
-        with self._unlink_lock:
-            
-            for prop in self.umlproperties():
-                
+
+        _unlinking.add(self)
+        try:
+            for prop in propertytable_for(type(self)).associations:
                 prop.unlink(self)
-                
+
             if self._factory:
-            
                 self._factory._unlink_element(self)
+        finally:
+            _unlinking.discard(self)
 
     # OCL methods: (from SMW by Ivan Porres (http://www.abo.fi/~iporres/smw))
 
@@ -123,16 +245,21 @@ class Element(object):
 
     def __getstate__(self):
         d = dict(self.__dict__)
+        d.update(slotstate(self))
         try:
             del d['_factory']
         except KeyError:
             pass
         return d
 
+    # This __getstate__() saves slots (see gaphor.diagram.DiagramItemMeta)
+    __getstate__.slots = True
+
 
     def __setstate__(self, state):
         self._factory = None
-        self.__dict__.update(state)
+        for name, value in state.iteritems():
+            setattr(self, name, value)
 
 
 try:
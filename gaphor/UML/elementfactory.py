@@ -13,9 +13,11 @@ from gaphor.UML.interfaces import IElementCreateEvent, IElementDeleteEvent, \
                                   IFlushFactoryEvent, IModelFactoryEvent, \
                                   IElementChangeEvent, IElementEvent
 from gaphor.UML.event import ElementCreateEvent, ElementDeleteEvent, \
-                             FlushFactoryEvent, ModelFactoryEvent
+                             FlushFactoryEvent, ModelFactoryEvent, \
+                             ElementClassChangeEvent
 from gaphor.UML.element import Element
 from gaphor.UML.diagram import Diagram
+from gaphor.UML.uml2 import NamedElement
 
 
 class ElementFactory(object):
@@ -30,16 +32,81 @@ class ElementFactory(object):
     model - a new model has been loaded (element is None)
     flush - model is flushed: all element are removed from the factory
             (element is None)
+
+    Elements are indexed by type, so select_type() only visits elements
+    of the requested type. An index by name is created the first time
+    lookup_name() is used, it is kept up to date from then on.
     """
     def __init__(self):
         self._elements = odict.odict()
         self._observers = list()
+        # type: odict(id: element)
+        self._types = odict.odict()
+        # name: [element, ..]
+        self._names = None
+        # Number of elements removed, see collection._select()
+        self._unregistered = 0
+
+    def _register(self, element):
+        """
+        Add an element to the factory and its indexes.
+        """
+        self._elements[element.id] = element
+        try:
+            self._types[type(element)][element.id] = element
+        except KeyError:
+            self._types[type(element)] = odict.odict([(element.id, element)])
+        if self._names is not None and isinstance(element, NamedElement):
+            self._add_name(element, element.name)
+
+    def _unregister(self, element):
+        """
+        Remove an element from the factory and its indexes. Nothing happens
+        if the element is not in the factory.
+        """
+        try:
+            del self._elements[element.id]
+        except KeyError:
+            return
+        self._unregistered += 1
+        elements = self._types[type(element)]
+        del elements[element.id]
+        if not elements:
+            del self._types[type(element)]
+        if self._names is not None and isinstance(element, NamedElement):
+            self._remove_name(element, element.name)
+
+    def _add_name(self, element, name):
+        if name is not None:
+            try:
+                self._names[name].append(element)
+            except KeyError:
+                self._names[name] = [element]
+
+    def _remove_name(self, element, name):
+        if name is not None:
+            elements = self._names[name]
+            elements.remove(element)
+            if not elements:
+                del self._names[name]
+
+    def _update_index(self, event):
+        """
+        Keep the name index up to date. Called for every change event of
+        the elements in the factory, even if events are blocked.
+        """
+        if self._names is not None and event.property is NamedElement.name \
+                and self._elements.get(event.element.id) is event.element:
+            self._remove_name(event.element, event.old_value)
+            self._add_name(event.element, event.new_value)
 
     def create(self, type):
         """
         Create a new model element of type ``type``.
         """
-        obj = self.create_as(type, str(uuid.uuid1()))
+        assert issubclass(type, Element)
+        obj = type(str(uuid.uuid1()), self)
+        self._register(obj)
         return obj
 
     def create_as(self, type, id):
@@ -50,7 +117,9 @@ class ElementFactory(object):
         """
         assert issubclass(type, Element)
         obj = type(id, self)
-        self._elements[id] = obj
+        self._register(obj)
+        # Loaded names do not emit events, the index is rebuilt when needed
+        self._names = None
         return obj
 
     def bind(self, element):
@@ -64,7 +133,7 @@ class ElementFactory(object):
             raise AttributeError, "an element already exists with the same id"
 
         element._factory = self
-        self._elements[element.id] = element
+        self._register(element)
         
 
     def size(self):
@@ -108,6 +177,38 @@ class ElementFactory(object):
         return list(self.select(expression))
 
 
+    def select_type(self, type, expression=None):
+        """
+        Iterate elements of class type, including subclasses, that comply
+        with expression. Elements are grouped by class.
+        """
+        for t, elements in self._types.items():
+            if issubclass(t, type):
+                if expression is None:
+                    for e in elements.values():
+                        yield e
+                else:
+                    for e in elements.values():
+                        if expression(e):
+                            yield e
+
+
+    def lookup_name(self, name, type=NamedElement):
+        """
+        Return a list of the elements of class type, including
+        subclasses, with a specific name.
+
+        The name index is built on the first lookup and kept up to date by
+        change events. Names that are loaded emit no events, so
+        create_as() drops the index.
+        """
+        if self._names is None:
+            self._names = {}
+            for e in self.select_type(NamedElement):
+                self._add_name(e, e.name)
+        return [ e for e in self._names.get(name, ()) if isinstance(e, type) ]
+
+
     def keys(self):
         """
         Return a list with all id's in the factory.
@@ -147,12 +248,14 @@ class ElementFactory(object):
         """Flush all elements (remove them from the factory). 
         
         Diagram elements are flushed first.  This is so that canvas updates
-        are blocked.  The remaining elements are then flushed.
+        are blocked.  Lazily loaded canvas items are not created.  The
+        remaining elements are then flushed.
         """
         
         flush_element = self._flush_element
-        for element in self.lselect(lambda e: isinstance(e, Diagram)):
+        for element in list(self.select_type(Diagram)):
             element.canvas.block_updates = True
+            element.canvas.cancel_load()
             flush_element(element)
                 
         for element in self.lselect():
@@ -165,20 +268,23 @@ class ElementFactory(object):
         """
         NOTE: Invoked from Element.unlink() to perform an element unlink.
         """
-        try:
-            del self._elements[element.id]
-        except KeyError:
-            pass
+        self._unregister(element)
 
     def swap_element(self, element, new_class):
-	assert element in self._elements.values()
-        if element.__class__ is not new_class:
+        assert self._elements.get(element.id) is element
+        old_class = element.__class__
+        if old_class is not new_class:
+            self._unregister(element)
             element.__class__ = new_class
+            self._register(element)
+            self._handle(ElementClassChangeEvent(element, old_class,
+                                                 new_class))
 
     def _handle(self, event):
         """
         Handle events coming from elements.
         """
+        self._update_index(event)
         # Invoke default handler, so properties get updated.
         component.handle(event)
 
@@ -242,6 +348,7 @@ class ElementFactoryService(ElementFactory):
         """
         Handle events coming from elements (used internally).
         """
+        self._update_index(event)
         self.component_registry.handle(event)
 
 
@@ -20,6 +20,22 @@ class AttributeChangeEvent(object):
         self.new_value = new_value
 
 
+class ElementClassChangeEvent(object):
+    """The class of an element has changed."""
+
+    interface.implements(IElementClassChangeEvent)
+
+    def __init__(self, element, old_class, new_class):
+        """Constructor.  The element parameter is the element that changed
+        class.  The old_class and new_class parameters are the classes
+        before and after the change."""
+
+        self.element = element
+        self.property = None
+        self.old_value = old_class
+        self.new_value = new_class
+
+
 class AssociationChangeEvent(object):
     """An association UML element has changed."""
     
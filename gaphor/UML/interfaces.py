@@ -36,6 +36,13 @@ class IAttributeChangeEvent(IElementChangeEvent):
     """
 
 
+class IElementClassChangeEvent(IElementChangeEvent):
+    """
+    The class of an element has changed (see ElementFactory.swap_element()).
+    ``old_value`` and ``new_value`` contain the classes.
+    """
+
+
 class IAssociationChangeEvent(IElementChangeEvent):
     """
     An association hs changed.
@@ -77,8 +77,8 @@ def find_instances(factory, element):
     """
     Find instance specification which extend classifier `element`.
     """
-    return factory.select(lambda e: e.isKindOf(InstanceSpecification) \
-            and e.classifier and e.classifier[0] == element)
+    return factory.select_type(InstanceSpecification,
+            lambda e: e.classifier and e.classifier[0] == element)
 
 
 def remove_stereotype(element, stereotype):
@@ -112,7 +112,7 @@ def get_stereotypes(factory, element):
     names = set(c.__name__ for c in cls.__mro__ if issubclass(c, Element))
 
     # find stereotypes that extend element class
-    classes = factory.select(lambda e: e.isKindOf(Class) and e.name in names)
+    classes = [ c for name in names for c in factory.lookup_name(name, Class) ]
     
     stereotypes = set(ext.ownedEnd.type for cls in classes for ext in cls.extension)
     return sorted(stereotypes, key=lambda st: st.name)
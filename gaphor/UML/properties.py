@@ -246,7 +246,7 @@ class association(umlproperty):
         In the postload step, ensure that bi-directional associations
         are bi-directional.
         """
-        values = self._get(obj)
+        values = getattr(obj, self._name, None)
         if not values:
             return
         if self.upper == 1:
@@ -318,10 +318,9 @@ class association(umlproperty):
             if not c:
                 c = collection(self, obj, self.type)
                 setattr(obj, self._name, c)
-            elif value in c:
+            if not c._add(value):
                 return
 
-            c.items.append(value)
             if do_notify:
                 event = AssociationAddEvent(obj, self, value)
 
@@ -371,17 +370,11 @@ class association(umlproperty):
         else:
             c = self._get(obj)
             if c:
-                items = c.items
-                try:
-                    items.remove(value)
-                except:
-                    pass
-                else:
-                    if do_notify:
-                        event = AssociationDeleteEvent(obj, self, value)
+                if c._remove(value) and do_notify:
+                    event = AssociationDeleteEvent(obj, self, value)
 
                 # Remove items collection if empty
-                if not items:
+                if not c:
                     delattr(obj, self._name)
 
         if do_notify and event:
@@ -458,6 +451,42 @@ class associationstub(umlproperty):
             c.discard(value)
 
 
+class dependencyindex(object):
+    """
+    Index of the derived properties (derived, derivedunion and redefine)
+    that depend on a property.
+
+    One event handler is registered for all derived properties. On change
+    of a property only the derived properties that depend on it are
+    notified, in the order they are created.
+    """
+
+    def __init__(self):
+        self._dependents = {}
+
+    def add(self, prop, dependent):
+        try:
+            self._dependents[prop].append(dependent)
+        except KeyError:
+            self._dependents[prop] = [dependent]
+
+    def get(self, prop):
+        return self._dependents.get(prop, ())
+
+    @component.adapter(IElementChangeEvent)
+    def _element_changed(self, event):
+        try:
+            dependents = self._dependents[event.property]
+        except KeyError:
+            return
+        for d in dependents:
+            d._association_changed(event)
+
+
+dependents = dependencyindex()
+component.provideHandler(dependents._element_changed)
+
+
 class unioncache(object):
     """
     Small cache helper object for derivedunions.
@@ -477,6 +506,13 @@ class derived(umlproperty):
     -Delete- and Set events, this gives just an assumption that something
     may have changed. If something actually changed depends on the filter
     applied to the derived property.
+
+    The value is cached per element. On change of one of the subsets only
+    the cache of the changed element is invalidated. If the subset is a
+    property of a related element (e.g. Property.type for
+    Association.endType), the elements on the opposite end of the
+    association subset are invalidated. If those can not be found, the
+    caches of all elements are invalidated (by bumping ``version``).
     """
 
     def __init__(self, name, type, lower, upper, *subsets):
@@ -489,7 +525,8 @@ class derived(umlproperty):
         self.subsets = set(subsets)
         self.single = len(subsets) == 1
 
-        component.provideHandler(self._association_changed)
+        for s in self.subsets:
+            dependents.add(s, self)
 
 
     def load(self, obj, value):
@@ -497,7 +534,7 @@ class derived(umlproperty):
 
 
     def postload(self, obj):
-        self.version += 1
+        self._invalidate_element(obj)
 
     def save(self, obj, save_func):
         pass
@@ -543,6 +580,50 @@ class derived(umlproperty):
         return uc.data
 
 
+    def _invalidate_element(self, obj):
+        """
+        Drop the cached value for element ``obj``.
+        """
+        if isinstance(getattr(obj, self._name, None), unioncache):
+            delattr(obj, self._name)
+
+    def _holds(self, obj):
+        """
+        Return True if ``obj`` has this derived property (maybe through
+        a redefine).
+        """
+        prop = getattr(type(obj), self.name, None)
+        while isinstance(prop, redefine):
+            prop = prop.original
+        return prop is self
+
+    def _invalidate(self, event):
+        """
+        Invalidate the cached values that may have been affected by
+        ``event``.
+        """
+        obj = event.element
+        self._invalidate_element(obj)
+        if self._holds(obj):
+            return
+
+        # The subset is a property of a related element: find the elements
+        # holding this property through the opposite end of the subsets.
+        found = False
+        for s in self.subsets:
+            if s is not event.property and isinstance(s, association) \
+                    and s.opposite and isinstance(obj, s.type):
+                found = True
+                owners = getattr(obj, s.opposite, None)
+                if owners is None:
+                    continue
+                if not isinstance(owners, collection):
+                    owners = (owners,)
+                for owner in owners:
+                    self._invalidate_element(owner)
+        if not found:
+            self.version += 1
+
     def _set(self, obj, value):
         raise AttributeError, 'Can not set values on a union'
 
@@ -550,7 +631,6 @@ class derived(umlproperty):
     def _del(self, obj, value=None):
         raise AttributeError, 'Can not delete values on a union'
 
-    @component.adapter(IElementChangeEvent)
     def _association_changed(self, event):
         """
         Re-emit state change for the derived properties as Derived*Event's.
@@ -566,7 +646,7 @@ class derived(umlproperty):
         """
         if event.property in self.subsets:
             # Make sure unions are created again
-            self.version += 1
+            self._invalidate(event)
             
             if not IAssociationChangeEvent.providedBy(event):
                 return
@@ -619,6 +699,9 @@ class derivedunion(derived):
             for s in self.subsets:
                 if s is exclude:
                     continue
+                if isinstance(s, association) and not hasattr(obj, s._name):
+                    # Do not create empty collections on obj
+                    continue
                 tmp = s.__get__(obj)
                 if tmp:
                     try:
@@ -631,7 +714,6 @@ class derivedunion(derived):
     # Filter is our default filter
     filter = _union
     
-    @component.adapter(IElementChangeEvent)
     def _association_changed(self, event):
         """
         Re-emit state change for the derived union (as Derived*Event's).
@@ -647,7 +729,7 @@ class derivedunion(derived):
         """
         if event.property in self.subsets:
             # Make sure unions are created again
-            self.version += 1
+            self._invalidate(event)
             
             if not IAssociationChangeEvent.providedBy(event):
                 return
@@ -712,7 +794,7 @@ class redefine(umlproperty):
         self.type = type
         self.original = original
 
-        component.provideHandler(self._association_changed)
+        dependents.add(original, self)
 
     upper = property(lambda s: s.original.upper)
     lower = property(lambda s: s.original.lower)
@@ -773,9 +855,9 @@ class redefine(umlproperty):
         return self.original._del(obj, value, from_opposite)
 
 
-    @component.adapter(IAssociationChangeEvent)
     def _association_changed(self, event):
-        if event.property is self.original and isinstance(event.element, self.decl_class):
+        if IAssociationChangeEvent.providedBy(event) and \
+                isinstance(event.element, self.decl_class):
             # mimic the events for Set/Add/Delete
             if IAssociationSetEvent.providedBy(event):
                 self.handle(RedefineSetEvent(event.element, self, event.old_value, event.new_value))
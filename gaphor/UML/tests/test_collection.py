@@ -3,6 +3,7 @@ Test if the collection's list supports all trickery.
 """
 
 import unittest
+from gaphor import UML
 from gaphor.UML.collection import collectionlist
 
 class CollectionlistTestCase(unittest.TestCase):
@@ -14,4 +15,86 @@ class CollectionlistTestCase(unittest.TestCase):
         c.append('c')
         assert str(c) == "['a', 'b', 'c']"
 
+
+class CollectionTestCase(unittest.TestCase):
+
+    def test_index_and_remove(self):
+        p = UML.Package()
+        classes = [UML.Class() for i in range(5)]
+        for c in classes:
+            c.package = p
+        members = p.ownedClassifier
+        assert list(members) == classes
+        assert [members.index(c) for c in classes] == range(5)
+
+        del classes.pop(3).package
+        del classes.pop(1).package
+        assert list(members) == classes
+        assert [members.index(c) for c in classes] == range(3)
+        assert members.includes(classes[2])
+        self.assertRaises(ValueError, members.index, UML.Class())
+
+        extra = UML.Class()
+        extra.package = p
+        assert members.index(extra) == 3
+        assert members.swap(classes[0], extra)
+        assert members.index(extra) == 0
+        assert members.index(classes[0]) == 3
+
+    def test_add_twice(self):
+        p = UML.Package()
+        c = UML.Class()
+        c.package = p
+        p.ownedClassifier = c
+        assert list(p.ownedClassifier) == [c]
+        assert p.ownedClassifier.count(c) == 1
+
+        del c.package
+        assert c not in p.ownedClassifier
+        assert not p.ownedClassifier
+
+    def test_query_name(self):
+        factory = UML.ElementFactory()
+        p = factory.create(UML.Package)
+        classes = []
+        for name in ('a', 'b', 'a', 'c'):
+            c = factory.create(UML.Class)
+            c.name = name
+            c.package = p
+            classes.append(c)
+        other = factory.create(UML.Class)
+        other.name = 'a'
+
+        members = p.ownedClassifier
+        self.assertEquals([classes[0], classes[2]], members['it.name=="a"'])
+        self.assertEquals(classes[2], members['it.name=="a"', 1])
+        self.assertEquals([], members['it.name=="x"'])
+
+        classes[2].name = 'x'
+        members.swap(classes[0], classes[3])
+        self.assertEquals([classes[2]], members['it.name=="x"'])
+        self.assertEquals([classes[0]], members['it.name=="a"'])
+        self.assertEquals([classes[3], classes[0]],
+                          members['it.name=="a" or it.name=="c"'])
+
+        # Names set while loading do not emit events
+        c = factory.create_as(UML.Class, 'loaded')
+        UML.Class.name.load(c, 'a')
+        c.package = p
+        self.assertEquals([classes[0], c], members['it.name=="a"'])
+
+    def test_query_name_unbound(self):
+        factory = UML.ElementFactory()
+        c = factory.create(UML.Class)
+        bound = factory.create(UML.Operation)
+        bound.name = 'foo'
+        c.ownedOperation = bound
+        self.assertEquals([bound], c.ownedOperation['it.name=="foo"'])
+
+        o = UML.Operation()
+        o.name = 'foo'
+        c.ownedOperation = o
+        self.assertEquals([bound, o], c.ownedOperation['it.name=="foo"'])
+        self.assertEquals([], c.ownedOperation['it.name=="bar"'])
+
 # vim:sw=4:et:ai
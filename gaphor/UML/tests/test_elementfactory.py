@@ -72,6 +72,53 @@ class ElementFactoryTestCase(unittest.TestCase):
         assert len(ef.values()) == 0, ef.values()
 
 
+    def testSelectType(self):
+        ef = self.factory
+        c = ef.create(Class)
+        s = ef.create(Stereotype)
+        p = ef.create(Package)
+
+        assert list(ef.select_type(Class)) == [c, s], list(ef.select_type(Class))
+        assert list(ef.select_type(Stereotype)) == [s]
+        assert list(ef.select_type(Namespace)) == [c, s, p]
+        assert list(ef.select_type(Class, lambda e: e is not c)) == [s]
+        assert list(ef.select_type(Diagram)) == []
+
+        s.unlink()
+        assert list(ef.select_type(Class)) == [c]
+        assert list(ef.select_type(Stereotype)) == []
+
+        ef.swap_element(c, Stereotype)
+        assert list(ef.select_type(Stereotype)) == [c]
+
+        ef.flush()
+        assert list(ef.select_type(Element)) == []
+
+
+    def testLookupName(self):
+        ef = self.factory
+        c = ef.create(Class)
+        c.name = 'Foo'
+        a = ef.create(Property)
+        a.name = 'Foo'
+
+        assert ef.lookup_name('Foo') == [c, a], ef.lookup_name('Foo')
+        assert ef.lookup_name('Foo', Class) == [c]
+        assert ef.lookup_name('Bar') == []
+
+        # The index is maintained from now on
+        c.name = 'Bar'
+        assert ef.lookup_name('Foo') == [a]
+        assert ef.lookup_name('Bar') == [c]
+
+        p = ef.create(Package)
+        p.name = 'Bar'
+        del c.name
+        assert ef.lookup_name('Bar') == [p]
+
+        a.unlink()
+        assert ef.lookup_name('Foo') == []
+
 
 
 from zope import component
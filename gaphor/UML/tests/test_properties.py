@@ -374,6 +374,37 @@ class PropertiesTestCase(unittest.TestCase):
         del a.a
         assert a.a == 'one'
 
+    def test_umlproperties(self):
+        class A(Element): pass
+        class B(A): pass
+
+        A.name = attribute('name', str, 'default')
+        A.a = association('a', A)
+        A.u = derivedunion('u', A, 0, '*', A.a)
+
+        def own_properties(e):
+            return [p for p in e.umlproperties()
+                    if p in (A.a, A.name, A.u, getattr(B, 'b', None))]
+
+        b = B()
+        assert own_properties(b) == [A.a, A.name, A.u]
+
+        # Properties added later are picked up
+        B.b = association('b', A, 0, 1)
+        assert own_properties(b) == [A.a, B.b, A.name, A.u]
+
+        b.name = 'b'
+        b.b = A()
+        saved = []
+        b.save(lambda name, value: saved.append(name))
+        assert saved == ['b', 'name'], saved
+
+        # A stub is created for the uni-directional association and is
+        # used on unlink
+        a = b.b
+        a.unlink()
+        assert b.b is None
+
     def skiptest_notify(self):
         import types
         class A(Element):
@@ -426,6 +457,37 @@ class PropertiesTestCase(unittest.TestCase):
         assert c in a.u
         assert d in a.u
 
+    def test_derivedunion_dependents(self):
+        from gaphor.UML.properties import dependents
+        from gaphor.UML.event import AssociationAddEvent, DerivedAddEvent, \
+                                     RedefineAddEvent
+        class A(Element): pass
+        class B(A): pass
+
+        A.a = association('a', A)
+        A.b = association('b', A)
+        A.u = derivedunion('u', A, 0, '*', A.a, A.b)
+        B.r = redefine(B, 'r', A, A.a)
+
+        assert list(dependents.get(A.a)) == [A.u, B.r]
+        assert list(dependents.get(A.b)) == [A.u]
+        assert list(dependents.get(A.u)) == []
+
+        events = []
+        @component.adapter(IAssociationChangeEvent)
+        def handler(event):
+            events.append(event)
+
+        component.provideHandler(handler)
+        try:
+            b = B()
+            b.a = A()
+        finally:
+            component.getGlobalSiteManager().unregisterHandler(handler)
+
+        assert [type(e) for e in events if e.element is b] == \
+                [DerivedAddEvent, RedefineAddEvent, AssociationAddEvent], events
+
     def skiptest_deriveduntion_notify(self):
         class A(Element): pass
         class E(Element):
@@ -248,6 +248,38 @@ class Uml2TestCase(unittest.TestCase):
         p = factory.create_as(UML.Class, id=False)
         assert p.id is False, p.id
 
+        c = factory.create_as(UML.Class, id=u'DCE:0000')
+        assert type(c.id) is str
+        assert c.id is intern('DCE:0000')
+
+
+    def test_slots(self):
+        c = UML.Class()
+        c.name = 'Class'
+        c.ownedOperation = UML.Operation()
+        c.isAbstract = True
+        assert c.__dict__ == {}, c.__dict__
+
+        # Values that have no slot are kept in the instance dict
+        c.tmp = 1
+        assert c.__dict__ == { 'tmp': 1 }, c.__dict__
+
+
+    def test_pickle(self):
+        import pickle
+        factory = UML.ElementFactory()
+        c = factory.create(UML.Class)
+        c.name = 'Class'
+        o = factory.create(UML.Operation)
+        c.ownedOperation = o
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copy = pickle.loads(pickle.dumps(c, protocol))
+            assert copy.id == c.id
+            assert copy.factory is None
+            self.assertEquals('Class', copy.name)
+            assert copy.ownedOperation[0].id == o.id
+            assert copy.ownedOperation[0].class_ is copy
+
 
     def test1(self):
         factory = UML.ElementFactory()
@@ -319,6 +351,26 @@ class Uml2TestCase(unittest.TestCase):
 
         assert c1 in a.endType
         assert c3 in a.endType
+        assert c2 not in a.endType
+
+
+    def test_multiplicity_cache(self):
+        """
+        Changing lowerValue of one property does not invalidate the cached
+        lower value of other properties.
+        """
+        p1 = UML.Property()
+        p2 = UML.Property()
+        p1.lowerValue = '1'
+        p2.lowerValue = '2'
+        assert p1.lower == '1'
+        assert p2.lower == '2'
+        cache = p2._lower
+
+        p1.lowerValue = '3'
+        assert p1.lower == '3'
+        assert p2.lower == '2'
+        assert p2._lower is cache
 
 
 
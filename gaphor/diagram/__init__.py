@@ -8,6 +8,7 @@ import inspect
 import gobject
 import uuid
 
+from gaphor.UML.element import elementclass, slotnames_for, slotstate
 from gaphor.diagram.style import Style
 
 # Map UML elements to their (default) representation.
@@ -49,21 +50,24 @@ def uml(uml_class, stereotype=None):
 
 
 
-class DiagramItemMeta(type):
+class DiagramItemMeta(elementclass):
     """
-    Initialize a new diagram item.
+    Initialize a new diagram item (diagram items are UML.Presentation's,
+    hence the Element meta class).
     1. Register UML.Elements by means of the __uml__ attribute (see
        map_uml_class method).
     2. Set items style information.
+    3. Pickle the values held in slots (see pickle_slots method).
 
     @ivar style: style information
     """
 
     def __init__(self, name, bases, data):
-        type.__init__(self, name, bases, data)
+        elementclass.__init__(self, name, bases, data)
 
         self.map_uml_class(data)
         self.set_style(data)
+        self.pickle_slots()
 
 
     def map_uml_class(self, data):
@@ -105,4 +109,35 @@ class DiagramItemMeta(type):
         self.style = style
 
 
+    def pickle_slots(self):
+        """
+        The __getstate__() and __setstate__() methods of gaphas items only
+        deal with the instance dict. Wrap them, so the values held in the
+        slots of UML.Element are pickled as well.
+        """
+        getstate = self.__getstate__.im_func
+        setstate = self.__setstate__.im_func
+        if getattr(getstate, 'slots', False):
+            # Element's own method, or wrapped already
+            return
+
+        def __getstate__(item):
+            state = getstate(item)
+            state.update(slotstate(item))
+            state.pop('_factory', None)
+            return state
+
+        def __setstate__(item, state):
+            state = dict(state)
+            item._factory = None
+            for name in slotnames_for(type(item)):
+                if name in state:
+                    setattr(item, name, state.pop(name))
+            setstate(item, state)
+
+        __getstate__.slots = True
+        self.__getstate__ = __getstate__
+        self.__setstate__ = __setstate__
+
+
 # vim:sw=4:et
@@ -12,7 +12,7 @@ Plan:
 # tail end and visa versa.
 
 from gaphor.diagram.textelement import text_extents, text_multiline
-from gaphas.state import reversible_property
+from gaphas.state import observed, reversible_property
 from gaphas import Item
 from gaphas.geometry import Rectangle, distance_point_point_fast
 from gaphas.geometry import distance_rectangle_point, distance_line_point
@@ -60,6 +60,7 @@ class AssociationItem(NamedLine):
             .watch('subject<Association>.ownedEnd') \
             .watch('subject<Association>.navigableOwnedEnd')
 
+    @observed
     def set_show_direction(self, dir):
         self._show_direction = dir
         self.request_update()
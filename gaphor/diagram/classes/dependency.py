@@ -15,6 +15,8 @@ Function dependency_type in model factory should be used to determine
 type of a dependency in automatic way.
 """
 
+from gaphas.state import observed, reversible_property
+
 from gaphor import UML
 from gaphor.diagram.diagramline import DiagramLine
 
@@ -46,7 +48,7 @@ class DependencyItem(DiagramLine):
         DiagramLine.__init__(self, id)
 
         self._dependency_type = UML.Dependency
-        self.auto_dependency = True
+        self._auto_dependency = True
         self._solid = False
 
 
@@ -71,6 +73,14 @@ class DependencyItem(DiagramLine):
             DiagramLine.postload(self)
 
 
+    @observed
+    def _set_auto_dependency(self, auto_dependency):
+        self._auto_dependency = auto_dependency
+
+    auto_dependency = reversible_property(lambda s: s._auto_dependency,
+                                          _set_auto_dependency)
+
+
     def set_dependency_type(self, dependency_type):
         self._dependency_type = dependency_type
 
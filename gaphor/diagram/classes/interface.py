@@ -193,6 +193,7 @@ class InterfaceItem(ClassItem):
         self.watch('subject<Interface>.ownedAttribute', self.on_class_owned_attribute) \
             .watch('subject<Interface>.ownedOperation', self.on_class_owned_operation) \
             .watch('subject<Interface>.supplierDependency')
+        self.watch_features('Interface')
 
 
     @observed
@@ -20,6 +20,13 @@ class OperationItem(FeatureItem):
                           type=True,\
                           multiplicity=True,\
                           default=True) or ''
+
+    def shows(self, element):
+        """The operation is rendered with its parameters."""
+
+        subject = self.subject
+        return element is subject or element in subject.formalParameter \
+                or element in subject.returnResult
         
 class ClassItem(ClassifierItem):
     """This item visualizes a Class instance.
@@ -42,6 +49,34 @@ class ClassItem(ClassifierItem):
         'abstract-feature-font': 'sans italic 10',
     }
 
+    # Feature paths, relative to the owning classifier, that change the
+    # rendered text of its feature items
+    FEATURE_WATCHES = (
+        ('ownedAttribute.name', 'on_feature_change'),
+        ('ownedAttribute.isStatic', 'on_feature_change'),
+        ('ownedAttribute.isDerived', 'on_feature_change'),
+        ('ownedAttribute.visibility', 'on_feature_change'),
+        ('ownedAttribute.lowerValue', 'on_feature_change'),
+        ('ownedAttribute.upperValue', 'on_feature_change'),
+        ('ownedAttribute.defaultValue', 'on_feature_change'),
+        ('ownedAttribute.typeValue', 'on_feature_change'),
+        ('ownedOperation.name', 'on_feature_change'),
+        ('ownedOperation.isAbstract', 'on_operation_is_abstract'),
+        ('ownedOperation.isStatic', 'on_feature_change'),
+        ('ownedOperation.visibility', 'on_feature_change'),
+        ('ownedOperation.returnResult', 'on_feature_change'),
+        ('ownedOperation.returnResult.lowerValue', 'on_feature_change'),
+        ('ownedOperation.returnResult.upperValue', 'on_feature_change'),
+        ('ownedOperation.returnResult.typeValue', 'on_feature_change'),
+        ('ownedOperation.formalParameter', 'on_feature_change'),
+        ('ownedOperation.formalParameter.name', 'on_feature_change'),
+        ('ownedOperation.formalParameter.direction', 'on_feature_change'),
+        ('ownedOperation.formalParameter.lowerValue', 'on_feature_change'),
+        ('ownedOperation.formalParameter.upperValue', 'on_feature_change'),
+        ('ownedOperation.formalParameter.typeValue', 'on_feature_change'),
+        ('ownedOperation.formalParameter.defaultValue', 'on_feature_change'),
+    )
+
     def __init__(self, id=None):
         """Constructor.  Initialize the ClassItem.  This will also call the
         ClassifierItem constructor.
@@ -58,26 +93,17 @@ class ClassItem(ClassifierItem):
         self._operations.use_extra_space = True
 
         self.watch('subject<Class>.ownedOperation', self.on_class_owned_operation)\
-            .watch('subject<Class>.ownedAttribute.association', self.on_class_owned_attribute) \
-            .watch('subject<Class>.ownedAttribute.name') \
-            .watch('subject<Class>.ownedAttribute.isStatic') \
-            .watch('subject<Class>.ownedAttribute.isDerived') \
-            .watch('subject<Class>.ownedAttribute.visibility') \
-            .watch('subject<Class>.ownedAttribute.lowerValue') \
-            .watch('subject<Class>.ownedAttribute.upperValue') \
-            .watch('subject<Class>.ownedAttribute.defaultValue') \
-            .watch('subject<Class>.ownedAttribute.typeValue') \
-            .watch('subject<Class>.ownedOperation.name') \
-            .watch('subject<Class>.ownedOperation.isAbstract', self.on_operation_is_abstract) \
-            .watch('subject<Class>.ownedOperation.isStatic') \
-            .watch('subject<Class>.ownedOperation.visibility') \
-            .watch('subject<Class>.ownedOperation.returnResult.lowerValue') \
-            .watch('subject<Class>.ownedOperation.returnResult.upperValue') \
-            .watch('subject<Class>.ownedOperation.returnResult.typeValue') \
-            .watch('subject<Class>.ownedOperation.formalParameter.lowerValue') \
-            .watch('subject<Class>.ownedOperation.formalParameter.upperValue') \
-            .watch('subject<Class>.ownedOperation.formalParameter.typeValue') \
-            .watch('subject<Class>.ownedOperation.formalParameter.defaultValue')
+            .watch('subject<Class>.ownedAttribute.association', self.on_class_owned_attribute)
+        self.watch_features('Class')
+
+    def watch_features(self, subject_type):
+        """Watch the features of a subject of type @subject_type (a type
+        name, as used in a watch path), so the cached text of the feature
+        items is dropped when the features change."""
+
+        for path, handler in self.FEATURE_WATCHES:
+            self.watch('subject<%s>.%s' % (subject_type, path),
+                       getattr(self, handler))
 
     def save(self, save_func):
         """Store the show- properties *before* the width/height properties,
@@ -2,6 +2,7 @@
 from gaphor.tests.testcase import TestCase
 from gaphor import UML
 from gaphor.diagram.classes.klass import ClassItem
+from gaphor.diagram.classes.interface import InterfaceItem
 from gaphor.diagram.compartment import FeatureItem
 from gaphor.UML.diagram import DiagramCanvas
 
@@ -37,5 +38,58 @@ class FeatureTestCase(TestCase):
         self.assertTrue(size < item.get_size())
 
 
+    def testRenderCache(self):
+        """
+        Test features are only rendered again after a change
+        """
+        oper = self.element_factory.create(UML.Operation)
+        UML.parse(oper, '+method(a: int): bool')
+
+        clazzitem = self.create(ClassItem, UML.Class)
+        clazzitem.subject.ownedOperation = oper
+        self.diagram.canvas.update()
+
+        item = clazzitem._compartments[1][0]
+        self.assertEquals('+ method(a: int): bool', item.get_text())
+
+        rendered = []
+        render = item.render
+        def counting_render():
+            rendered.append(item.subject)
+            return render()
+        item.render = counting_render
+
+        clazzitem.request_update()
+        self.diagram.canvas.update()
+        self.assertEquals([], rendered)
+
+        oper.formalParameter[0].name = 'b'
+        self.diagram.canvas.update()
+        self.assertEquals([oper], rendered)
+        self.assertEquals('+ method(b: int): bool', item.get_text())
+
+        UML.parse(oper, '+method(a: int, c: str)')
+        self.diagram.canvas.update()
+        self.assertEquals('+ method(a: int, c: str)', item.get_text())
+
+    def testInterfaceRenderCache(self):
+        """
+        Test features of an interface are rendered again after a change
+        """
+        attr = self.element_factory.create(UML.Property)
+        UML.parse(attr, '+a')
+
+        ifaceitem = self.create(InterfaceItem, UML.Interface)
+        ifaceitem.subject.ownedAttribute = attr
+        self.diagram.canvas.update()
+
+        item = ifaceitem._compartments[0][0]
+        self.assertEquals('+ a', item.get_text())
+
+        attr.name = 'b'
+        self.diagram.canvas.update()
+        self.assertEquals('+ b', item.get_text())
+
+
 
 # vim:sw=4:et:ai
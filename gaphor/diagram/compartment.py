@@ -2,13 +2,13 @@
 Diagram item with compartments.
 """
 
-import cairo, pango, pangocairo
+import cairo
 from gaphas.state import observed, reversible_property
 
 from gaphor import UML
 from gaphor.diagram.diagramitem import DiagramItem
 from gaphor.diagram.nameditem import NamedItem
-from textelement import text_extents, text_align
+from textelement import text_extents, text_align, text_cache, show_layout
 
 
 class FeatureItem(object):
@@ -17,6 +17,9 @@ class FeatureItem(object):
     as methods and attributes. Those items can have comments attached, but only
     on the left and right side.
     Note that features can also be used inside objects.
+
+    The rendered text is cached. The owner of a feature item should call
+    invalidate() once the subject changes.
     """
 
     def __init__(self, pattern='%s', order=0):
@@ -28,6 +31,8 @@ class FeatureItem(object):
         self.subject = None
         self.order = order
         self.pattern = pattern
+        # (subject, rendered text)
+        self._rendered = (None, None)
 
 
     def save(self, save_func):
@@ -49,7 +54,28 @@ class FeatureItem(object):
 
 
     def get_text(self):
-        return ''
+        """
+        Return the rendered feature, from cache if possible.
+        """
+        subject, text = self._rendered
+        if text is None or subject is not self.subject:
+            text = self.render()
+            self._rendered = (self.subject, text)
+        return text
+
+
+    def invalidate(self):
+        """
+        Drop the cached text, it's rendered again on the next update.
+        """
+        self._rendered = (None, None)
+
+
+    def shows(self, element):
+        """
+        Return True if the rendered text depends on (a property of) element.
+        """
+        return element is self.subject
 
 
     def update_size(self, text, context):
@@ -61,7 +87,7 @@ class FeatureItem(object):
 
 
     def pre_update(self, context):
-        self.update_size(self.render(), context)
+        self.update_size(self.get_text(), context)
 
 
     def point(self, pos):
@@ -78,17 +104,10 @@ class FeatureItem(object):
     def draw(self, context):
         cr = context.cairo
         if isinstance(cr, cairo.Context):
-            cr = pangocairo.CairoContext(cr)
-            layout = cr.create_layout()
-            layout.set_font_description(pango.FontDescription(self.font))
-            layout.set_text(self.render() or '')
-        
-            if hasattr(self.subject, 'isStatic') and self.subject.isStatic:
-                attrlist = pango.AttrList()
-                attrlist.insert(pango.AttrUnderline(pango.UNDERLINE_SINGLE,
-                                2, -1))
-                layout.set_attributes(attrlist)
-            cr.show_layout(layout)
+            underline = bool(getattr(self.subject, 'isStatic', False))
+            layout = text_cache.layout(cr, self.get_text(), self.font,
+                                       underline=underline)
+            show_layout(cr, layout)
 
 
 class Compartment(list):
@@ -264,8 +283,8 @@ class CompartmentItem(NamedItem):
         self._drawing_style = CompartmentItem.DRAW_NONE
         self.watch('subject.appliedStereotype', self.on_stereotype_change) \
             .watch('subject.appliedStereotype.slot', self.on_stereotype_attr_change) \
-            .watch('subject.appliedStereotype.slot.definingFeature.name') \
-            .watch('subject.appliedStereotype.slot.value')
+            .watch('subject.appliedStereotype.slot.definingFeature.name', self.on_stereotype_slot_change) \
+            .watch('subject.appliedStereotype.slot.value', self.on_stereotype_slot_change)
         self._extra_space = 0
 
 
@@ -299,6 +318,31 @@ class CompartmentItem(NamedItem):
             self.request_update()
 
 
+    def on_stereotype_slot_change(self, event):
+        """
+        A slot value or name changed, render the stereotype attributes
+        again.
+        """
+        for comp in self._compartments:
+            if isinstance(comp.id, UML.InstanceSpecification):
+                for f in comp:
+                    f.invalidate()
+        self.request_update()
+
+
+    def on_feature_change(self, event):
+        """
+        A feature shown in one of the compartments changed. Render it
+        again.
+        """
+        element = event and event.element
+        for comp in self._compartments:
+            for f in comp:
+                if f.shows(element):
+                    f.invalidate()
+        self.request_update()
+
+
     def _create_stereotype_compartment(self, obj):
         st = obj.classifier[0].name
         c = Compartment(st, self, obj)
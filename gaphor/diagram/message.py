@@ -49,6 +49,7 @@ See also ``lifeline`` module documentation.
 from math import pi
 
 from gaphas.util import path_ellipse
+from gaphas.state import observed
 
 from gaphor import UML
 from gaphor.diagram.diagramline import NamedLine
@@ -286,6 +287,7 @@ class MessageItem(NamedLine):
                 or c2 and not c2.connected.lifetime.visible
 
 
+    @observed
     def add_message(self, message, inverted):
         """
         Add message onto communication diagram.
@@ -311,6 +313,7 @@ class MessageItem(NamedLine):
         self.request_update()
 
 
+    @observed
     def remove_message(self, message, inverted):
         """
         Remove message from communication diagram.
@@ -337,6 +340,7 @@ class MessageItem(NamedLine):
         self.request_update()
 
 
+    @observed
     def swap_messages(self, m1, m2, inverted):
         """
         Swap order of two messages on communication diagram.
@@ -37,6 +37,11 @@ class StateItem(CompartmentItem, VertexItem):
         self._exit = FeatureItem(pattern='exit / %s', order=2)
         self._do_activity = FeatureItem(pattern='do / %s', order=3)
 
+        # Renaming an activity, e.g. by undo, changes the text shown
+        self.watch('subject<State>.entry.name', self.on_feature_change) \
+            .watch('subject<State>.exit.name', self.on_feature_change) \
+            .watch('subject<State>.doActivity.name', self.on_feature_change)
+
 
     def _set_activity(self, act, attr, text):
         if text and act not in self._activities:
@@ -50,6 +55,7 @@ class StateItem(CompartmentItem, VertexItem):
 
         elif text and act in self._activities:
             act.subject.name = text
+            act.invalidate()
         elif not text and act in self._activities:
             self._activities.remove(act)
             act.subject.unlink()
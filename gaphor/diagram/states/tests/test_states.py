@@ -55,3 +55,21 @@ class StateTestCase(TestCase):
         self.assertFalse(s2._exit in s2._activities)
         self.assertTrue(s2._do_activity in s2._activities)
 
+
+
+    def test_activity_rename(self):
+        """Test activity text is rendered again when an activity is renamed
+        """
+        s = self.create(StateItem, UML.State)
+        s.set_entry('entry')
+        s.set_exit('exit')
+        s.set_do_activity('do')
+        self.assertEquals('entry / entry', s._entry.get_text())
+
+        # As done by undo: the name is changed directly
+        s.subject.entry.name = 'entry 2'
+        s.subject.exit.name = 'exit 2'
+        s.subject.doActivity.name = 'do 2'
+        self.assertEquals('entry / entry 2', s._entry.get_text())
+        self.assertEquals('exit / exit 2', s._exit.get_text())
+        self.assertEquals('do / do 2', s._do_activity.get_text())
@@ -0,0 +1,45 @@
+"""
+Test the text layout cache.
+"""
+
+import unittest
+import cairo
+from gaphor.diagram.textelement import TextCache
+
+
+class TextCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 10, 10)
+        self.cr = cairo.Context(surface)
+        self.cache = TextCache(layouts=2, extents=2)
+
+    def test_layout(self):
+        cache, cr = self.cache, self.cr
+        layout = cache.layout(cr, 'foo', 'sans 10')
+        assert cache.layout(cr, 'foo', 'sans 10') is layout
+        assert cache.layout(cr, 'foo', 'sans 12') is not layout
+        assert cache.layout(cr, 'foo', 'sans 10', underline=True) is not layout
+
+        # The least recently used layout has been dropped
+        assert cache.layout(cr, 'foo', 'sans 10') is not layout
+
+    def test_extents(self):
+        cache, cr = self.cache, self.cr
+        w, h = cache.extents(cr, 'foo', 'sans 10')
+        assert w > 0 and h > 0, (w, h)
+        assert cache.extents(cr, 'foo foo', 'sans 10')[0] > w
+        assert cache.extents(cr, 'foo', 'sans 10') == (w, h)
+        assert cache.extents(cr, 'foo\nfoo', 'sans 10')[1] > h
+
+    def test_clear(self):
+        cache, cr = self.cache, self.cr
+        layout = cache.layout(cr, 'foo', 'sans 10')
+        fd = cache.font_description('sans 10')
+        assert cache.font_description('sans 10') is fd
+        cache.clear()
+        assert cache.layout(cr, 'foo', 'sans 10') is not layout
+        assert cache.font_description('sans 10') is not fd
+
+
+# vim:sw=4:et:ai
@@ -6,6 +6,7 @@ item, guard of flow item, etc.
 import math
 
 import cairo, pango, pangocairo
+from gaphor.misc.lru import LRUCache
 from gaphor.diagram.style import Style
 from gaphor.diagram.style import ALIGN_CENTER, ALIGN_TOP
 
@@ -25,22 +26,83 @@ def swap(list, el1, el2):
     list[i2] = el1
 
 
-def _text_layout(cr, text, font, width):
+class TextCache(object):
+    """
+    Cache of Pango layouts and text extents, shared by all diagram items.
+
+    Layouts and extents are keyed on (text, font, width), the least
+    recently used ones are dropped. Font descriptions are parsed once.
+    Call clear() when the font configuration changes.
+    """
+
+    def __init__(self, layouts=500, extents=5000):
+        self._fonts = {}
+        self._layouts = LRUCache(layouts)
+        self._extents = LRUCache(extents)
+
+    def clear(self):
+        self._fonts.clear()
+        self._layouts.clear()
+        self._extents.clear()
+
+    def font_description(self, font):
+        try:
+            return self._fonts[font]
+        except KeyError:
+            fd = self._fonts[font] = pango.FontDescription(font)
+            return fd
+
+    def layout(self, cr, text, font=None, width=-1, underline=False):
+        """
+        Return a layout for text. The layout is shared, it should not be
+        modified. Update it for the cairo context before it's shown.
+        """
+        key = (text, font, width, underline)
+        try:
+            return self._layouts[key]
+        except KeyError:
+            layout = pangocairo.CairoContext(cr).create_layout()
+            if font:
+                layout.set_font_description(self.font_description(font))
+            layout.set_text(text)
+            layout.set_width(int(width * pango.SCALE))
+            if underline:
+                attrlist = pango.AttrList()
+                attrlist.insert(pango.AttrUnderline(pango.UNDERLINE_SINGLE,
+                                2, -1))
+                layout.set_attributes(attrlist)
+            self._layouts[key] = layout
+            return layout
+
+    def extents(self, cr, text, font=None, width=-1):
+        """
+        Return the size of text in pixels.
+        """
+        key = (text, font, width)
+        try:
+            return self._extents[key]
+        except KeyError:
+            extents = self._extents[key] = \
+                    self.layout(cr, text, font, width).get_pixel_size()
+            return extents
+
+
+text_cache = TextCache()
+
+
+def show_layout(cr, layout):
+    """
+    Show a (cached) layout at the current point of cairo context cr.
+    """
     cr = pangocairo.CairoContext(cr)
-    layout = cr.create_layout()
-    if font:
-        layout.set_font_description(pango.FontDescription(font))
-    layout.set_text(text)
-    layout.set_width(int(width * pango.SCALE))
-    #layout.set_height(height)
-    return layout
+    cr.update_layout(layout)
+    cr.show_layout(layout)
 
 
 def text_extents(cr, text, font=None, width=-1, height=-1):
     if not text:
         return 0, 0
-    layout = _text_layout(cr, text, font, width)
-    return layout.get_pixel_size()
+    return text_cache.extents(cr, text, font, width)
 
 
 def text_align(cr, x, y, text, font, width=-1, height=-1,
@@ -62,9 +124,9 @@ def text_align(cr, x, y, text, font, width=-1, height=-1,
     if not text:
         return
 
-    layout = _text_layout(cr, text, font, width)
+    layout = text_cache.layout(cr, text, font, width)
 
-    w, h = layout.get_pixel_size()
+    w, h = text_cache.extents(cr, text, font, width)
 
     if align_x == 0:
         x = 0.5 - (w / 2) + x
@@ -79,8 +141,7 @@ def text_align(cr, x, y, text, font, width=-1, height=-1,
     else:
         y = y + padding_y
     cr.move_to(x, y)
-    cr.update_layout(layout)
-    cr.show_layout(layout)
+    show_layout(cr, layout)
 
 
 def text_center(cr, x, y, text, font):
@@ -452,12 +513,8 @@ class TextElement(object):
 
         cr = context.cairo
         if isinstance(cr, cairo.Context) and self.text:
-            cr = pangocairo.CairoContext(context.cairo)
             cr.move_to(x, y)
-            layout = cr.create_layout()
-            layout.set_font_description(pango.FontDescription(self._style.font))
-            layout.set_text(self.text)
-            cr.show_layout(layout)
+            show_layout(cr, text_cache.layout(cr, self.text, self._style.font))
         if self.editable and (context.hovered or context.focused):
             cr.save()
             cr.set_source_rgb(0.6, 0.6, 0.6)
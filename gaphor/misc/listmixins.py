@@ -13,6 +13,8 @@ See the documentation on the mixins.
 __all__ = [ 'querymixin', 'recursemixin', 'getslicefix' ]
 
 import sys
+import ast
+from gaphor.misc.lru import LRUCache
 
 
 class Matcher(object):
@@ -45,20 +47,79 @@ class Matcher(object):
 
     NOTE: the object ``it`` was introduced since properties (descriptors) can
     not be executed from within a dictionary context.
+
+    Expressions are compiled to a function once (see compile_query()).
+    For an expression that compares an attribute of ``it`` with a constant,
+    the attribute name and the value are available, so the match can be
+    looked up in an index:
+
+    >>> m = Matcher('it.name=="root"')
+    >>> m.attribute, m.value
+    ('name', 'root')
+    >>> Matcher('it.name==it.text').attribute
     """
 
     def __init__(self, expr):
-        self.expr = compile(expr, '<matcher>', 'eval')
+        self.match, self.attribute, self.value = compile_query(expr)
 
     def __call__(self, element):
         try:
-            return eval(self.expr, {}, { 'it': element })
+            return self.match(element)
         except (AttributeError, NameError):
             # attribute does not (yet) exist
-            #print 'No attribute', expr, d
             return False
 
 
+# expression: (function, attribute, value)
+_queries = LRUCache(500)
+
+def compile_query(expr):
+    """
+    Return a function for query expression expr (called with ``it``), the
+    attribute and the value if the expression is of the form
+    ``it.attribute == constant``. Compiled expressions are cached.
+
+    >>> match, attribute, value = compile_query('"x" == it.name')
+    >>> attribute, value
+    ('name', 'x')
+    >>> compile_query('"x" == it.name') is compile_query('"x" == it.name')
+    True
+    >>> match, attribute, value = compile_query('len(it) > 2')
+    >>> match('abc'), attribute, value
+    (True, None, None)
+    """
+    try:
+        return _queries[expr]
+    except KeyError:
+        pass
+
+    attribute, value = _equality(ast.parse(expr.strip(), '<matcher>', 'eval'))
+    if attribute:
+        def match(it):
+            return getattr(it, attribute) == value
+    else:
+        match = eval(compile('lambda it: (%s)' % expr.strip(), '<matcher>', 'eval'), {})
+    query = _queries[expr] = (match, attribute, value)
+    return query
+
+
+def _equality(tree):
+    """
+    Return the attribute and value of an ``it.attribute == constant``
+    expression tree, or (None, None).
+    """
+    body = tree.body
+    if not isinstance(body, ast.Compare) or len(body.ops) != 1 \
+            or not isinstance(body.ops[0], ast.Eq):
+        return None, None
+    for left, right in ((body.left, body.comparators[0]),
+                        (body.comparators[0], body.left)):
+        if isinstance(left, ast.Attribute) and isinstance(left.value, ast.Name) \
+                and left.value.id == 'it' and isinstance(right, (ast.Str, ast.Num)):
+            return left.attr, ast.literal_eval(right)
+    return None, None
+
+
 class querymixin(object):
     """
     Implementation of the matcher as a mixin for lists.
@@ -90,17 +151,27 @@ class querymixin(object):
             return super(querymixin, self).__getitem__(key)
         except TypeError:
             # Nope, try our matcher trick
-            if type(key) is tuple:
-                key, remainder = key[0], key[1:]
-            else:
-                remainder = None
+            return self.query(key)
 
-            matcher = Matcher(key)
+    def query(self, key, select=None):
+        """
+        Return the items that match query key (an expression, or a tuple
+        of an expression and further keys). If given, select(matcher)
+        should return the matched items, or None to filter the list.
+        """
+        if type(key) is tuple:
+            key, remainder = key[0], key[1:]
+        else:
+            remainder = None
+
+        matcher = Matcher(key)
+        matched = select and select(matcher)
+        if matched is None:
             matched = filter(matcher, self)
-            if remainder:
-                return type(self)(matched).__getitem__(*remainder)
-            else:
-                return type(self)(matched)
+        if remainder:
+            return type(self)(matched).__getitem__(*remainder)
+        else:
+            return type(self)(matched)
 
 
 def issafeiterable(obj):
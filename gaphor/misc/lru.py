@@ -0,0 +1,70 @@
+"""
+A size bounded cache that drops the least recently used items.
+"""
+
+from gaphor.misc.odict import odict
+
+
+class LRUCache(object):
+    """
+    Mapping that holds at most ``size`` items. Reading or writing an item
+    marks it as most recently used. Once the cache is full the least
+    recently used item is dropped.
+
+    >>> cache = LRUCache(2)
+    >>> cache['a'] = 1
+    >>> cache['b'] = 2
+    >>> cache['a']
+    1
+    >>> cache['c'] = 3
+    >>> 'b' in cache
+    False
+    >>> cache.keys()
+    ['a', 'c']
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._items = odict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __getitem__(self, key):
+        items = self._items
+        value = dict.__getitem__(items, key)
+        del items[key]
+        items[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        items = self._items
+        if key in items:
+            del items[key]
+        elif len(items) >= self.size:
+            del items[iter(items).next()]
+        items[key] = value
+
+    def __delitem__(self, key):
+        del self._items[key]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        """
+        Return the keys, least recently used first.
+        """
+        return self._items.keys()
+
+    def clear(self):
+        self._items.clear()
+
+
+# vim:sw=4:et:ai
@@ -1,66 +1,118 @@
 # from http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/107747
+#
+# The key order is maintained in a circular doubly linked list. Each key is
+# mapped to its link ([prev, next, key]) in ``self._map``, so insertion,
+# deletion and membership tests are O(1), just like with a normal dict.
+
 class odict(dict):
 
     def __init__(self, dict=()):
-        self._keys = []
-        super(odict, self).__init__(dict)
+        super(odict, self).__init__()
+        self._init_links()
+        self.update(dict)
+
+    def _init_links(self):
+        self._root = root = []
+        root[:] = [root, root, None]
+        self._map = {}
 
     def __delitem__(self, key):
         dict.__delitem__(self, key)
-        self._keys.remove(key)
+        link_prev, link_next, key = self._map.pop(key)
+        link_prev[1] = link_next
+        link_next[0] = link_prev
 
     def __setitem__(self, key, item):
+        if not dict.__contains__(self, key):
+            root = self._root
+            last = root[0]
+            last[1] = root[0] = self._map[key] = [last, root, key]
         dict.__setitem__(self, key, item)
-        if key not in self._keys: self._keys.append(key)
+
+    def __iter__(self):
+        root = self._root
+        curr = root[1]
+        while curr is not root:
+            yield curr[2]
+            curr = curr[1]
+
+    def __reversed__(self):
+        root = self._root
+        curr = root[0]
+        while curr is not root:
+            yield curr[2]
+            curr = curr[0]
+
+    def __reduce__(self):
+        return self.__class__, (self.items(),)
 
     def clear(self):
         dict.clear(self)
-        self._keys = []
+        self._init_links()
 
     def copy(self):
-        dict = dict.copy(self)
-        dict._keys = self._keys[:]
-        return dict
+        return self.__class__(self)
+
+    def iterkeys(self):
+        return iter(self)
+
+    def itervalues(self):
+        for k in self:
+            yield self[k]
+
+    def iteritems(self):
+        for k in self:
+            yield (k, self[k])
 
     def items(self):
-        return zip(self._keys, self.values())
+        return list(self.iteritems())
 
     def keys(self):
-        return self._keys
+        return list(self)
+
+    def values(self):
+        return list(self.itervalues())
+
+    def pop(self, key, *default):
+        if dict.__contains__(self, key):
+            val = self[key]
+            del self[key]
+            return val
+        return dict.pop(self, key, *default)
 
     def popitem(self):
-        try:
-            key = self._keys[-1]
-        except IndexError:
+        if not self:
             raise KeyError('dictionary is empty')
 
+        key = self._root[0][2]
         val = self[key]
         del self[key]
 
         return (key, val)
 
     def setdefault(self, key, failobj=None):
-        dict.setdefault(self, key, failobj)
-        if key not in self._keys: self._keys.append(key)
-
-    def update(self, dict):
-        dict.update(self, dict)
-        for key in dict.keys():
-            if key not in self._keys: self._keys.append(key)
-
-    def values(self):
-        return map(self.get, self._keys)
-    
+        if not dict.__contains__(self, key):
+            self[key] = failobj
+        return self[key]
+
+    def update(self, other=(), **kwargs):
+        if hasattr(other, 'keys'):
+            for key in other.keys():
+                self[key] = other[key]
+        else:
+            for key, val in other:
+                self[key] = val
+        for key, val in kwargs.items():
+            self[key] = val
 
     def swap(self, k1, k2):
         """
         Swap two elements using their keys.
         """
-        i1 = self._keys.index(k1)
-        i2 = self._keys.index(k2)
-        self._keys[i1], self._keys[i2] = self._keys[i2], self._keys[i1]
+        l1 = self._map[k1]
+        l2 = self._map[k2]
+        l1[2], l2[2] = k2, k1
+        self._map[k1], self._map[k2] = l2, l1
 
 
-    def __iter__(self):
-        for k in self._keys:
-            yield k
+# vim:sw=4:et:ai
@@ -0,0 +1,37 @@
+import unittest
+from gaphor.misc.lru import LRUCache
+
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    def test_eviction(self):
+        cache = LRUCache(3)
+        for k in 'abcd':
+            cache[k] = k.upper()
+        self.assertEquals(3, len(cache))
+        self.assertEquals(['b', 'c', 'd'], cache.keys())
+        self.assertRaises(KeyError, lambda: cache['a'])
+        self.assertEquals(None, cache.get('a'))
+
+    def test_recently_used(self):
+        cache = LRUCache(3)
+        for k in 'abc':
+            cache[k] = k.upper()
+        self.assertEquals('A', cache['a'])
+        cache['b'] = 'X'
+        self.assertEquals(['c', 'a', 'b'], cache.keys())
+        cache['d'] = 'D'
+        self.assertFalse('c' in cache)
+        self.assertEquals(['a', 'b', 'd'], cache.keys())
+
+    def test_delete_and_clear(self):
+        cache = LRUCache(3)
+        cache['a'] = 1
+        cache['b'] = 2
+        del cache['a']
+        self.assertEquals(['b'], cache.keys())
+        cache.clear()
+        self.assertEquals(0, len(cache))
+
+
+# vim:sw=4:et:ai
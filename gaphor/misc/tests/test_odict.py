@@ -0,0 +1,57 @@
+
+import pickle
+import unittest
+from gaphor.misc.odict import odict
+
+
+class OdictTestCase(unittest.TestCase):
+
+    def test_insertion_order(self):
+        d = odict()
+        for k in 'cab':
+            d[k] = k.upper()
+        self.assertEquals(['c', 'a', 'b'], d.keys())
+        self.assertEquals(['C', 'A', 'B'], d.values())
+        self.assertEquals(['C', 'A', 'B'], list(d.itervalues()))
+        self.assertEquals([('c', 'C'), ('a', 'A'), ('b', 'B')], d.items())
+
+        # Overwriting a value should not change the order
+        d['c'] = 'X'
+        self.assertEquals(['c', 'a', 'b'], list(d))
+
+    def test_delete(self):
+        d = odict([('a', 1), ('b', 2), ('c', 3)])
+        del d['b']
+        self.assertEquals(['a', 'c'], d.keys())
+        self.assertFalse('b' in d)
+        d['b'] = 4
+        self.assertEquals(['a', 'c', 'b'], d.keys())
+        self.assertEquals(('b', 4), d.popitem())
+        self.assertEquals(3, d.pop('c'))
+        self.assertEquals(None, d.pop('c', None))
+        self.assertEquals(['a'], d.keys())
+
+    def test_swap(self):
+        d = odict([('a', 1), ('b', 2), ('c', 3)])
+        d.swap('a', 'c')
+        self.assertEquals(['c', 'b', 'a'], d.keys())
+        del d['c']
+        self.assertEquals(['b', 'a'], d.keys())
+
+    def test_copy_and_pickle(self):
+        d = odict([('b', 1), ('a', 2)])
+        self.assertEquals(['b', 'a'], d.copy().keys())
+        for protocol in (0, 2):
+            p = pickle.loads(pickle.dumps(d, protocol))
+            self.assertEquals(odict, type(p))
+            self.assertEquals(['b', 'a'], p.keys())
+
+    def test_clear(self):
+        d = odict([('b', 1), ('a', 2)])
+        d.clear()
+        self.assertEquals([], d.keys())
+        d['c'] = 1
+        self.assertEquals(['c'], d.keys())
+
+
+# vim:sw=4:et:ai
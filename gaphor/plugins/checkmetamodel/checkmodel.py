@@ -27,7 +27,7 @@ def get_superclasses(class_):
 
 
 def check_classes(element_factory):
-    classes = element_factory.select(lambda e: e.isKindOf(UML.Class))
+    classes = list(element_factory.select_type(UML.Class))
     names = [ c.name for c in classes ]
     for c in classes:
         if names.count(c.name) > 1:
@@ -38,7 +38,7 @@ def check_association_end_subsets(element_factory, end):
     # TODO: don't use Tagged values, use Stereotype values or something
     subsets = get_subsets(end.taggedValue and end.taggedValue[0].value or '')
     opposite_subsets = get_subsets(end.opposite.taggedValue and end.opposite.taggedValue[0].value or '')
-    subset_properties = element_factory.select(lambda e: e.isKindOf(UML.Property) and e.name in subsets)
+    subset_properties = [ p for name in subsets for p in element_factory.lookup_name(name, UML.Property) ]
 
     # TODO: check if properties belong to a superclass of the end's class
 
@@ -63,7 +63,7 @@ def check_association_end(element_factory, end):
     check_association_end_subsets(element_factory, end)
 
 def check_associations(element_factory):
-    for a in element_factory.select(lambda e: e.isKindOf(UML.Association)):
+    for a in element_factory.select_type(UML.Association):
         assert len(a.memberEnd) == 2
         head = a.memberEnd[0]
         tail = a.memberEnd[1]
@@ -71,7 +71,7 @@ def check_associations(element_factory):
         check_association_end(element_factory, tail)
 
 def check_attributes(element_factory):
-    for a in element_factory.select(lambda e: e.isKindOf(UML.Property) and not e.association):
+    for a in element_factory.select_type(UML.Property, lambda e: not e.association):
         if not a.typeValue or not a.typeValue.value:
             report(a,'Attribute has no type: %s' % a.name)
         elif a.typeValue.value.lower() not in ('string', 'boolean', 'integer', 'unlimitednatural'):
@@ -22,6 +22,7 @@ class Engineer(object):
 
     element_factory = inject('element_factory')
     diagram_layout = inject('diagram_layout')
+    component_registry = inject('component_registry')
 
     def process(self, files=None):
 
@@ -41,34 +42,36 @@ class Engineer(object):
         print p
         
         try:
-            self._root_package = self.element_factory.lselect(lambda e: isinstance(e, UML.Package) and not e.namespace)[0]
+            self._root_package = list(self.element_factory.select_type(UML.Package, lambda e: not e.namespace))[0]
         except IndexError:
             pass # running as test?
 
         for m in p.modulemethods:
             print 'ModuleMethod:', m
 
-        # Step 0: create a diagram to put the newly created elements on
-        self.diagram = self.element_factory.create(UML.Diagram)
-        self.diagram.name = 'New classes'
-        self.diagram.package = self._root_package
-
-        # Step 1: create the classes
-        for name, clazz in p.classlist.items():
-            print type(clazz), dir(clazz)
-            self._create_class(clazz, name)
+        # Deliver model change events at once, when the model is created
+        with self.component_registry.batch():
+            # Step 0: create a diagram to put the newly created elements on
+            self.diagram = self.element_factory.create(UML.Diagram)
+            self.diagram.name = 'New classes'
+            self.diagram.package = self._root_package
+
+            # Step 1: create the classes
+            for name, clazz in p.classlist.items():
+                print type(clazz), dir(clazz)
+                self._create_class(clazz, name)
             
-        # Create generalization relationships:
-        for name, clazz in p.classlist.items():
-            self._create_generalization(clazz)
+            # Create generalization relationships:
+            for name, clazz in p.classlist.items():
+                self._create_generalization(clazz)
         
-        # Create attributes (and associations) on the classes
-        for name, clazz in p.classlist.items():
-            self._create_attributes(clazz)
+            # Create attributes (and associations) on the classes
+            for name, clazz in p.classlist.items():
+                self._create_attributes(clazz)
 
-        # Create operations
-        for name, clazz in p.classlist.items():
-            self._create_methods(clazz)
+            # Create operations
+            for name, clazz in p.classlist.items():
+                self._create_methods(clazz)
 
         self.diagram_layout.layout_diagram(self.diagram)
 
@@ -91,7 +94,7 @@ class Engineer(object):
                     superclass_item = self.parser.classlist[superclassname].gaphor_class_item
                 except KeyError, e:
                     print 'No class found named', superclassname
-                    others = self.element_factory.lselect(lambda e: isinstance(e, UML.Class) and e.name == superclassname)
+                    others = self.element_factory.lookup_name(superclassname, UML.Class)
                     if others:
                         superclass = others[0]
                         print 'Found class in factory: %s' % superclass.name
@@ -154,7 +157,7 @@ class Engineer(object):
             superclass_item = self.parser.classlist[classname].gaphor_class_item
         except KeyError, e:
             print 'No class found named', classname
-            others = self.element_factory.lselect(lambda e: isinstance(e, UML.Class) and e.name == classname)
+            others = self.element_factory.lookup_name(classname, UML.Class)
             if others:
                 superclass = others[0]
                 print 'Found class in factory: %s' % superclass.name
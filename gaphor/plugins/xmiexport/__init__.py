@@ -7,6 +7,8 @@ from zope import interface, component
 from gaphor.core import _, inject, action, build_action_group
 from gaphor.interfaces import IService, IActionProvider
 from gaphor.ui.filedialog import FileDialog
+from gaphor.ui.statuswindow import StatusWindow
+from gaphor.misc.gidlethread import GIdleThread, Queue
 
 import exportmodel
 
@@ -55,10 +57,23 @@ class XMIExport(object):
         if filename and len(filename) > 0:
             log.debug('Exporting XMI model to: %s' % filename)
             export = exportmodel.XMIExport(self.element_factory)
+            queue = Queue()
+            status_window = StatusWindow(_('Exporting...'),\
+                                         _('Exporting model to %s') % filename,\
+                                         parent=self.main_window.window,\
+                                         queue=queue)
+            out = open(filename, 'w')
             try:
-                export.export(filename)
+                worker = GIdleThread(export.export_generator(out), queue)
+                worker.start()
+                worker.wait()
+                if worker.error:
+                    worker.reraise()
             except Exception, e:
                 log.error('Error while saving model to file %s: %s' % (filename, e))
+            finally:
+                out.close()
+                status_window.destroy()
 
 
 # vim:sw=4:et
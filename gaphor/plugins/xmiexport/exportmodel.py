@@ -1,77 +1,119 @@
+"""
+Export a model to XMI.
 
+The exporter is table driven: for every model class there is a handler,
+which returns the tag, the attributes and the children of an element.
+The elements are written by one loop, so the export can be done in steps
+(see XMIExport.export_generator()).
+"""
+
+from cStringIO import StringIO
+
+from gaphor import UML
 from gaphor.misc.xmlwriter import XMLWriter
 
+
+# (exporter class, element class): handler
+_handlers = dict()
+
+
 class XMIExport(object):
-    
+
     XMI_VERSION = '2.1'
     XMI_NAMESPACE = 'http://schema.omg.org/spec/XMI/2.1'
     UML_NAMESPACE = 'http://schema.omg.org/spec/UML/2.1'
     XMI_PREFIX = 'XMI'
     UML_PREFIX = 'UML'
-    
+
+    # Number of elements written between progress updates
+    FLUSH_INTERVAL = 100
+
     def __init__(self, element_factory):
         self.element_factory = element_factory
-        self.handled_ids = list()
-        
-    def handle(self, xmi, element):
-        log.debug('Handling %s'%element.__class__.__name__)
+        self.handled_ids = set()
+
+    def handler(self, cls):
+        """
+        Return the handler for elements of class cls. This is the
+        handle<ClassName> method for the class, or else for the nearest
+        superclass. Handlers are looked up once per class.
+        """
+        key = (self.__class__, cls)
         try:
-            handler_name = 'handle%s'%element.__class__.__name__
-            handler = getattr(self, handler_name)
-            idref = element.id in self.handled_ids
-            handler(xmi, element, idref=idref)
-            if not idref:
-                self.handled_ids.append(element.id)
-        except AttributeError, e:
-            log.warning('Missing handler for %s:%s'%(element.__class__.__name__,e))
-        except Exception, e:
-            log.error('Failed to handle %s:%s'%(element.__class__.__name__, e))
-            
-    def handlePackage(self, xmi, element, idref=False):
-        
+            return _handlers[key]
+        except KeyError:
+            for c in cls.__mro__:
+                handler = getattr(self.__class__, 'handle%s' % c.__name__, None)
+                if handler:
+                    break
+            else:
+                log.warning('Missing handler for %s' % cls.__name__)
+            _handlers[key] = handler
+            return handler
+
+    def serialize(self, xmi, element):
+        """
+        Write element and the elements it contains to xmi. This is a
+        generator, it yields every element written.
+        """
+        handled_ids = self.handled_ids
+        stack = [((), iter(((None, element),)))]
+        while stack:
+            end_tags, children = stack[-1]
+            try:
+                wrapper, child = children.next()
+            except StopIteration:
+                stack.pop()
+                for tag in end_tags:
+                    xmi.endElement(tag)
+                continue
+
+            if wrapper:
+                xmi.startElement(wrapper, attrs=dict())
+            handler = self.handler(type(child))
+            if not handler:
+                if wrapper:
+                    xmi.endElement(wrapper)
+                continue
+
+            idref = child.id in handled_ids
+            handled_ids.add(child.id)
+            tag, attributes, contents = handler(self, child, idref=idref)
+
+            xmi.startElement(tag, attrs=dict((k, v) for k, v
+                    in attributes.iteritems() if v is not None))
+            stack.append((wrapper and (tag, wrapper) or (tag,),
+                    ((name, e) for name, elements in contents for e in elements)))
+            yield child
+
+    def handlePackage(self, element, idref=False):
+
         attributes = dict()
         attributes['%s:id'%self.XMI_PREFIX] = element.id
         attributes['name'] = element.name
         attributes['visibility'] = element.visibility
 
-        xmi.startElement('%s:Package'%self.UML_PREFIX, attrs=attributes)
-                         
-        for ownedMember in element.ownedMember:
-            xmi.startElement('ownedMember', attrs=dict())
-            self.handle(xmi, ownedMember)
-            xmi.endElement('ownedMember')
+        return '%s:Package'%self.UML_PREFIX, attributes, \
+                (('ownedMember', element.ownedMember),)
 
-        xmi.endElement('%s:Package'%self.UML_PREFIX)
+    def handleClass(self, element, idref=False):
 
-    def handleClass(self, xmi, element, idref=False):
-        
         attributes = dict()
-        
+
         if idref:
             attributes['%s:idref'%self.XMI_PREFIX] = element.id
-        else:
-            attributes['%s:id'%self.XMI_PREFIX] = element.id
-            attributes['name'] = element.name
-            attributes['isAbstract'] = str(element.isAbstract)
-        
-        xmi.startElement('%s:Class'%self.UML_PREFIX, attrs=attributes)
-        
-        if not idref:
-        
-            for ownedAttribute in element.ownedAttribute:
-                xmi.startElement('ownedAttribute', attrs=dict())
-                self.handle(xmi, ownedAttribute)
-                xmi.endElement('ownedAttribute')
-                
-            for ownedOperation in element.ownedOperation:
-                xmi.startElement('ownedOperation', attrs=dict())
-                self.handle(xmi, ownedOperation)
-                xmi.endElement('ownedOperation')
-            
-        xmi.endElement('%s:Class'%self.UML_PREFIX)
-        
-    def handleProperty(self, xmi, element, idref=False):
-        
+            return '%s:Class'%self.UML_PREFIX, attributes, ()
+
+        attributes['%s:id'%self.XMI_PREFIX] = element.id
+        attributes['name'] = element.name
+        attributes['isAbstract'] = str(element.isAbstract)
+
+        return '%s:Class'%self.UML_PREFIX, attributes, \
+                (('ownedAttribute', element.ownedAttribute),
+                 ('ownedOperation', element.ownedOperation))
+
+    def handleProperty(self, element, idref=False):
+
         attributes = dict()
         attributes['%s:id'%self.XMI_PREFIX] = element.id
         attributes['isStatic'] = str(element.isStatic)
@@ -79,40 +121,30 @@ class XMIExport(object):
         attributes['isUnique'] = str(element.isUnique)
         attributes['isDerived'] = str(element.isDerived)
         attributes['isDerivedUnion'] = str(element.isDerivedUnion)
-        attributes['isReadOnly'] = str(element.isReadOnly)                
-        
-        if element.name is not None:
-            attributes['name'] = element.name
-        
-        xmi.startElement('%s:Property'%self.UML_PREFIX, attrs=attributes)
-        
+        attributes['isReadOnly'] = str(element.isReadOnly)
+        attributes['name'] = element.name
+
         #TODO: This should be type, not typeValue.
         if element.typeValue is not None:
-            xmi.startElement('type', attrs=dict())
-            self.handle(xmi, element.typeValue)
-            xmi.endElement('type')
-                    
-        xmi.endElement('%s:Property'%self.UML_PREFIX)
-        
-    def handleOperation(self, xmi, element, idref=False):
-        
+            contents = (('type', (element.typeValue,)),)
+        else:
+            contents = ()
+
+        return '%s:Property'%self.UML_PREFIX, attributes, contents
+
+    def handleOperation(self, element, idref=False):
+
         attributes = dict()
         attributes['%s:id'%self.XMI_PREFIX] = element.id
         attributes['isStatic'] = str(element.isStatic)
         attributes['isQuery'] = str(element.isQuery)
         attributes['name'] = element.name
-        
-        xmi.startElement('%s:Operation'%self.XMI_PREFIX, attrs=attributes)
-        
-        for ownedParameter in element.parameter:
-            xmi.startElement('ownedElement', attrs=dict())
-            self.handle(xmi, ownedParameter)
-            xmi.endElement('ownedElement')
-        
-        xmi.endElement('%s:Operation'%self.XMI_PREFIX)
-        
-    def handleParameter(self, xmi, element, idref=False):
-        
+
+        return '%s:Operation'%self.XMI_PREFIX, attributes, \
+                (('ownedElement', element.parameter),)
+
+    def handleParameter(self, element, idref=False):
+
         attributes = dict()
         attributes['%s:id'%self.XMI_PREFIX] = element.id
         attributes['isOrdered'] = str(element.isOrdered)
@@ -120,148 +152,118 @@ class XMIExport(object):
 
         attributes['direction'] = element.direction
         attributes['name'] = element.name
-        
-        xmi.startElement('%s:Parameter'%self.XMI_PREFIX, attrs=attributes)
-        
-        xmi.endElement('%s:Parameter'%self.XMI_PREFIX)
-        
-    def handleLiteralSpecification(self, xmi, element, idref=False):
-        
+
+        return '%s:Parameter'%self.XMI_PREFIX, attributes, ()
+
+    def handleLiteralSpecification(self, element, idref=False):
+
         attributes = dict()
         attributes['%s:id'%self.XMI_PREFIX] = element.id
         attributes['value'] = element.value
-        
-        xmi.startElement('%s:LiteralSpecification'%self.UML_PREFIX, attrs=attributes)
-        
-        xmi.endElement('%s:LiteralSpecification'%self.UML_PREFIX)
-        
-    def handleAssociation(self, xmi, element, idref=False):
-        
+
+        return '%s:LiteralSpecification'%self.UML_PREFIX, attributes, ()
+
+    def handleAssociation(self, element, idref=False):
+
         attributes = dict()
         attributes['%s:id'%self.XMI_PREFIX] = element.id
         attributes['isDerived'] = str(element.isDerived)
-        
-        xmi.startElement('%s:Association'%self.UML_PREFIX, attrs=attributes)
-        
-        for memberEnd in element.memberEnd:
-            xmi.startElement('memberEnd', attrs=dict())
-            self.handle(xmi, memberEnd)
-            xmi.endElement('memberEnd')
-            
-        for ownedEnd in element.ownedEnd:
-            xmi.startElement('ownedEnd', attrs=dict())
-            self.handle(xmi, ownedEnd)
-            xmi.endElement('ownedEnd')
-        
-        xmi.endElement('%s:Association'%self.UML_PREFIX)
-        
-    def handleDependency(self, xmi, element, idref=False):
-        
+
+        return '%s:Association'%self.UML_PREFIX, attributes, \
+                (('memberEnd', element.memberEnd),
+                 ('ownedEnd', element.ownedEnd))
+
+    def handleDependency(self, element, idref=False):
+
         attributes = dict()
         attributes['%s:id'%self.XMI_PREFIX] = element.id
-        
-        xmi.startElement('%s:Dependency'%self.UML_PREFIX, attrs=attributes)
-        
-        for client in element.client:
-            xmi.startElement('client', attrs=dict())
-            self.handle(xmi, client)
-            xmi.endElement('client')
-            
-        for supplier in element.supplier:
-            xmi.startElement('supplier', attrs=dict())
-            self.handle(xmi, supplier)
-            xmi.endElement('supplier')
-        
-        xmi.endElement('%s:Dependency'%self.UML_PREFIX)
-        
-    def handleGeneralization(self, xmi, element, idref=False):
-        
+
+        return '%s:Dependency'%self.UML_PREFIX, attributes, \
+                (('client', element.client),
+                 ('supplier', element.supplier))
+
+    def handleGeneralization(self, element, idref=False):
+
         attributes = dict()
         attributes['%s:id'%self.XMI_PREFIX] = element.id
         attributes['isSubstitutable'] = str(element.isSubstitutable)
-        
-        xmi.startElement('%s:Generalization'%self.UML_PREFIX, attrs=attributes)
-        
+
+        contents = []
         if element.general:
-            xmi.startElement('general', attrs=dict())
-            self.handle(xmi, element.general)
-            xmi.endElement('general')
-            
+            contents.append(('general', (element.general,)))
         if element.specific:
-            xmi.startElement('specific', attrs=dict())
-            self.handle(xmi, element.specific)
-            xmi.endElement('specific')
-        
-        xmi.endElement('%s:Generalization'%self.UML_PREFIX)
-        
-    def handleRealization(self, xmi, element, idref=False):
-        
+            contents.append(('specific', (element.specific,)))
+
+        return '%s:Generalization'%self.UML_PREFIX, attributes, contents
+
+    def handleRealization(self, element, idref=False):
+
         attributes = dict()
         attributes['%s:id'%self.XMI_PREFIX] = element.id
-        
-        xmi.startElement('%s:Realization'%self.UML_PREFIX, attrs=attributes)
-        
-        for client in element.client:
-            xmi.startElement('client', attrs=dict())
-            self.handle(xmi, client)
-            xmi.endElement('client')
-            
-        for supplier in element.supplier:
-            xmi.startElement('supplier', attrs=dict())
-            self.handle(xmi, supplier)
-            xmi.endElement('supplier')
-        
-        xmi.endElement('%s:Realization'%self.UML_PREFIX)        
-        
-    def handleInterface(self, xmi, element, idref=False):
-        
+
+        return '%s:Realization'%self.UML_PREFIX, attributes, \
+                (('client', element.client),
+                 ('supplier', element.supplier))
+
+    def handleInterface(self, element, idref=False):
+
         attributes = dict()
         attributes['%s:id'%self.XMI_PREFIX] = element.id
-        
-        xmi.startElement('%s:Interface'%self.UML_PREFIX, attrs=attributes)
-        
-        for ownedAttribute in element.ownedAttribute:
-            xmi.startElement('ownedAttribute', attrs=dict())
-            self.handle(ownedAttribute)
-            xmi.endElement('ownedAttribute')
-            
-        for ownedOperation in element.ownedOperation:
-            xmi.startElement('ownedOperation', attrs=dict())
-            self.handle(ownedOperation)
-            xmi.endElement('ownedOperation')
-        
-        xmi.endElement('%s:Interface'%self.UML_PREFIX)
-        
-    def export(self, filename):
-        out = open(filename, 'w')
 
-        xmi = XMLWriter(out)
-        
+        return '%s:Interface'%self.UML_PREFIX, attributes, \
+                (('ownedAttribute', element.ownedAttribute),
+                 ('ownedOperation', element.ownedOperation))
+
+    def select_roots(self):
+        """
+        Iterate the elements written at the top level of the document:
+        packages, generalizations and realizations.
+        """
+        factory = self.element_factory
+        for package in factory.select_type(UML.Package,
+                lambda e: e.__class__ is UML.Package):
+            yield package
+        for generalization in factory.select_type(UML.Generalization):
+            yield generalization
+        for realization in factory.select_type(UML.Implementation):
+            yield realization
+
+    def export_generator(self, out):
+        """
+        Write the model to the file object out. Output is written every
+        FLUSH_INTERVAL elements, after which the progress (a percentage)
+        is yielded. This generator can be run by a GIdleThread.
+        """
+        self.handled_ids.clear()
+        buf = StringIO()
+        xmi = XMLWriter(buf)
+
         attributes = dict()
         attributes['xmi.version'] = self.XMI_VERSION
         attributes['xmlns:xmi'] = self.XMI_NAMESPACE
         attributes['xmlns:UML'] = self.UML_NAMESPACE
-        
+
         xmi.startElement('XMI', attrs=attributes)
-        
-        for package in self.element_factory.select(self.select_package):
-            self.handle(xmi, package)
-            
-        for generalization in self.element_factory.select(self.select_generalization):
-            self.handle(xmi, generalization)
-            
-        for realization in self.element_factory.select(self.select_realization):
-            self.handle(xmi, realization)
-        
+
+        size = max(self.element_factory.size(), 1)
+        n = 0
+        for root in self.select_roots():
+            for element in self.serialize(xmi, root):
+                n += 1
+                if n % self.FLUSH_INTERVAL == 0:
+                    out.write(buf.getvalue())
+                    buf.reset()
+                    buf.truncate()
+                    yield min(n * 100 / size, 99)
+
         xmi.endElement('XMI')
-        
-        log.debug(self.handled_ids)
-        
-    def select_package(self, element):
-        return element.__class__.__name__ == 'Package'
-        
-    def select_generalization(self, element):
-        return element.__class__.__name__ == 'Generalization'
-        
-    def select_realization(self, element):
-        return element.__class__.name__ == 'Implementation'
+        out.write(buf.getvalue())
+        yield 100
+
+    def export(self, filename):
+        out = open(filename, 'w')
+        try:
+            for status in self.export_generator(out):
+                pass
+        finally:
+            out.close()
@@ -0,0 +1,81 @@
+
+from cStringIO import StringIO
+from xml.dom.expatbuilder import ExpatBuilder
+
+from gaphor import UML
+from gaphor.plugins.xmiexport.exportmodel import XMIExport
+from gaphor.tests.testcase import TestCase
+
+
+class XMIExportTestCase(TestCase):
+
+    def create_model(self):
+        factory = self.element_factory
+        package = factory.create(UML.Package)
+        package.name = 'model'
+        classes = []
+        for i in range(10):
+            c = factory.create(UML.Class)
+            c.name = 'Class%d' % i
+            c.package = package
+            a = factory.create(UML.Property)
+            UML.parse(a, 'attr: int')
+            c.ownedAttribute = a
+            o = factory.create(UML.Operation)
+            UML.parse(o, 'op(x: int)')
+            c.ownedOperation = o
+            classes.append(c)
+        g = factory.create(UML.Generalization)
+        g.general = classes[0]
+        g.specific = classes[1]
+        return package, classes, g
+
+    def export(self, interval=100):
+        export = XMIExport(self.element_factory)
+        export.FLUSH_INTERVAL = interval
+        out = StringIO()
+        progress = list(export.export_generator(out))
+        # Parse without namespaces, the XMI prefix is not declared
+        return progress, ExpatBuilder().parseString(out.getvalue())
+
+    def test_export(self):
+        package, classes, g = self.create_model()
+        progress, doc = self.export()
+        self.assertEquals([100], progress)
+
+        packages = doc.getElementsByTagName('UML:Package')
+        self.assertEquals(1, len(packages))
+        self.assertEquals('model', packages[0].getAttribute('name'))
+
+        # Classes are written once, and referred to by the generalization
+        ids = [ e.getAttribute('XMI:id') for e in
+                doc.getElementsByTagName('UML:Class') ]
+        self.assertEquals(12, len(ids))
+        self.assertEquals(set(c.id for c in classes), set(ids[:10]))
+        generalization = doc.getElementsByTagName('UML:Generalization')[0]
+        general = generalization.getElementsByTagName('UML:Class')[0]
+        self.assertEquals(classes[0].id, general.getAttribute('XMI:idref'))
+        self.assertFalse(general.getAttribute('name'))
+
+        self.assertEquals(10, len(doc.getElementsByTagName('UML:Property')))
+        self.assertEquals(20, len(doc.getElementsByTagName('XMI:Parameter')))
+
+    def test_progress(self):
+        self.create_model()
+        progress, doc = self.export(interval=10)
+        self.assertTrue(len(progress) > 2, progress)
+        self.assertEquals(sorted(progress), progress)
+        self.assertEquals(100, progress[-1])
+
+    def test_realization(self):
+        factory = self.element_factory
+        r = factory.create(UML.Implementation)
+        r.client = factory.create(UML.Class)
+        r.supplier = factory.create(UML.Interface)
+        progress, doc = self.export()
+        realization = doc.getElementsByTagName('UML:Realization')[0]
+        self.assertEquals(r.id, realization.getAttribute('XMI:id'))
+        self.assertEquals(1, len(realization.getElementsByTagName('UML:Interface')))
+
+
+# vim:sw=4:et:ai
@@ -1,18 +1,55 @@
 """
+The backup service saves the model in the background, so it can be
+recovered after a crash.
+
+Every AUTOSAVE_INTERVAL seconds (property 'autosave-interval', 0 disables
+autosaving) the model is written to a compressed Gaphor file in the backup
+directory. The XML fragment of every element is kept (see
+storage.element_serializer()). Only the fragments of the elements that
+changed since the last backup are serialized again. This is done in idle
+time, in slices of at most SLICE seconds, so editing is not held up.
+Diagrams that are loaded lazily are not loaded for a backup, they are
+written from the parsed model file.
+Compressing and writing the file is done in a separate thread. The file is
+written under a temporary name first and renamed when it is complete.
+
+The backup file is named after the process id of the Gaphor session. When
+Gaphor shuts down the backup is removed. If a backup of a session that is
+no longer running is found at startup, Gaphor did not shut down properly
+and the user is offered to recover the model. A backup is removed once it
+is recovered or the user declined to recover it.
 """
 
-from zope import interface
+import os
+import errno
+import gzip
+import time
+import threading
+from cStringIO import StringIO
+
+import gobject
+from zope import interface, component
+
 from gaphor.UML import Element
-from gaphor.application import Application
-from gaphor.interfaces import IService, IActionProvider
+from gaphor.UML.interfaces import IElementCreateEvent, IElementDeleteEvent, \
+                                  IFlushFactoryEvent, IModelFactoryEvent
+from gaphor.interfaces import IService
 from gaphor.core import _, inject
+from gaphor.misc import get_user_data_dir
+from gaphor.storage import storage, incremental
+from gaphor.ui.questiondialog import QuestionDialog
 
 # Register application specific picklers:
 import gaphas.picklers
 from gaphor.misc.latepickle import LatePickler
 
+BACKUP_EXT = '.gaphor.gz'
+AUTOSAVE_INTERVAL = 60
+SLICE = 0.01
+COMPRESS_LEVEL = 1
+WRITE_SIZE = 1 << 18
+
 
-import pickle
 class MyPickler(LatePickler):
     """
     Customize the pickler to only delay instantiations of Element objects.
@@ -22,44 +59,344 @@ class MyPickler(LatePickler):
         return isinstance(obj, Element)
 
 
+def running(pid):
+    """
+    Return True if a process with id @pid is running.
+    """
+    if pid <= 0:
+        return False
+    if os.name == 'nt':
+        import ctypes
+        SYNCHRONIZE = 0x100000
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(SYNCHRONIZE, False, pid)
+        if handle:
+            kernel32.CloseHandle(handle)
+        return bool(handle)
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def write_backup(filename, head, fragments):
+    """
+    Write a backup file: the document head and the serialized elements,
+    compressed. The file is replaced only when it has been written
+    completely.
+    """
+    tmpname = filename + '.tmp'
+    out = gzip.GzipFile(tmpname, 'wb', COMPRESS_LEVEL)
+    try:
+        # Write a chunk at a time, so other threads get their turn
+        buf = [head, fragments and '>' or '/>']
+        size = 0
+        for data in fragments:
+            buf.append('\n')
+            buf.append(data)
+            size += len(data)
+            if size > WRITE_SIZE:
+                out.write(''.join(buf))
+                del buf[:]
+                size = 0
+        if fragments:
+            buf.append('\n</gaphor>')
+        out.write(''.join(buf))
+    except:
+        out.close()
+        os.remove(tmpname)
+        raise
+    out.close()
+
+    if os.name == 'nt' and os.path.exists(filename):
+        os.remove(filename)
+    os.rename(tmpname, filename)
+
+
 class BackupService(object):
     """
-    This service makes backups every *x* minutes.
+    This service makes backups every *x* seconds.
     """
 
     interface.implements(IService)
 
+    component_registry = inject('component_registry')
     element_factory = inject('element_factory')
+    properties = inject('properties')
+    main_window = inject('main_window')
 
     def __init__(self):
-        self.tempname = '.backup.gaphor.tmp'
+        self.backup_dir = os.path.join(get_user_data_dir(), 'backup')
+        self._tracker = None
+        self._fragments = {}
+        self._serialize = None
+        self._complete = False
+        self._changed = set()
+        self._unsaved = False
+        self._round = 0
+        self._timeout_id = 0
+        self._idle_id = 0
+        self._writer = None
 
 
     def init(self, app):
-        pass
+        self._tracker = incremental.DirtyTracker(self.component_registry)
+        self._tracker.connect()
+        self.component_registry.register_handler(self._element_created)
+        self.component_registry.register_handler(self._element_deleted)
+        self.component_registry.register_handler(self._model_flushed)
+        self.component_registry.register_handler(self._model_loaded)
+
+        try:
+            interval = self.properties.get('autosave-interval',
+                                           AUTOSAVE_INTERVAL)
+        except component.ComponentLookupError:
+            interval = AUTOSAVE_INTERVAL
+        if interval:
+            self._timeout_id = gobject.timeout_add(int(interval * 1000),
+                                                   self._autosave)
+        gobject.idle_add(self._offer_recovery)
 
 
     def shutdown(self):
-        pass
+        if self._timeout_id:
+            gobject.source_remove(self._timeout_id)
+            self._timeout_id = 0
+        if self._idle_id:
+            gobject.source_remove(self._idle_id)
+            self._idle_id = 0
+        self.component_registry.unregister_handler(self._element_created)
+        self.component_registry.unregister_handler(self._element_deleted)
+        self.component_registry.unregister_handler(self._model_flushed)
+        self.component_registry.unregister_handler(self._model_loaded)
+        if self._tracker:
+            self._tracker.disconnect()
+        if self._writer:
+            self._writer.join()
+        # Gaphor shuts down properly, nothing to recover:
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
+    @property
+    def filename(self):
+        """
+        The backup file of this session.
+        """
+        return os.path.join(self.backup_dir,
+                            '%d%s' % (os.getpid(), BACKUP_EXT))
+
+
+    @component.adapter(IElementCreateEvent)
+    def _element_created(self, event):
+        self._changed.add(event.element.id)
+
+
+    @component.adapter(IElementDeleteEvent)
+    def _element_deleted(self, event):
+        self._changed.add(event.element.id)
+
+
+    @component.adapter(IFlushFactoryEvent)
+    def _model_flushed(self, event):
+        self._reset()
+
+
+    @component.adapter(IModelFactoryEvent)
+    def _model_loaded(self, event):
+        self._reset()
+
+
+    def _reset(self):
+        """
+        A new model is loaded: all fragments have to be made again. A
+        backup that is being made is abandoned.
+        """
+        self._fragments.clear()
+        self._serialize = None
+        self._complete = False
+        self._changed.clear()
+        self._tracker.clear()
+        self._unsaved = False
+        self._round += 1
+
+
+    def _needed(self):
+        """
+        Return True if the model changed since the last backup.
+        """
+        return bool(self._unsaved or self._changed or
+                    self._tracker.dirty(self.element_factory))
+
+
+    def _modified(self):
+        """
+        Return the ids of the elements that changed since they were last
+        serialized. The changes are cleared.
+        """
+        factory = self.element_factory
+        if self._complete:
+            ids = self._tracker.dirty(factory)
+            ids.update(self._changed)
+        else:
+            ids = set(factory.keys())
+            self._complete = True
+        self._tracker.clear()
+        self._changed.clear()
+        self._unsaved = False
+        return ids
+
+
+    def backup_generator(self, slice=SLICE):
+        """
+        Bring the fragments up to date. The generator yields each time it
+        took more than @slice seconds. If the model is flushed meanwhile,
+        the generator stops right away.
+        """
+        factory = self.element_factory
+        fragments = self._fragments
+        # The serializer caches the references, keep it for the model
+        if not self._serialize:
+            self._serialize = storage.element_serializer('utf-8',
+                                                         materialize=False)
+        serialize = self._serialize
+        round = self._round
+        deadline = time.time() + slice
+        ids = self._modified()
+        while ids:
+            for id in ids:
+                e = factory.lookup(id)
+                if e is None:
+                    fragments.pop(id, None)
+                else:
+                    fragments[id] = serialize(e)
+                if time.time() > deadline:
+                    yield
+                    if round != self._round:
+                        return
+                    deadline = time.time() + slice
+            # Elements may have been changed again while we yielded
+            ids = self._modified()
 
 
     def backup(self):
-        f = open(self.tempname, 'w')
+        """
+        Make a backup right away.
+        """
+        for x in self.backup_generator():
+            pass
+        self._write(storage.document_head('utf-8'), self._fragments.values())
+
+
+    def _autosave(self):
+        """
+        Start a backup in idle time, unless a backup is being made.
+        """
+        if not self._idle_id and not (self._writer and
+                                      self._writer.isAlive()) \
+                and self._needed():
+            self._idle_id = gobject.idle_add(self._autosave_step,
+                                             self.backup_generator(),
+                                             self._round)
+        return True
+
+
+    def _autosave_step(self, generator, round):
         try:
-            pickler = MyPickler(f)
-            pickler.dump(self.element_factory.lselect())
-        finally:
-            f.close()
+            generator.next()
+            return True
+        except StopIteration:
+            self._idle_id = 0
+            if round == self._round:
+                self._writer = threading.Thread(target=self._write,
+                        args=(storage.document_head('utf-8'),
+                              self._fragments.values()))
+                self._writer.start()
+            return False
+
+
+    def _write(self, head, fragments):
+        try:
+            if not os.path.exists(self.backup_dir):
+                os.makedirs(self.backup_dir)
+            write_backup(self.filename, head, fragments)
+        except (IOError, OSError), e:
+            log.warning('Backup could not be written: %s' % e)
+
+
+    def backups(self):
+        """
+        Return the backups left behind by Gaphor sessions that did not shut
+        down properly, newest first. Backups of sessions that are still
+        running are skipped.
+        """
+        try:
+            names = os.listdir(self.backup_dir)
+        except OSError:
+            return []
+        filenames = []
+        for name in names:
+            if not name.endswith(BACKUP_EXT):
+                continue
+            try:
+                pid = int(name[:-len(BACKUP_EXT)])
+            except ValueError:
+                pid = 0
+            if pid != os.getpid() and not running(pid):
+                filenames.append(os.path.join(self.backup_dir, name))
+        filenames.sort(key=os.path.getmtime, reverse=True)
+        return filenames
 
 
-    def restore(self):
-        f = open(self.tempname, 'r')
+    def restore(self, filename):
+        """
+        Load the model from backup file @filename.
+        """
+        f = gzip.open(filename, 'rb')
         try:
-            elements = pickle.Unpickler(f).load()
+            data = f.read()
         finally:
             f.close()
-        self.element_factory.flush()
-        map(self.element_factory.bind, elements)
+        storage.load(StringIO(data), self.element_factory)
+        # Keep the recovered model in a backup, until it is saved
+        self._unsaved = True
+
+
+    def _ask_recovery(self, filename):
+        """
+        Ask the user whether the model in backup @filename should be
+        recovered.
+        """
+        try:
+            parent = self.main_window.window
+        except component.ComponentLookupError:
+            parent = None
+        dialog = QuestionDialog(_('Gaphor was not shut down properly. '
+                'Do you want to recover the model that was saved at %s?')
+                % time.ctime(os.path.getmtime(filename)), parent=parent)
+        answer = dialog.answer
+        dialog.destroy()
+        return answer
+
+
+    def _offer_recovery(self):
+        """
+        Offer to recover the backups left behind, newest first, until one
+        is recovered. The recovered backup is kept as the backup of this
+        session, until it is replaced. Backups the user declined are
+        removed, the others are offered again next time.
+        """
+        for filename in self.backups():
+            if self._ask_recovery(filename):
+                self.restore(filename)
+                if not os.path.exists(self.filename):
+                    os.rename(filename, self.filename)
+                else:
+                    os.remove(filename)
+                break
+            os.remove(filename)
+        return False
 
 
 # vim: sw=4:et:ai
@@ -6,10 +6,93 @@ Maybe we should split the ComponentRegistry in a Dispatcher (register_handler,
 unregister_handler, handle), a AdapterRegistry and a Subscription registry.
 """
 
+import copy
 from zope import interface, component
+from zope.interface import providedBy
 from zope.component import registry
 from gaphor.core import inject
 from gaphor.interfaces import IService, IEventFilter
+from gaphor.misc.odict import odict
+from gaphor.UML.event import AttributeChangeEvent, AssociationSetEvent, \
+        AssociationAddEvent, AssociationDeleteEvent, \
+        DerivedSetEvent, DerivedAddEvent, DerivedDeleteEvent, \
+        RedefineSetEvent, RedefineAddEvent, RedefineDeleteEvent
+
+
+# Events that replace the value of a property. Subsequent events for the
+# same element and property are coalesced.
+_SET_EVENTS = (AttributeChangeEvent, AssociationSetEvent, DerivedSetEvent,
+               RedefineSetEvent)
+
+# Add events with their delete counterpart. An add followed by a delete
+# of the same value cancel each other out.
+_ADD_DELETE_EVENTS = {
+    AssociationAddEvent: AssociationDeleteEvent,
+    DerivedAddEvent: DerivedDeleteEvent,
+    RedefineAddEvent: RedefineDeleteEvent,
+}
+
+_DELETE_ADD_EVENTS = dict((d, a) for a, d in _ADD_DELETE_EVENTS.items())
+
+
+def coalesce(events):
+    """
+    Remove redundant model change events from a list of events.
+
+    Subsequent set events on the same element and property are merged into
+    one event (placed at the position of the last event). A set event that
+    changes nothing in the end is dropped, as is an add event followed by a
+    delete event of the same value. Other events are left untouched.
+    """
+    events = list(events)
+    last_set = {}
+    last_add = {}
+    for i, event in enumerate(events):
+        event_type = type(event)
+        if event_type in _SET_EVENTS:
+            key = (event_type, event.element, event.property)
+            j = last_set.get(key)
+            if j is not None:
+                first = events[j]
+                events[j] = None
+                if first.old_value == event.new_value:
+                    events[i] = None
+                    del last_set[key]
+                    continue
+                event = events[i] = copy.copy(event)
+                event.old_value = first.old_value
+            last_set[key] = i
+        elif event_type in _ADD_DELETE_EVENTS:
+            key = (event_type, event.element, event.property, event.new_value)
+            last_add[key] = i
+        elif event_type in _DELETE_ADD_EVENTS:
+            key = (_DELETE_ADD_EVENTS[event_type], event.element,
+                   event.property, event.old_value)
+            j = last_add.pop(key, None)
+            if j is not None:
+                events[i] = events[j] = None
+
+    return [e for e in events if e is not None]
+
+
+class EventBatch(object):
+    """
+    Queue events and deliver them at the end of the batch. Batches can be
+    nested, events are delivered when the outermost batch ends.
+
+    Batches are created with ``component_registry.batch()`` and used with
+    the ``with`` statement.
+    """
+
+    def __init__(self, registry):
+        self._registry = registry
+
+    def __enter__(self):
+        self._registry._begin_batch()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._registry._end_batch()
 
 
 class ZopeComponentRegistry(object):
@@ -32,6 +115,19 @@ class ZopeComponentRegistry(object):
                                name='component_registry',
                                bases=(component.getGlobalSiteManager(),))
 
+        # Event dispatch cache: interface spec -> (handlers, filters).
+        # Handlers and filters may be registered on the global site
+        # manager as well, so the cache is validated against the
+        # generation of the adapter registry (which is also bumped if the
+        # global registry changes).
+        self._dispatch_cache = {}
+        self._dispatch_generation = None
+
+        # Event batches: queued events and handlers that accept a batch
+        self._batch_depth = 0
+        self._batch = None
+        self._batch_handlers = set()
+
         # Make sure component.handle() and query methods works.
         # TODO: eventually all queries should be done through the Application
         # instance.
@@ -121,6 +217,7 @@ class ZopeComponentRegistry(object):
         """
         self._components.registerSubscriptionAdapter(factory, adapts,
                               provides, event=False)
+        self._dispatch_cache.clear()
 
     def unregister_subscription_adapter(self, factory=None,
                           required=None, provided=None, name=u''):
@@ -129,6 +226,7 @@ class ZopeComponentRegistry(object):
         """
         self._components.unregisterSubscriptionAdapter(factory,
                               required, provided, name)
+        self._dispatch_cache.clear()
 
     def subscribers(self, objects, interface):
         return self._components.subscribers(objects, interface)
@@ -139,30 +237,121 @@ class ZopeComponentRegistry(object):
         events are emitted through the handle() method.
         """
         self._components.registerHandler(factory, adapts, event=False)
+        self._dispatch_cache.clear()
 
     def unregister_handler(self, factory=None, required=None):
         """
         Unregister a previously registered handler.
         """
         self._components.unregisterHandler(factory, required)
- 
-    def _filter(self, objects):
-        filtered = list(objects)
-        for o in objects:
-            for adapter in self._components.subscribers(objects, IEventFilter):
-                if adapter.filter():
-                    # event is blocked
-                    filtered.remove(o)
-                    break
-        return filtered
+        self._batch_handlers.discard(factory)
+        self._dispatch_cache.clear()
+
+    def register_batch_handler(self, factory, adapts=None):
+        """
+        Register a handler that can deal with a batch of events.
+
+        The handler is called as ``factory(*events)``: with one event
+        normally, and with all queued events it subscribes to when a batch
+        is delivered (see batch()).
+        """
+        self.register_handler(factory, adapts)
+        self._batch_handlers.add(factory)
+
+    def batch(self):
+        """
+        Return a context manager that queues events. At the end of the batch
+        redundant model change events are removed (see coalesce()) and the
+        remaining events are delivered.
+
+        Handlers registered on the global site manager (e.g. the ones that
+        keep the derived properties of the data model up to date) are still
+        called right away. Event filters are applied as events are queued.
+        """
+        return EventBatch(self)
+
+    def _begin_batch(self):
+        if not self._batch_depth:
+            self._batch = []
+        self._batch_depth += 1
+
+    def _end_batch(self):
+        self._batch_depth -= 1
+        if self._batch_depth:
+            return
+        events = coalesce(self._batch)
+        self._batch = None
+
+        batches = odict()
+        batch_handlers = self._batch_handlers
+        for event in events:
+            for handler in self._lookup(event)[2]:
+                if handler in batch_handlers:
+                    batches.setdefault(handler, []).append(event)
+                else:
+                    handler(event)
+        for handler, events in batches.iteritems():
+            handler(*events)
+
+    def _lookup(self, event):
+        """
+        Return a tuple (handlers, filters, deferred) for the event. Handlers
+        and event filters are looked up once per event class (interface
+        specification, to be precise). ``deferred`` contains the handlers
+        that are not registered on a base registry (the global site
+        manager).
+        """
+        adapters = self._components.adapters
+        if self._dispatch_generation != adapters._generation:
+            self._dispatch_cache.clear()
+            self._dispatch_generation = adapters._generation
+
+        spec = providedBy(event)
+        try:
+            return self._dispatch_cache[spec]
+        except KeyError:
+            required = (spec,)
+            handlers = tuple(adapters.subscriptions(required, None))
+            base = set()
+            for b in self._components.__bases__:
+                base.update(b.adapters.subscriptions(required, None))
+            entry = self._dispatch_cache[spec] = \
+                    (handlers,
+                     tuple(adapters.subscriptions(required, IEventFilter)),
+                     tuple(h for h in handlers if h not in base))
+            return entry
+
+    def _blocked(self, event, filters):
+        for factory in filters:
+            adapter = factory(event)
+            if adapter is not None and adapter.filter():
+                return True
+        return False
 
     def handle(self, *events):
         """
         Send event notifications to registered handlers.
+
+        Events are dispatched to the handlers directly. Event filters
+        are only checked if they're registered for the event (e.g. the
+        ElementChangedEventBlocker while the model is being flushed).
+        A blocked event is not dispatched.
+
+        Within a batch, only the handlers of the global site manager are
+        called. The event is queued for the other handlers.
         """
-        objects = self._filter(events)
-        if objects:
-            map(self._components.handle, events)
+        for event in events:
+            handlers, filters, deferred = self._lookup(event)
+            if filters and self._blocked(event, filters):
+                continue
+            if self._batch is not None:
+                self._batch.append(event)
+                for handler in handlers:
+                    if handler not in deferred:
+                        handler(event)
+                continue
+            for handler in handlers:
+                handler(event)
 
 
 # vim:sw=4:et:ai
@@ -6,12 +6,47 @@ from zope import interface, component
 from logging import getLogger
 from gaphor.core import inject
 from gaphor.interfaces import IService
-from gaphor.UML.interfaces import IElementChangeEvent, IModelFactoryEvent
+from gaphor.UML.interfaces import IElementChangeEvent, IModelFactoryEvent, \
+                                  IElementDeleteEvent
 from gaphor import UML
 from gaphor.UML.interfaces import IAssociationSetEvent,\
                                   IAssociationAddEvent,\
                                   IAssociationDeleteEvent
 
+
+# Compiled paths, shared by all dispatchers:
+# (element class, path): (property, ..)
+_plans = dict()
+
+# Steps of compiled paths:
+# (property, ..): (property, (remaining property, ..), multiplicity > 1)
+_steps = dict()
+
+
+def _compile_steps(props):
+    """
+    Register the steps for a tuple of properties. The remainders are shared
+    by all registrations of the same path.
+    """
+    remainder = ()
+    for prop in reversed(props):
+        step = (prop,) + remainder
+        if step not in _steps:
+            _steps[step] = (prop, remainder, prop.upper > 1)
+        remainder = step
+    return _steps[props]
+
+
+def _targets(element, property):
+    """
+    Return the elements referenced by element through property.
+    """
+    if property.upper > 1:
+        return property._get(element)
+    e = property._get(element)
+    return e and (e,) or ()
+
+
 class EventWatcher(object):
     """
     A helper for easy registering and unregistering event handlers.
@@ -108,6 +143,17 @@ class ElementDispatcher(object):
     This dispatcher keeps track of the kind of events that are dispatched. The
     dispatcher table is updated accordingly (so the right handlers are fired
     every time).
+
+    Each handler has an index of the (element, property) keys it is
+    registered for, and each element has an index of its properties with
+    handlers. Hence a handler can be removed from a key in constant time and
+    the handlers of deleted elements are removed right away. Use
+    statistics() to find handlers that are not unregistered.
+
+    A handler can be registered for a key through more than one path, e.g.
+    for 'ownedAttribute.type.name' when two attributes have the same type.
+    The number of registrations is counted, the handler is removed from the
+    key when the last one is removed.
     """
 
     interface.implements(IService)
@@ -117,20 +163,30 @@ class ElementDispatcher(object):
 
     def __init__(self):
         # Table used to fire events:
-        # (event.element, event.property): { handler: set(path, ..), ..}
+        # (event.element, event.property): { handler: (path, ..), ..}
         self._handlers = dict()
 
         # Fast resolution when handlers are disconnected
-        # handler: [(element, property), ..]
+        # handler: set((element, property), ..)
         self._reverse = dict()
 
+        # Properties with handlers, per element:
+        # element: set(property, ..)
+        self._elements = dict()
+
+        # Number of registrations of a handler for a key, if more than one:
+        # ((element, property), handler): count
+        self._counts = dict()
+
 
     def init(self, app):
         self.component_registry.register_handler(self.on_model_loaded)
         self.component_registry.register_handler(self.on_element_change_event)
+        self.component_registry.register_handler(self.on_element_delete_event)
 
 
     def shutdown(self):
+        self.component_registry.unregister_handler(self.on_element_delete_event)
         self.component_registry.unregister_handler(self.on_element_change_event)
         self.component_registry.unregister_handler(self.on_model_loaded)
 
@@ -156,7 +212,18 @@ class ElementDispatcher(object):
         ...         'guard.specification')) # doctest: +NORMALIZE_WHITESPACE
         ['<association guard: Constraint[0..1]>',
          "<attribute specification: <type 'str'>[0..1] = None>"]
+
+        Paths are compiled once per class:
+
+        >>> path = dispatcher._path_to_properties(UML.Class(), 'ownedOperation.name')
+        >>> path is dispatcher._path_to_properties(UML.Class(), 'ownedOperation.name')
+        True
         """
+        key = (type(element), path)
+        try:
+            return _plans[key]
+        except KeyError:
+            pass
         c = type(element)
         tpath = []
         for attr in path.split('.'):
@@ -171,7 +238,10 @@ class ElementDispatcher(object):
                 assert issubclass(c, prop.type), '%s should be a subclass of %s' % (c, prop.type)
             else:
                 c = prop.type
-        return tuple(tpath)
+        tpath = tuple(tpath)
+        _compile_steps(tpath)
+        _plans[key] = tpath
+        return tpath
 
 
     def _add_handlers(self, element, props, handler):
@@ -179,71 +249,110 @@ class ElementDispatcher(object):
         Provided an element and a path of properties (props), register the
         handler for each property.
         """
-        property, remainder = props[0], props[1:]
-        key = (element, property)
-        
-        # Register key
-        try:
-            handlers = self._handlers[key]
-        except KeyError:
-            handlers = dict()
-            self._handlers[key] = handlers
-
-        # Register handler and it's remaining paths
+        table = self._handlers
         try:
-            remainders = handlers[handler]
+            reverse = self._reverse[handler]
         except KeyError:
-            remainders = handlers[handler] = set()
-        if remainder:
-            remainders.add(remainder)
+            reverse = self._reverse[handler] = set()
 
-        # Also add them to the reverse table, easing disconnecting
-        try:
-            reverse = self._reverse[handler]       
-        except KeyError:
-            reverse = []
-            self._reverse[handler] = reverse
-
-        reverse.append(key)
+        todo = [(element, props)]
+        while todo:
+            element, props = todo.pop()
+            try:
+                property, remainder, multiple = _steps[props]
+            except KeyError:
+                property, remainder, multiple = _compile_steps(props)
+            key = (element, property)
 
-        # Apply remaining path
-        if remainder:
-            if property.upper > 1:
-                for e in property._get(element):
-                    self._add_handlers(e, remainder, handler)
+            # Register key
+            try:
+                handlers = table[key]
+            except KeyError:
+                handlers = table[key] = dict()
+                try:
+                    self._elements[element].add(property)
+                except KeyError:
+                    self._elements[element] = set([property])
+
+            # Register handler and it's remaining paths. The remainders are
+            # kept in a tuple, there is seldom more than one.
+            remainders = handlers.get(handler)
+            if remainders is None:
+                handlers[handler] = remainder and (remainder,) or ()
+                # Also add them to the reverse table, easing disconnecting
+                reverse.add(key)
             else:
-                e = property._get(element)
-                if e and remainder:
-                    self._add_handlers(e, remainder, handler)
+                count = (key, handler)
+                self._counts[count] = self._counts.get(count, 1) + 1
+                if not remainder or remainder in remainders:
+                    # The rest of the path is registered already
+                    continue
+                handlers[handler] = remainders + (remainder,)
+
+            # Apply remaining path
+            if remainder:
+                if multiple:
+                    for e in property._get(element):
+                        todo.append((e, remainder))
+                else:
+                    e = property._get(element)
+                    if e:
+                        todo.append((e, remainder))
 
 
     def _remove_handlers(self, element, property, handler):
         """
-        Remove the handler of the path of elements.
+        Remove a registration of the handler for element.property. Once
+        the last one is removed, the handler is removed from the path of
+        elements.
         """
         key = element, property
         handlers = self._handlers.get(key)
         if not handlers:
             return
 
-        if property.upper > 1:
-            for remainder in handlers.get(handler, ()):
-                for e in property._get(element):
-                    #log.debug(' Remove handler %s for key %s, element %s' % (handler, str(remainder[0].name), e))
-                    self._remove_handlers(e, remainder[0], handler)
-        else:
-            for remainder in handlers.get(handler, ()):
-                e = property._get(element)
-                if e:
-                    #log.debug('*Remove handler %s for key %s, element %s' % (handler, str(remainder[0].name), e))
-                    self._remove_handlers(e, remainder[0], handler)
+        count = self._counts.get((key, handler))
+        if count:
+            if count > 2:
+                self._counts[key, handler] = count - 1
+            else:
+                del self._counts[key, handler]
+            return
+
         try:
-            del handlers[handler]
+            remainders = handlers.pop(handler)
         except KeyError:
             self.logger.warning('Handler %s is not registered for %s.%s' % (handler, element, property))
-
+            return
+        self._discard_reverse(handler, key)
         if not handlers:
-            del self._handlers[key]
+            self._del_key(key)
+
+        if remainders:
+            elements = _targets(element, property)
+            for remainder in remainders:
+                for e in elements:
+                    self._remove_handlers(e, remainder[0], handler)
+
+
+    def _discard_reverse(self, handler, key):
+        reverse = self._reverse[handler]
+        reverse.discard(key)
+        if not reverse:
+            del self._reverse[handler]
+
+
+    def _del_key(self, key):
+        """
+        Remove a key from the handler table and the element index.
+        """
+        del self._handlers[key]
+        element, property = key
+        properties = self._elements.get(element)
+        if properties:
+            properties.discard(property)
+            if not properties:
+                del self._elements[element]
 
 
     def register_handler(self, handler, element, path):
@@ -266,23 +375,37 @@ class ElementDispatcher(object):
         #self.logger.debug('Handler is %s' % handler)
         
         try:
-            reverse = reversed(self._reverse[handler])
+            reverse = self._reverse.pop(handler)
         except KeyError:
             return
 
+        table = self._handlers
+        counts = self._counts
         for key in reverse:
-            try:
-                handlers = self._handlers[key]
-            except KeyError:
-                pass
-            else:
-                try:
-                    del handlers[handler]
-                except KeyError:
-                    pass
-                if not handlers:
-                    del self._handlers[key]
-        del self._reverse[handler]
+            handlers = table[key]
+            del handlers[handler]
+            if counts:
+                counts.pop((key, handler), None)
+            if not handlers:
+                self._del_key(key)
+
+
+    def statistics(self):
+        """
+        Return the number of registered handlers per element and per
+        property, as two dicts. Handlers that are registered for more than
+        one property of an element are counted once per property. This is
+        intended for debugging: elements that are deleted, or a steadily
+        growing number of handlers, point to watchers that are not
+        unregistered.
+        """
+        elements = dict()
+        properties = dict()
+        for (element, property), handlers in self._handlers.iteritems():
+            n = len(handlers)
+            elements[element] = elements.get(element, 0) + n
+            properties[property] = properties.get(property, 0) + n
+        return elements, properties
 
 
     @component.adapter(IElementChangeEvent)
@@ -309,7 +432,7 @@ class ElementDispatcher(object):
             # Handle add/removal of handlers based on the kind of event
             # Filter out handlers that have no remaining properties
             if IAssociationSetEvent.providedBy(event):
-                for handler, remainders in handlers.iteritems():
+                for handler, remainders in handlers.items():
                     if remainders and event.old_value:
                         for remainder in remainders:
                             self._remove_handlers(event.old_value, remainder[0], handler)
@@ -317,26 +440,58 @@ class ElementDispatcher(object):
                         for remainder in remainders:
                             self._add_handlers(event.new_value, remainder, handler)
             elif IAssociationAddEvent.providedBy(event):
-                for handler, remainders in handlers.iteritems():
+                for handler, remainders in handlers.items():
                     for remainder in remainders:
                         self._add_handlers(event.new_value, remainder, handler)
             elif IAssociationDeleteEvent.providedBy(event):
-                for handler, remainders in handlers.iteritems():
+                for handler, remainders in handlers.items():
                     for remainder in remainders:
                         self._remove_handlers(event.old_value, remainder[0], handler)
 
 
+    @component.adapter(IElementDeleteEvent)
+    def on_element_delete_event(self, event):
+        """
+        Remove the handlers registered for properties of a deleted element,
+        and the registrations they made further down their paths.
+        """
+        element = event.element
+        try:
+            properties = self._elements.pop(element)
+        except KeyError:
+            return
+        table = self._handlers
+        counts = self._counts
+        for property in properties:
+            key = (element, property)
+            handlers = table.pop(key, None)
+            if not handlers:
+                continue
+            for handler, remainders in handlers.iteritems():
+                self._discard_reverse(handler, key)
+                if counts:
+                    counts.pop((key, handler), None)
+                if remainders:
+                    elements = _targets(element, property)
+                    for remainder in remainders:
+                        for e in elements:
+                            self._remove_handlers(e, remainder[0], handler)
+
+
     @component.adapter(IModelFactoryEvent)
     def on_model_loaded(self, event):
-        
-        #self.logger.info('Handling IModelFactoryEvent')
-        #self.logger.debug('Event is %s' % event)
-        
-        for key, value in self._handlers.items():
-            for h, remainders in value.items():
-                for remainder in remainders:
-                    self._add_handlers(key[0], (key[1],) + remainder, h)
-#        for h in self._reverse.iterkeys():
-#            h(None)
+        """
+        Change events are blocked while a model is loaded. Resolve the
+        remaining paths of all keys, only the keys that are missing are
+        added. The paths of keys that are registered while the model is
+        loaded are not resolved yet, so they are counted once.
+        """
+        for (element, property), handlers in self._handlers.items():
+            for h, remainders in handlers.items():
+                if remainders:
+                    elements = _targets(element, property)
+                    for remainder in remainders:
+                        for e in elements:
+                            self._add_handlers(e, remainder, h)
 
 # vim:sw=4:et:ai
@@ -9,11 +9,10 @@ from zope import interface, component
 
 from gaphor.interfaces import IService, IActionProvider, IServiceEvent
 from gaphor.core import _, inject, action, build_action_group
-from gaphor.storage import storage, verify
+from gaphor.storage import storage, verify, incremental
 from gaphor import UML
 from gaphor.misc.gidlethread import GIdleThread, Queue, QueueEmpty
 from gaphor.misc.errorhandler import error_handler
-from gaphor.misc.xmlwriter import XMLWriter
 from gaphor.ui.statuswindow import StatusWindow
 from gaphor.ui.questiondialog import QuestionDialog
 from gaphor.ui.filedialog import FileDialog
@@ -87,6 +86,7 @@ class FileManager(object):
         """File manager constructor.  There is no current filename yet."""
 
         self._filename = None
+        self._dirty_tracker = None
 
     def init(self, app):
         """File manager service initialization.  The app parameter
@@ -109,10 +109,17 @@ class FileManager(object):
             
         self.update_recent_files()
 
+        # Keep track of changed elements, so only those have to be saved
+        self._dirty_tracker = incremental.DirtyTracker(self.component_registry)
+        self._dirty_tracker.connect()
+
     def shutdown(self):
         """Called when shutting down the file manager service."""
 
         self.logger.info('Shutting down')
+
+        if self._dirty_tracker:
+            self._dirty_tracker.disconnect()
         
     def get_filename(self):
         """Return the current file name.  This method is used by the filename
@@ -203,7 +210,11 @@ class FileManager(object):
         """Load the Gaphor model from the supplied file name.  A status window
         displays the loading progress.  The load generator updates the progress
         queue.  The loader is passed to a GIdleThread which executes the load
-        generator.  If loading is successful, the filename is set."""
+        generator.  If loading is successful, the filename is set.  Unless
+        the 'load-diagrams-lazily' property is false, diagrams are populated
+        when they are first used.  Unless the 'use-model-snapshots' property
+        is false, an up to date snapshot of the file is loaded instead of
+        parsing it (see gaphor.storage.snapshot)."""
 
         self.logger.info('Loading file')
         self.logger.debug('Path is %s' % filename)
@@ -220,7 +231,11 @@ class FileManager(object):
             status_window = None
 
         try:
-            loader = storage.load_generator(filename.encode('utf-8'), self.element_factory)
+            lazy = self.properties.get('load-diagrams-lazily', True)
+            use_snapshot = self.properties.get('use-model-snapshots', True)
+            loader = storage.load_generator(filename.encode('utf-8'),
+                                            self.element_factory, lazy,
+                                            use_snapshot=use_snapshot)
             worker = GIdleThread(loader, queue)
 
             worker.start()
@@ -230,6 +245,7 @@ class FileManager(object):
                 worker.reraise()
 
             self.filename = filename
+            self._dirty_tracker.clear()
         except:
             error_handler(message=_('Error while loading model from file %s') % filename)
             raise
@@ -242,7 +258,10 @@ class FileManager(object):
         """Verify that no orphaned elements are saved.  This method checks
         of there are any orphan references in the element factory.  If orphans
         are found, a dialog is displayed asking the user if it is OK to
-        unlink them."""
+        unlink them.  Returns False if the orphans have been unlinked, so
+        the model has changed.  The orphans are not part of the element
+        factory, so the whole model is checked.  While saving this is only
+        done once orphans have been found."""
         
         orphans = verify.orphan_references(self.element_factory)
         
@@ -261,7 +280,9 @@ class FileManager(object):
             if not answer:
                 for orphan in orphans:
                     orphan.unlink()
-                    
+                return False
+        return True
+
     def verify_filename(self, filename):
         """Verify that the supplied filename is using the proper default
         extension.  If not, the extension is added to the filename
@@ -277,7 +298,7 @@ class FileManager(object):
 
     def save(self, filename):
         """Save the current UML model to the specified file name.  Before
-        writing the model file, this will verify that there are no orphan
+        replacing the model file, this will verify that there are no orphan
         references.  It will also verify that the filename has the correct
         extension.  A status window is displayed while the GIdleThread
         is executed.  This thread actually saves the model."""
@@ -288,7 +309,6 @@ class FileManager(object):
         if not filename or not len(filename):
             return
 
-        self.verify_orphans()
         filename = self.verify_filename(filename)
 
         main_window = self.main_window
@@ -297,18 +317,27 @@ class FileManager(object):
                                      _('Saving model to %s') % filename,\
                                      parent=main_window.window,\
                                      queue=queue)
+        # Only save the changed elements if the model is saved to the file
+        # it was loaded from (or saved to before)
+        dirty = None
+        if filename == self.filename:
+            dirty = self._dirty_tracker.dirty(self.element_factory)
+
         try:
-            with open(filename.encode('utf-8'), 'w') as out:
-                saver = storage.save_generator(XMLWriter(out), self.element_factory)
-                worker = GIdleThread(saver, queue)
-                worker.start()
-                worker.wait()
+            saver = incremental.save_generator(filename.encode('utf-8'),
+                                               self.element_factory, dirty,
+                                               verify=lambda orphan_ids:
+                                                   self.verify_orphans())
+            worker = GIdleThread(saver, queue)
+            worker.start()
+            worker.wait()
             
             if worker.error:
                 worker.reraise()
                 
             
             self.filename = filename
+            self._dirty_tracker.clear()
         except:
             error_handler(message=_('Error while saving model to file %s') % filename)
             raise
@@ -2,25 +2,56 @@
 Test the backup service.
 """
 
+import os
+import shutil
+import tempfile
 import unittest
 from StringIO import StringIO
 from gaphor.storage import storage
 from gaphor.application import Application
 from gaphor.misc.xmlwriter import XMLWriter
+from gaphor.services.backupservice import BACKUP_EXT
 
-#class BackupServiceTestCase(unittest.TestCase):
-class BackupServiceTestCase:
+class BackupPicklerTestCase(unittest.TestCase):
 
-    services = ['element_factory', 'backup_service']
+    def test_pickle_model(self):
+        import pickle
+        from gaphor import UML
+        from gaphor.services.backupservice import MyPickler
+        factory = UML.ElementFactory()
+        p = factory.create(UML.Package)
+        c = factory.create(UML.Class)
+        c.package = p
+        c.ownedAttribute = factory.create(UML.Property)
+        c.ownedAttribute[0].name = 'a'
+
+        f = StringIO()
+        MyPickler(f).dump(factory.lselect())
+        elements = pickle.loads(f.getvalue())
+
+        self.assertEquals(sorted(e.id for e in factory.lselect()),
+                          sorted(e.id for e in elements))
+        c = [e for e in elements if isinstance(e, UML.Class)][0]
+        assert c.package in elements
+        self.assertEquals('a', c.ownedAttribute[0].name)
+
+
+class BackupServiceTestCase(unittest.TestCase):
+
+    services = ['element_factory', 'adapter_loader', 'element_dispatcher',
+                'sanitizer', 'properties', 'backup_service']
 
     def setUp(self):
         Application.init(services=self.services)
         self.element_factory = Application.get_service('element_factory')
         self.backup_service = Application.get_service('backup_service')
+        self.backup_dir = tempfile.mkdtemp()
+        self.backup_service.backup_dir = self.backup_dir
 
     def tearDown(self):
         Application.shutdown()
-        
+        shutil.rmtree(self.backup_dir)
+
     def save_and_load(self, filename):
         factory = self.element_factory
 
@@ -35,7 +66,7 @@ class BackupServiceTestCase:
         orig = StringIO()
         storage.save(XMLWriter(orig), factory=self.element_factory)
 
-        self.backup_service.restore()
+        self.backup_service.restore(self.backup_service.filename)
 
         restored = map(factory.lookup, factory.keys())
 
@@ -50,6 +81,150 @@ class BackupServiceTestCase:
         assert len(orig) == len(copy)
         #assert orig == copy, orig + ' != ' + copy
 
+    def test_changed_elements(self):
+        from gaphor import UML
+        factory = self.element_factory
+        service = self.backup_service
+        p = factory.create(UML.Package)
+        for i in range(10):
+            factory.create(UML.Class).package = p
+        service.backup()
+        assert not service._needed()
+
+        c = factory.create(UML.Class)
+        c.name = 'new'
+        p.ownedClassifier[0].unlink()
+        assert service._needed()
+
+        # One slice per element: the new class, the deleted class and the
+        # package that owned it
+        self.assertEquals(3, len(list(service.backup_generator(slice=0))))
+        self.assertEquals(sorted(factory.keys()),
+                          sorted(service._fragments.keys()))
+
+        service.backup()
+        service.restore(service.filename)
+        self.assertEquals(['new'], [e.name for e in factory.select(
+                lambda e: e.isKindOf(UML.Class) and e.name)])
+
+    def test_flush(self):
+        from gaphor import UML
+        factory = self.element_factory
+        service = self.backup_service
+        for i in range(10):
+            factory.create(UML.Class)
+        generator = service.backup_generator(slice=0)
+        generator.next()
+        factory.flush()
+        self.assertEquals([], list(generator))
+        assert not service._fragments
+
+    def test_backups(self):
+        from gaphor import UML
+        service = self.backup_service
+        self.element_factory.create(UML.Class)
+        service.backup()
+        assert os.path.exists(service.filename)
+        self.assertEquals([], service.backups())
+
+        other = os.path.join(service.backup_dir, '0' + BACKUP_EXT)
+        shutil.copy(service.filename, other)
+        self.assertEquals([other], service.backups())
+
+        Application.shutdown()
+        assert not os.path.exists(service.filename)
+        assert os.path.exists(other)
+        Application.init(services=self.services)
+
+    def test_running_sessions(self):
+        from gaphor import UML
+        service = self.backup_service
+        self.element_factory.create(UML.Class)
+        service.backup()
+
+        # The backup of a session that is still running
+        live = os.path.join(service.backup_dir,
+                            '%d%s' % (os.getppid(), BACKUP_EXT))
+        shutil.copy(service.filename, live)
+        self.assertEquals([], service.backups())
+        service._offer_recovery()
+        assert os.path.exists(live)
+
+    def make_leftovers(self):
+        """
+        Make backups of two sessions that are no longer running. The
+        newest backup contains a class named 'new', the other one a class
+        named 'old'.
+        """
+        from gaphor import UML
+        service = self.backup_service
+        c = self.element_factory.create(UML.Class)
+        leftovers = []
+        for i, name in enumerate(['old', 'new']):
+            c.name = name
+            service.backup()
+            filename = os.path.join(service.backup_dir,
+                                    '%d%s' % (999999998 + i, BACKUP_EXT))
+            os.rename(service.filename, filename)
+            os.utime(filename, (1000 + i, 1000 + i))
+            leftovers.insert(0, filename)
+        self.assertEquals(leftovers, service.backups())
+        self.element_factory.flush()
+        return leftovers
+
+    def class_names(self):
+        from gaphor import UML
+        return [c.name for c in self.element_factory.select(
+                lambda e: e.isKindOf(UML.Class))]
+
+    def test_recover(self):
+        service = self.backup_service
+        new, old = self.make_leftovers()
+        service._ask_recovery = lambda filename: True
+        service._offer_recovery()
+
+        self.assertEquals(['new'], self.class_names())
+        # The recovered backup is kept until it is replaced, the other one
+        # is left alone
+        assert not os.path.exists(new)
+        assert os.path.exists(service.filename)
+        self.assertEquals([old], service.backups())
+
+    def test_decline_recovery(self):
+        service = self.backup_service
+        new, old = self.make_leftovers()
+        answers = [False, True]
+        service._ask_recovery = lambda filename: answers.pop(0)
+        service._offer_recovery()
+
+        self.assertEquals(['old'], self.class_names())
+        assert not os.path.exists(new)
+        self.assertEquals([], service.backups())
+
+    def test_lazy_diagrams(self):
+        from gaphor import UML
+        from gaphor.diagram import items
+        factory = self.element_factory
+        service = self.backup_service
+        diagram = factory.create(UML.Diagram)
+        for i in range(3):
+            diagram.create(items.ClassItem, subject=factory.create(UML.Class))
+        filename = os.path.join(self.backup_dir, 'model.gaphor')
+        f = open(filename, 'w')
+        storage.save(XMLWriter(f), factory=factory)
+        f.close()
+        storage.load(filename, factory, lazy=True)
+
+        # Lazily loaded diagrams are not loaded for a backup
+        service.backup()
+        diagram = factory.lselect(lambda e: e.isKindOf(UML.Diagram))[0]
+        assert not diagram.canvas.materialized
+
+        service.restore(service.filename)
+        diagram = factory.lselect(lambda e: e.isKindOf(UML.Diagram))[0]
+        self.assertEquals(3, len(diagram.canvas.get_all_items()))
+        for c in factory.select(lambda e: e.isKindOf(UML.Class)):
+            self.assertEquals(1, len(c.presentation))
 
     def test_simple(self):
         self.save_and_load('test-diagrams/simple-items.gaphor')
@@ -64,9 +239,6 @@ class BackupServiceTestCase:
     def test_interactions(self):
         self.save_and_load('test-diagrams/interactions.gaphor')
 
-    def test_bicycle(self):
-        self.save_and_load('test-diagrams/bicycle.gaphor')
-
     def test_line_align(self):
         self.save_and_load('test-diagrams/line-align.gaphor')
 
@@ -0,0 +1,135 @@
+
+import unittest
+from zope import component
+
+from gaphor import UML
+from gaphor.UML.interfaces import IElementChangeEvent, IAttributeChangeEvent
+from gaphor.UML.event import AttributeChangeEvent, AssociationAddEvent, \
+        AssociationDeleteEvent
+from gaphor.UML.elementfactory import ElementChangedEventBlocker
+from gaphor.services.componentregistry import ZopeComponentRegistry, \
+        coalesce
+
+
+class ComponentRegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._handle = component.handle
+        self.registry = ZopeComponentRegistry()
+        self.registry.init(None)
+        self.events = []
+
+    def tearDown(self):
+        self.registry.shutdown()
+        component.handle = self._handle
+
+    def _event(self):
+        c = UML.Class()
+        return AttributeChangeEvent(c, UML.Class.name, None, 'name')
+
+    def test_handle(self):
+        @component.adapter(IElementChangeEvent)
+        def handler(event):
+            self.events.append(event)
+
+        event = self._event()
+        self.registry.handle(event)
+        assert self.events == []
+
+        # Registration after the first dispatch should be picked up
+        self.registry.register_handler(handler)
+        self.registry.handle(event)
+        assert self.events == [event], self.events
+
+        self.registry.unregister_handler(handler)
+        self.registry.handle(event)
+        assert self.events == [event], self.events
+
+    def test_handle_global_handler(self):
+        @component.adapter(IAttributeChangeEvent)
+        def handler(event):
+            self.events.append(event)
+
+        event = self._event()
+        self.registry.handle(event)
+
+        component.provideHandler(handler)
+        try:
+            self.registry.handle(event)
+        finally:
+            component.getGlobalSiteManager().unregisterHandler(handler)
+        self.registry.handle(event)
+        assert self.events == [event], self.events
+
+    def test_filter(self):
+        @component.adapter(IElementChangeEvent)
+        def handler(event):
+            self.events.append(event)
+
+        self.registry.register_handler(handler)
+        event = self._event()
+
+        self.registry.register_subscription_adapter(ElementChangedEventBlocker)
+        self.registry.handle(event)
+        assert self.events == []
+
+        self.registry.unregister_subscription_adapter(ElementChangedEventBlocker)
+        self.registry.handle(event)
+        assert self.events == [event], self.events
+
+    def test_batch(self):
+        @component.adapter(IElementChangeEvent)
+        def handler(event):
+            self.events.append(event)
+
+        self.registry.register_handler(handler)
+        c = UML.Class()
+        e1 = AttributeChangeEvent(c, UML.Class.name, None, 'a')
+        e2 = AttributeChangeEvent(c, UML.Class.name, 'a', 'b')
+
+        with self.registry.batch():
+            self.registry.handle(e1)
+            self.registry.handle(e2)
+            assert self.events == []
+
+        assert len(self.events) == 1, self.events
+        assert self.events[0].old_value is None
+        assert self.events[0].new_value == 'b'
+
+    def test_batch_handler(self):
+        @component.adapter(IElementChangeEvent)
+        def handler(*events):
+            self.events.append(events)
+
+        self.registry.register_batch_handler(handler)
+        c = UML.Class()
+        e1 = AttributeChangeEvent(c, UML.Class.name, None, 'a')
+        e2 = AttributeChangeEvent(c, UML.Class.visibility, None, 'b')
+
+        self.registry.handle(e1)
+        assert self.events == [(e1,)], self.events
+
+        with self.registry.batch():
+            self.registry.handle(e1, e2)
+        assert self.events == [(e1,), (e1, e2)], self.events
+
+        self.registry.unregister_handler(handler)
+        assert not self.registry._batch_handlers
+
+    def test_coalesce(self):
+        c = UML.Class()
+        p = UML.Property()
+        e1 = AttributeChangeEvent(c, UML.Class.name, None, 'a')
+        e2 = AssociationAddEvent(c, UML.Class.ownedAttribute, p)
+        e3 = AttributeChangeEvent(c, UML.Class.name, 'a', None)
+        e4 = AssociationDeleteEvent(c, UML.Class.ownedAttribute, p)
+        e5 = AssociationAddEvent(c, UML.Class.ownedAttribute, p)
+
+        assert coalesce([e1, e3]) == []
+        assert coalesce([e2, e4]) == []
+        assert coalesce([e2, e4, e5]) == [e5]
+        assert coalesce([e4, e5]) == [e4, e5]
+        assert coalesce([e1, e2]) == [e1, e2]
+
+
+# vim:sw=4:et:ai
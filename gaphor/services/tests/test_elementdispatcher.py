@@ -190,6 +190,101 @@ class ElementDispatcherTestCase(TestCase):
         assert len(self.events) == 2, self.events
 
 
+    def test_shared_paths(self):
+        """
+        The remaining paths of elements of the same class are shared.
+        """
+        dispatcher = self.dispatcher
+        c1 = UML.Class()
+        c2 = UML.Class()
+        c1.ownedOperation = UML.Operation()
+        c2.ownedOperation = UML.Operation()
+        dispatcher.register_handler(self._handler, c1, 'ownedOperation.name')
+        dispatcher.register_handler(self._handler, c2, 'ownedOperation.name')
+
+        r1 = dispatcher._handlers[c1, UML.Class.ownedOperation][self._handler]
+        r2 = dispatcher._handlers[c2, UML.Class.ownedOperation][self._handler]
+        self.assertEquals(((UML.Operation.name,),), r1)
+        assert r1[0] is r2[0]
+
+        c2.ownedOperation[0].name = 'op'
+        self.assertEquals(1, len(self.events))
+
+
+    def test_reverse_index(self):
+        """
+        The keys of a handler are recorded once, also if the paths are
+        resolved again.
+        """
+        dispatcher = self.dispatcher
+        element = UML.Class()
+        o = element.ownedOperation = UML.Operation()
+        dispatcher.register_handler(self._handler, element, 'ownedOperation.name')
+        dispatcher.register_handler(self._handler, element, 'ownedOperation.name')
+        self.assertEquals(set([(element, UML.Class.ownedOperation),
+                               (o, UML.Operation.name)]),
+                          dispatcher._reverse[self._handler])
+
+        del element.ownedOperation[o]
+        self.assertEquals(set([(element, UML.Class.ownedOperation)]),
+                          dispatcher._reverse[self._handler])
+        assert o not in dispatcher._elements
+
+        dispatcher.unregister_handler(self._handler)
+        assert not dispatcher._handlers
+        assert not dispatcher._reverse
+        assert not dispatcher._elements
+
+
+    def test_shared_target(self):
+        """
+        A handler stays registered for an element as long as a path leads
+        to it.
+        """
+        dispatcher = self.dispatcher
+        element = UML.Class()
+        t = UML.Class()
+        p1 = UML.Property()
+        p2 = UML.Property()
+        p1.type = p2.type = t
+        element.ownedAttribute = p1
+        element.ownedAttribute = p2
+        dispatcher.register_handler(self._handler, element, 'ownedAttribute.type.name')
+        self.assertEquals(2, dispatcher._counts[(t, UML.Class.name), self._handler])
+
+        del element.ownedAttribute[p1]
+        t.name = 'T'
+        self.assertEquals(2, len(self.events))
+        assert self.events[-1].element is t
+
+        del element.ownedAttribute[p2]
+        t.name = 'U'
+        self.assertEquals(3, len(self.events))
+        assert t not in dispatcher._elements
+        assert not dispatcher._counts
+
+        dispatcher.unregister_handler(self._handler)
+        assert not dispatcher._handlers
+        assert not dispatcher._reverse
+
+
+    def test_statistics(self):
+        dispatcher = self.dispatcher
+        element = UML.Class()
+        o = element.ownedOperation = UML.Operation()
+        dispatcher.register_handler(self._handler, element, 'ownedOperation.name')
+        dispatcher.register_handler(self._handler, element, 'name')
+        def handler(event):
+            pass
+        dispatcher.register_handler(handler, o, 'name')
+
+        elements, properties = dispatcher.statistics()
+        self.assertEquals({ element: 2, o: 2 }, elements)
+        # Class.name and Operation.name are both NamedElement.name
+        self.assertEquals({ UML.Class.ownedOperation: 1,
+                            UML.NamedElement.name: 3 }, properties)
+
+
 
 from gaphor.UML import Element
 from gaphor.UML.properties import association
@@ -407,5 +502,25 @@ class ElementDispatcherAsServiceTestCase(TestCase):
         self.assertEquals(1, len(self.dispatcher._handlers))
 
 
+    def test_delete_element(self):
+        """
+        Handlers are removed when the element they watch is deleted.
+        """
+        dispatcher = self.dispatcher
+        c = self.element_factory.create(UML.Class)
+        dispatcher.register_handler(self._handler, c, 'name')
+        dispatcher.register_handler(self._handler, c, 'ownedOperation.name')
+        assert (c, UML.Class.name) in dispatcher._handlers
+
+        c.unlink()
+        elements, properties = dispatcher.statistics()
+        assert c not in elements, elements
+        assert c not in dispatcher._elements
+        assert self._handler not in dispatcher._reverse
+
+        # No harm done:
+        dispatcher.unregister_handler(self._handler)
+
+
 
 # vim: sw=4:et:ai
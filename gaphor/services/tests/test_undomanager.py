@@ -379,6 +379,158 @@ class TestUndoManager(TestCase):
         
         undo_manager.shutdown()
 
+    def test_coalesce_changes(self):
+        from zope import component
+        from gaphor.UML import Class, Package
+        from gaphor.services.undomanager import UndoManagerStateChanged
+        undo_manager = UndoManager()
+        undo_manager.init(Application)
+
+        events = []
+        @component.adapter(UndoManagerStateChanged)
+        def handler(event):
+            events.append(event)
+        compreg = Application.get_service('component_registry')
+        compreg.register_handler(handler)
+        try:
+            c = Class()
+            p1 = Package()
+            p2 = Package()
+            with Transaction():
+                for i in range(10):
+                    c.name = 'name%d' % i
+                    c.package = i % 2 and p1 or p2
+            assert len(events) == 1, events
+
+            # Only the first name change is recorded
+            actions = undo_manager._undo_stack[-1]._actions
+            assert len([a for a in actions if a[1] is Class.name]) == 1, actions
+            assert c.name == 'name9'
+            assert c.package is p1
+
+            undo_manager.undo_transaction()
+            assert c.name is None
+            assert c.package is None
+            assert not p1.ownedClassifier
+            assert not p2.ownedClassifier
+
+            undo_manager.redo_transaction()
+            assert c.name == 'name9'
+            assert c.package is p1
+            assert list(p1.ownedClassifier) == [c]
+            assert not p2.ownedClassifier
+        finally:
+            compreg.unregister_handler(handler)
+            undo_manager.shutdown()
+
+    def test_memory_limit(self):
+        from gaphor.UML import Class, Package
+        from gaphor.services.undomanager import SpilledTransaction
+        undo_manager = UndoManager()
+        undo_manager.init(Application)
+        undo_manager.memory_limit = 0
+
+        c = Class()
+        p = Package()
+        for i in range(3):
+            with Transaction():
+                c.name = 'name%d' % i
+                c.package = i % 2 and p or None
+
+        # All transactions are moved to the journal
+        assert len(undo_manager._undo_stack) == 3
+        for tx in undo_manager._undo_stack:
+            assert isinstance(tx, SpilledTransaction), tx
+        assert undo_manager._journal.size > 0
+
+        undo_manager.undo_transaction()
+        assert c.name == 'name1'
+        assert c.package is p
+        undo_manager.undo_transaction()
+        assert c.name == 'name0'
+        assert c.package is None
+        assert isinstance(undo_manager._redo_stack[-1], SpilledTransaction)
+
+        undo_manager.redo_transaction()
+        undo_manager.redo_transaction()
+        assert c.name == 'name2'
+        assert c.package is None
+        assert not undo_manager.can_redo()
+
+        # Old transactions are dropped if the journal is full
+        undo_manager.journal_limit = 0
+        with Transaction():
+            c.name = 'name3'
+        assert not undo_manager.can_undo()
+        assert undo_manager._journal.size == 0
+
+        undo_manager.shutdown()
+
+
+    def test_deleted_elements_limit(self):
+        from gaphor.UML import Class
+        from gaphor.services.undomanager import SpilledTransaction
+        ef = self.element_factory
+        undo_manager = UndoManager()
+        undo_manager.init(Application)
+
+        classes = [ef.create(Class) for i in range(3)]
+        for c in classes:
+            with Transaction():
+                c.unlink()
+        pinned = undo_manager._undo_stack[-1].pinned
+        assert pinned > 0
+
+        # Spilling does not free the deleted elements
+        undo_manager.memory_limit = 3 * pinned
+        undo_manager._limit_history()
+        assert len(undo_manager._undo_stack) == 3
+        for tx in undo_manager._undo_stack:
+            assert isinstance(tx, SpilledTransaction), tx
+            assert tx.size == pinned
+
+        # The oldest transactions are dropped to free them, but the last
+        # one is kept
+        undo_manager.memory_limit = 0
+        undo_manager._limit_history()
+        assert len(undo_manager._undo_stack) == 1
+
+        undo_manager.undo_transaction()
+        assert ef.lookup(classes[2].id) is classes[2]
+        assert not undo_manager.can_undo()
+
+        undo_manager.shutdown()
+
+    def test_deleted_items_size(self):
+        from gaphor.diagram.items import ClassItem
+        undo_manager = UndoManager()
+        undo_manager.init(Application)
+
+        item = self.create(ClassItem)
+        with Transaction():
+            item.unlink()
+        assert undo_manager._undo_stack[-1].pinned > 0
+
+        undo_manager.shutdown()
+
+    def test_depth_limit(self):
+        from gaphor.UML import Class
+        undo_manager = UndoManager()
+        undo_manager.init(Application)
+        undo_manager.depth_limit = 2
+
+        c = Class()
+        for i in range(4):
+            with Transaction():
+                c.name = 'name%d' % i
+        assert len(undo_manager._undo_stack) == 2
+
+        undo_manager.undo_transaction()
+        undo_manager.undo_transaction()
+        assert c.name == 'name1'
+        assert not undo_manager.can_undo()
+
+        undo_manager.shutdown()
 
 
 # vim:sw=4:et:ai
@@ -4,17 +4,38 @@ Undo management for Gaphor.
 
 Undoing and redoing actions is managed through the UndoManager.
 
-An undo action should be a callable object (called with no arguments).
-
-An undo action should return a callable object that acts as redo function.
-If None is returned the undo action is considered to be the redo action as well.
+An undo action should be a callable object (called with no arguments), or
+a tuple (function, arg1, arg2, ...). In the latter case function is called
+with the arguments. Tuples take a lot less memory than closures, so the undo
+handlers for model and canvas changes record tuples.
+
+Undo actions are themselves performed in a transaction, so the changes they
+make are recorded for redo.
+
+The undo history is bounded by an estimated memory budget (property
+``undo-memory-limit``, in bytes). The oldest transactions beyond that budget
+are written to a journal, a temporary file, and read back when they are
+undone or redone. The journal itself is bounded by ``undo-journal-limit``;
+the oldest transactions are forgotten when it grows beyond that size.
+
+Deleted elements and diagram items are only referenced by the undo actions
+that restore them. They stay in memory when a transaction is spilled, so
+their size is counted separately. If they alone exceed the memory budget,
+the oldest transactions are forgotten. As a backstop, no more than
+``undo-depth-limit`` transactions are kept.
 
 NOTE: it would be nice to use actions in conjunction with functools.partial.
 """
 
+import sys
+import tempfile
+import cPickle as pickle
+from cStringIO import StringIO
+
 from zope import interface, component
 
 from gaphas import state
+from gaphas.canvas import Canvas
 
 from gaphor.core import inject
 from logging import getLogger
@@ -22,6 +43,7 @@ from gaphor.interfaces import IService, IServiceEvent, IActionProvider
 from gaphor.event import TransactionBegin, TransactionCommit, TransactionRollback
 from gaphor.transaction import Transaction, transactional
 
+from gaphor.UML.element import slotstate
 from gaphor.UML.event import ElementCreateEvent, ElementDeleteEvent, \
                              ModelFactoryEvent, AssociationSetEvent, \
                              AssociationAddEvent, AssociationDeleteEvent
@@ -31,6 +53,43 @@ from gaphor.UML.interfaces import IElementDeleteEvent, \
 
 from gaphor.action import action, build_action_group
 from gaphor.event import ActionExecuted
+from gaphor.services.properties import IPropertyChangeEvent
+
+# Immutable types that are written to the journal by value. All other
+# objects (model elements, diagram items, functions, mutable containers) may
+# be shared with the model, they are kept in memory and referenced from the
+# journal.
+_VALUE_TYPES = (str, unicode, int, long, float, bool, type(None), tuple)
+
+
+def _value_size(value):
+    """
+    Estimate the memory taken by a value recorded in an undo action.
+    Objects that may be shared with the model are not counted.
+    """
+    t = type(value)
+    if t is tuple:
+        return sys.getsizeof(value) + sum(map(_value_size, value))
+    elif t in _VALUE_TYPES:
+        return sys.getsizeof(value)
+    return 0
+
+
+def _object_size(obj):
+    """
+    Estimate the memory taken by a deleted element or diagram item: the
+    object itself and the values it holds.
+    """
+    state = dict(getattr(obj, '__dict__', None) or {})
+    size = sys.getsizeof(obj) + sys.getsizeof(state)
+    state.update(slotstate(obj))
+    for value in state.itervalues():
+        size += _value_size(value) or sys.getsizeof(value)
+    return size
+
+
+# The function restoring a diagram item that is removed from its canvas
+_canvas_add = Canvas.add.im_func
 
 
 class ActionStack(object):
@@ -42,23 +101,177 @@ class ActionStack(object):
     typically undo actions performed by the user.
     """
 
-    def __init__(self):
-        self._actions = []
+    def __init__(self, actions=None, deleted=None):
+        self._actions = actions or []
+        self._deleted = deleted or []
+        self._changed = set()
+        self.size = 0
+        self.pinned = 0
 
     def add(self, action):
         self._actions.append(action)
 
+    def add_deleted(self, action, obj):
+        """
+        Add an action that restores deleted object @obj. The object is only
+        referenced by this transaction from now on.
+        """
+        self._actions.append(action)
+        self._deleted.append(obj)
+
+    def add_change(self, action, element, property):
+        """
+        Add an action that restores the value of a property. Only the first
+        change of a property is recorded, since undoing that one restores
+        the value the property had before the transaction.
+        """
+        key = (id(element), property)
+        if key not in self._changed:
+            self._changed.add(key)
+            self._actions.append(action)
+
     def can_execute(self):
         return self._actions and True or False
 
+    def close(self):
+        """
+        Called when the transaction is committed. The estimated size of
+        the deleted objects is stored in ``pinned``, ``size`` holds that
+        plus the estimated size of the actions.
+        """
+        self._changed = None
+        self.pinned = sum(map(_object_size, self._deleted))
+        self.size = self.pinned + sys.getsizeof(self._actions) + \
+                sum(map(_value_size, self._actions))
+
     @transactional
     def execute(self):
         self._actions.reverse()
         for action in self._actions:
             try:
-                action()
+                if type(action) is tuple:
+                    action[0](*action[1:])
+                else:
+                    action()
             except Exception, e:
-                log.error('Error while undoing action %s' % action, exc_info=True)
+                log.error('Error while undoing action %s' % (action,), exc_info=True)
+
+
+class SpilledTransaction(object):
+    """
+    A transaction that has been written to the undo journal. Objects that
+    are not written by value are kept in ``refs``. The deleted objects
+    restored by the transaction are still in memory: ``size`` is their
+    estimated size.
+    """
+
+    def __init__(self, offset, length, refs, deleted, size):
+        self.offset = offset
+        self.length = length
+        self.refs = refs
+        self.deleted = deleted
+        self.size = self.pinned = size
+
+
+class UndoJournal(object):
+    """
+    Storage for transactions that do not fit in the memory budget of the
+    undo manager. Transactions are pickled to a temporary file. Only
+    strings, numbers and tuples are stored by value, other objects are
+    stored as a reference to the object.
+
+    Space of transactions that are read back or discarded is reused once
+    the journal is empty. The file is compacted if more than half of it
+    is unused.
+    """
+
+    compact_size = 1024 * 1024
+
+    def __init__(self):
+        self._file = None
+        self._end = 0
+        self._entries = set()
+        self.size = 0
+
+    def spill(self, transaction):
+        """
+        Write @transaction to the journal and return a SpilledTransaction.
+        """
+        if not self._file:
+            self._file = tempfile.TemporaryFile(prefix='gaphor-undo')
+        refs = []
+        ids = {}
+        def persistent_id(obj):
+            if type(obj) in _VALUE_TYPES:
+                return None
+            try:
+                return ids[id(obj)]
+            except KeyError:
+                ids[id(obj)] = n = len(refs)
+                refs.append(obj)
+                return n
+
+        data = StringIO()
+        pickler = pickle.Pickler(data, pickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = persistent_id
+        pickler.dump(tuple(transaction._actions))
+        data = data.getvalue()
+
+        f = self._file
+        f.seek(self._end)
+        f.write(data)
+        entry = SpilledTransaction(self._end, len(data), refs,
+                                   transaction._deleted, transaction.pinned)
+        self._end += len(data)
+        self._entries.add(entry)
+        self.size += len(data)
+        return entry
+
+    def load(self, entry):
+        """
+        Read a spilled transaction back and remove it from the journal.
+        """
+        f = self._file
+        f.seek(entry.offset)
+        unpickler = pickle.Unpickler(StringIO(f.read(entry.length)))
+        unpickler.persistent_load = entry.refs.__getitem__
+        transaction = ActionStack(list(unpickler.load()), entry.deleted)
+        self.discard(entry)
+        transaction.close()
+        return transaction
+
+    def discard(self, entry):
+        """
+        Forget a spilled transaction. The file is truncated once it
+        contains no more transactions.
+        """
+        self._entries.discard(entry)
+        self.size -= entry.length
+        entry.refs = entry.deleted = None
+        if not self._entries:
+            self._file.truncate(0)
+            self._end = 0
+        elif self._end - self.size > max(self.size, self.compact_size):
+            self._compact()
+
+    def _compact(self):
+        old = self._file
+        self._file = f = tempfile.TemporaryFile(prefix='gaphor-undo')
+        offset = 0
+        for entry in sorted(self._entries, key=lambda e: e.offset):
+            old.seek(entry.offset)
+            f.write(old.read(entry.length))
+            entry.offset = offset
+            offset += entry.length
+        old.close()
+        self._end = offset
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        self._entries.clear()
+        self._end = self.size = 0
 
 
 class UndoManagerStateChanged(object):
@@ -106,14 +319,19 @@ class UndoManager(object):
     """
     
     component_registry = inject('component_registry')
+    properties = inject('properties')
 
     logger = getLogger('UndoManager')
 
+    memory_limit = 16 * 1024 * 1024
+    journal_limit = 256 * 1024 * 1024
+    depth_limit = 1000
+
     def __init__(self):
         self._undo_stack = []
         self._redo_stack = []
-        self._stack_depth = 20
         self._current_transaction = None
+        self._journal = UndoJournal()
         self.action_group = build_action_group(self)
 
 
@@ -126,7 +344,9 @@ class UndoManager(object):
         self.component_registry.register_handler(self.commit_transaction)
         self.component_registry.register_handler(self.rollback_transaction)
         self.component_registry.register_handler(self._action_executed)
+        self.component_registry.register_handler(self._property_changed)
         self._register_undo_handlers()
+        self._read_limits()
         self._action_executed()
 
 
@@ -139,16 +359,96 @@ class UndoManager(object):
         self.component_registry.unregister_handler(self.commit_transaction)
         self.component_registry.unregister_handler(self.rollback_transaction)
         self.component_registry.unregister_handler(self._action_executed)
+        self.component_registry.unregister_handler(self._property_changed)
         self._unregister_undo_handlers()
+        self._journal.close()
 
 
     def clear_undo_stack(self):
+        self._discard(self._undo_stack)
         self._undo_stack = []
         self._current_transaction = None
 
 
     def clear_redo_stack(self):
+        self._discard(self._redo_stack)
         del self._redo_stack[:]
+
+
+    def _read_limits(self):
+        try:
+            properties = self.properties
+        except component.interfaces.ComponentLookupError:
+            return
+        self.memory_limit = properties.get('undo-memory-limit',
+                                           UndoManager.memory_limit)
+        self.journal_limit = properties.get('undo-journal-limit',
+                                            UndoManager.journal_limit)
+        self.depth_limit = properties.get('undo-depth-limit',
+                                          UndoManager.depth_limit)
+
+
+    @component.adapter(IPropertyChangeEvent)
+    def _property_changed(self, event):
+        if event.name == 'undo-memory-limit':
+            self.memory_limit = event.new_value
+            self._limit_history()
+        elif event.name == 'undo-journal-limit':
+            self.journal_limit = event.new_value
+            self._limit_history()
+        elif event.name == 'undo-depth-limit':
+            self.depth_limit = event.new_value
+            self._limit_history()
+
+
+    def _discard(self, transactions):
+        """
+        Remove spilled transactions in @transactions from the journal.
+        """
+        for tx in transactions:
+            if isinstance(tx, SpilledTransaction):
+                self._journal.discard(tx)
+
+
+    def _load(self, transaction):
+        if isinstance(transaction, SpilledTransaction):
+            return self._journal.load(transaction)
+        return transaction
+
+
+    def _limit_history(self):
+        """
+        Spill the oldest transactions to the journal until the transactions
+        in memory fit in the memory budget. The redo transactions that are
+        farthest away are spilled after the undo transactions.
+
+        The oldest transactions are dropped if the deleted objects they
+        keep in memory do not fit in the budget (the last transaction of
+        each stack is kept), if the journal grows beyond its limit, or if
+        there are more than ``depth_limit`` transactions on a stack.
+        """
+        stacks = (self._undo_stack, self._redo_stack)
+        memory = sum(tx.size for stack in stacks for tx in stack)
+        for stack in stacks:
+            for i, tx in enumerate(stack):
+                if memory <= self.memory_limit:
+                    break
+                if tx.size > tx.pinned:
+                    stack[i] = self._journal.spill(tx)
+                    memory -= tx.size - tx.pinned
+
+        journal = self._journal
+        for stack in stacks:
+            while len(stack) > 1 and memory > self.memory_limit:
+                memory -= stack[0].size
+                self._discard([stack.pop(0)])
+            while stack and journal.size > self.journal_limit \
+                    and isinstance(stack[0], SpilledTransaction):
+                journal.discard(stack.pop(0))
+            excess = len(stack) - self.depth_limit
+            if excess > 0:
+                self._discard(stack[:excess])
+                del stack[:excess]
     
 
     @component.adapter(IModelFactoryEvent)
@@ -168,14 +468,21 @@ class UndoManager(object):
 
     def add_undo_action(self, action):
         """
-        Add an action to undo. An action
+        Add an action to undo. Actions are only recorded within a
+        transaction. The undo state is not changed by adding an action
+        (there is a transaction to undo anyway), listeners are notified
+        when the transaction is committed.
         """
         if self._current_transaction:
             self._current_transaction.add(action)
-            self.component_registry.handle(UndoManagerStateChanged(self))
 
-            # TODO: should this be placed here?
-            self._action_executed()
+    def add_undo_change(self, action, element, property):
+        """
+        Add an action that restores the value of a property of element.
+        Only the first change of a property in a transaction is recorded.
+        """
+        if self._current_transaction:
+            self._current_transaction.add_change(action, element, property)
 
 
     @component.adapter(TransactionCommit)
@@ -185,9 +492,9 @@ class UndoManager(object):
         if self._current_transaction.can_execute():
             # Here:
             self.clear_redo_stack()
+            self._current_transaction.close()
             self._undo_stack.append(self._current_transaction)
-            while len(self._undo_stack) > self._stack_depth:
-                del self._undo_stack[0]
+            self._limit_history()
 
         self._current_transaction = None
 
@@ -203,7 +510,8 @@ class UndoManager(object):
         assert self._current_transaction
 
         # Store stacks
-        undo_stack = list(self._undo_stack)
+        undo_stack = self._undo_stack
+        self._undo_stack = []
 
         errorous_tx = self._current_transaction
         self._current_transaction = None
@@ -216,6 +524,7 @@ class UndoManager(object):
                     self.logger.error(e)
         finally:
             # Discard all data collected in the rollback "transaction"
+            self._discard(self._undo_stack)
             self._undo_stack = undo_stack
 
         self.component_registry.handle(UndoManagerStateChanged(self))
@@ -238,12 +547,13 @@ class UndoManager(object):
         if self._current_transaction:
             log.warning('Trying to undo a transaction, while in a transaction')
             self.commit_transaction()
-        transaction = self._undo_stack.pop()
+        transaction = self._load(self._undo_stack.pop())
 
         # Store stacks
-        undo_stack = list(self._undo_stack)
-        redo_stack = list(self._redo_stack)
+        undo_stack = self._undo_stack
+        redo_stack = self._redo_stack
         self._undo_stack = []
+        self._redo_stack = []
 
         try:
             with Transaction():
@@ -255,8 +565,7 @@ class UndoManager(object):
                 self._redo_stack.extend(self._undo_stack)
             self._undo_stack = undo_stack
 
-        while len(self._redo_stack) > self._stack_depth:
-            del self._redo_stack[0]
+        self._limit_history()
 
         self.component_registry.handle(UndoManagerStateChanged(self))
         self._action_executed()
@@ -267,15 +576,18 @@ class UndoManager(object):
         if not self._redo_stack:
             return
 
-        transaction = self._redo_stack.pop()
+        transaction = self._load(self._redo_stack.pop())
 
-        redo_stack = list(self._redo_stack)
+        redo_stack = self._redo_stack
+        self._redo_stack = []
         try:
             with Transaction():
                 transaction.execute()
         finally:
             self._redo_stack = redo_stack
 
+        self._limit_history()
+
         self.component_registry.handle(UndoManagerStateChanged(self))
         self._action_executed()
 
@@ -302,7 +614,12 @@ class UndoManager(object):
     ##
 
     def _gaphas_undo_handler(self, event):
-        self.add_undo_action(lambda: state.saveapply(*event));
+        if event[0] is _canvas_add and self._current_transaction:
+            # The item is removed from the canvas
+            self._current_transaction.add_deleted((state.saveapply,) + event,
+                                                  event[1]['item'])
+        else:
+            self.add_undo_action((state.saveapply,) + event)
 
 
     def _register_undo_handlers(self):
@@ -339,20 +656,24 @@ class UndoManager(object):
         state.subscribers.discard(self._gaphas_undo_handler)
 
 
+    def _undo_create(self, factory, element):
+        # Element was probably already removed in an unlink call
+        factory._unregister(element)
+        self.component_registry.handle(ElementDeleteEvent(factory, element))
+
+
+    def _undo_delete(self, factory, element):
+        factory._register(element)
+        self.component_registry.handle(ElementCreateEvent(factory, element))
+
+
     @component.adapter(ElementCreateEvent)
     def undo_create_event(self, event):
         factory = event.service
         # A factory is not always present, e.g. for DiagramItems
         if not factory:
             return
-        element = event.element
-        def _undo_create_event():
-            try:
-                del factory._elements[element.id]
-            except KeyError:
-                pass # Key was probably already removed in an unlink call
-            self.component_registry.handle(ElementDeleteEvent(factory, element))
-        self.add_undo_action(_undo_create_event)
+        self.add_undo_action((self._undo_create, factory, event.element))
 
 
     @component.adapter(IElementDeleteEvent)
@@ -361,64 +682,52 @@ class UndoManager(object):
         # A factory is not always present, e.g. for DiagramItems
         if not factory:
             return
-        element = event.element
-        assert factory, 'No factory defined for %s (%s)' % (element, factory)
-        def _undo_delete_event():
-            factory._elements[element.id] = element
-            self.component_registry.handle(ElementCreateEvent(factory, element))
-        self.add_undo_action(_undo_delete_event)
+        if self._current_transaction:
+            self._current_transaction.add_deleted(
+                    (self._undo_delete, factory, event.element), event.element)
 
 
     @component.adapter(IAttributeChangeEvent)
     def undo_attribute_change_event(self, event):
         attribute = event.property
         element = event.element
-        value = event.old_value
-        
-        def _undo_attribute_change_event():
-            attribute._set(element, value)
-            
-        self.add_undo_action(_undo_attribute_change_event)
+        self.add_undo_change((_set_attribute, attribute, element, event.old_value),
+                             element, attribute)
 
 
     @component.adapter(AssociationSetEvent)
     def undo_association_set_event(self, event):
         association = event.property
         element = event.element
-        value = event.old_value
-        #print 'got new set event', association, element, value
-        def _undo_association_set_event():
-            #print 'undoing action', element, value
-            # Tell the assoctaion it should not need to let the opposite
-            # side connect (it has it's own signal)
-            association._set(element, value, from_opposite=True)
-        self.add_undo_action(_undo_association_set_event)
+        self.add_undo_change((_set_association, association, element, event.old_value),
+                             element, association)
 
 
     @component.adapter(AssociationAddEvent)
     def undo_association_add_event(self, event):
-        association = event.property
-        element = event.element
-        value = event.new_value
-        def _undo_association_add_event():
-            #print 'undoing action', element, value
-            # Tell the assoctaion it should not need to let the opposite
-            # side connect (it has it's own signal)
-            association._del(element, value, from_opposite=True)
-        self.add_undo_action(_undo_association_add_event)
+        self.add_undo_action((_del_association, event.property,
+                              event.element, event.new_value))
 
 
     @component.adapter(AssociationDeleteEvent)
     def undo_association_delete_event(self, event):
-        association = event.property
-        element = event.element
-        value = event.old_value
-        def _undo_association_delete_event():
-            #print 'undoing action', element, value
-            # Tell the assoctaion it should not need to let the opposite
-            # side connect (it has it's own signal)
-            association._set(element, value, from_opposite=True)
-        self.add_undo_action(_undo_association_delete_event)
+        self.add_undo_action((_set_association, event.property,
+                              event.element, event.old_value))
+
+
+# Undo functions for model changes. Associations are told they should not
+# need to let the opposite side connect (it has it's own undo action).
+
+def _set_attribute(attribute, element, value):
+    attribute._set(element, value)
+
+
+def _set_association(association, element, value):
+    association._set(element, value, from_opposite=True)
+
+
+def _del_association(association, element, value):
+    association._del(element, value, from_opposite=True)
 
 
 # vim:sw=4:et:ai
@@ -0,0 +1,455 @@
+"""
+Incremental saving of Gaphor models.
+
+A model file consists of a header, followed by one XML fragment per model
+element (see storage.element_serializer()). Next to the model file an index
+is kept (the file name with an extra ``.index`` extension), that contains
+the offset and length of every fragment, and the ids it defines and refers
+to.
+
+When the model is saved again, only the elements that changed since the
+last save are serialized. If their fragments did not change in size, they
+are written over the old fragments. Otherwise a new file is written, for
+which the fragments of unchanged elements are copied from the old file.
+Either way the result is the same as a full save, so the file can be
+loaded with the normal parser. Diagrams that have been loaded are always
+serialized again, since not every change of a canvas item is reported.
+
+The index is only used if the model file did not change since it was
+written (size and modification time are checked). Every COMPACT_EVERY saves
+the model is serialized in full again.
+
+References are collected from the fragments as they are serialized, and
+from the index for the fragments that did not change. So the model can be
+checked for references to elements that are not saved (orphans) before the
+model file is replaced, without reading the unchanged fragments.
+"""
+
+import os
+import re
+import sys
+from xml.sax.saxutils import unescape
+
+import gaphas
+from gaphas import state
+from zope import component
+
+from gaphor import UML
+from gaphor.UML.interfaces import IElementChangeEvent
+from gaphor.misc.odict import odict
+from gaphor.storage import storage
+
+__all__ = [ 'DirtyTracker', 'ElementIndex', 'References', 'save',
+            'save_generator' ]
+
+INDEX_EXT = '.index'
+INDEX_VERSION = '3'
+COMPACT_EVERY = 20
+
+_refid_pat = re.compile(r"""<ref refid=("[^"]*"|'[^']*')/>""")
+_itemid_pat = re.compile(r"""<item\b[^>]*?\sid=("[^"]*"|'[^']*')""")
+
+
+class DirtyTracker(object):
+    """
+    Keep track of the model elements that changed since the last save.
+
+    Elements are marked dirty by model change events. Changes to diagram
+    items mark their diagram dirty. Canvas changes are reported by the
+    gaphas state observers. Changes of matrices, handles and variables can
+    not be traced back to their diagram right away. They are resolved when
+    the dirty elements are requested.
+    """
+
+    def __init__(self, component_registry):
+        self.component_registry = component_registry
+        self._dirty = set()
+        self._changed = set()
+
+    def connect(self):
+        self.component_registry.register_handler(self._element_changed)
+        state.observers.add(self._state_changed)
+
+    def disconnect(self):
+        self.component_registry.unregister_handler(self._element_changed)
+        state.observers.discard(self._state_changed)
+
+    def clear(self):
+        self._dirty.clear()
+        self._changed.clear()
+
+    def _mark(self, obj):
+        if isinstance(obj, gaphas.Item):
+            obj = obj.canvas
+        if isinstance(obj, gaphas.Canvas):
+            obj = getattr(obj, 'diagram', None)
+        if isinstance(obj, UML.Element):
+            self._dirty.add(obj.id)
+            return True
+        return False
+
+    @component.adapter(IElementChangeEvent)
+    def _element_changed(self, event):
+        self._mark(event.element)
+
+    def _state_changed(self, event):
+        func, args, kwargs = event
+        if args and not self._mark(args[0]):
+            # Remember matrices, handles, positions, variables and solvers
+            self._changed.add(id(args[0]))
+
+    def _canvas_changed(self, canvas):
+        changed = self._changed
+        if id(canvas.solver) in changed:
+            return True
+        for item in canvas.get_all_items():
+            if id(item.matrix) in changed:
+                return True
+            for h in item.handles():
+                pos = h.pos
+                if id(h) in changed or id(pos) in changed or \
+                        id(pos.x) in changed or id(pos.y) in changed:
+                    return True
+        return False
+
+    def dirty(self, factory):
+        """
+        Return the ids of the dirty elements in @factory.
+        """
+        if self._changed:
+            for diagram in factory.select_type(UML.Diagram):
+                if diagram.id not in self._dirty and \
+                        diagram.canvas.materialized and \
+                        self._canvas_changed(diagram.canvas):
+                    self._dirty.add(diagram.id)
+            self._changed.clear()
+        return set(self._dirty)
+
+
+class ElementIndex(object):
+    """
+    The offset, length and class name of each element in a model file,
+    and the ids of the canvas items in its fragment and the ids the
+    fragment refers to.
+
+    The index is stored as text: a header line with the format version,
+    the size and modification time of the model file, the number of
+    incremental saves since the last full save and the length of the
+    document head. One line per element follows: id, class name, offset,
+    length and the number of item ids and references. The item ids and
+    the references follow, one per line, encoded like the model file.
+    """
+
+    def __init__(self, head=0, saves=0):
+        self.head = head
+        self.saves = saves
+        self.fragments = odict()
+
+    @classmethod
+    def read(cls, filename):
+        """
+        Read the index for model file @filename. None is returned if there
+        is no index or if the model file has been changed since the index
+        was written.
+        """
+        try:
+            st = os.stat(filename)
+            f = open(filename + INDEX_EXT, 'rb')
+        except (IOError, OSError):
+            return None
+        try:
+            fields = f.readline().split()
+            if len(fields) != 6 or fields[0] != 'gaphor-index' \
+                    or fields[1] != INDEX_VERSION \
+                    or int(fields[2]) != st.st_size \
+                    or float(fields[3]) != st.st_mtime:
+                return None
+            index = cls(int(fields[5]), int(fields[4]))
+            fragments = index.fragments
+            lines = f.read().split('\n')
+            # The last line is empty
+            n = len(lines) - 1
+            i = 0
+            while i < n:
+                id, type, offset, length, nids, nrefs = lines[i].rsplit(' ', 5)
+                i += 1
+                j = i + int(nids)
+                k = j + int(nrefs)
+                if k > n:
+                    return None
+                fragments[id.decode('utf-8')] = (int(offset), int(length),
+                        type, tuple(lines[i:j]), tuple(lines[j:k]))
+                i = k
+            return index
+        except ValueError:
+            return None
+        finally:
+            f.close()
+
+    def write(self, filename):
+        """
+        Write the index for model file @filename.
+        """
+        st = os.stat(filename)
+        lines = [ 'gaphor-index %s %d %r %d %d' % (INDEX_VERSION,
+                  st.st_size, st.st_mtime, self.saves, self.head) ]
+        for id, (offset, length, type, ids, refs) in \
+                self.fragments.iteritems():
+            lines.append('%s %s %d %d %d %d' % (id.encode('utf-8'), type,
+                         offset, length, len(ids), len(refs)))
+            lines.extend(ids)
+            lines.extend(refs)
+        lines.append('')
+        f = open(filename + INDEX_EXT, 'wb')
+        try:
+            f.write('\n'.join(lines))
+        finally:
+            f.close()
+
+
+def _unquote(value):
+    return unescape(value[1:-1], { '&quot;': '"' })
+
+
+def _scan(data):
+    """
+    Return the ids of the canvas items in fragment @data and the ids it
+    refers to, as tuples. The ids are encoded like @data.
+    """
+    return (tuple(map(_unquote, _itemid_pat.findall(data))),
+            tuple(map(_unquote, _refid_pat.findall(data))))
+
+
+class References(object):
+    """
+    The ids of the elements and canvas items in a model file, and the ids
+    they refer to. They are scanned from the serialized fragments, or taken
+    from the index.
+    """
+
+    def __init__(self):
+        self.ids = set()
+        self.refs = set()
+
+    def add(self, id, ids, refs):
+        """
+        Add element @id, with the item ids @ids and references @refs of
+        its fragment.
+        """
+        self.ids.add(id)
+        self.ids.update(ids)
+        self.refs.update(refs)
+
+    def scan(self, id, data):
+        """
+        Add the fragment @data of element @id. The item ids and references
+        are returned (see _scan()).
+        """
+        ids, refs = _scan(data)
+        self.add(id, ids, refs)
+        return ids, refs
+
+    def orphans(self):
+        """
+        Return the ids that are referred to, but not saved.
+        """
+        return self.refs - self.ids
+
+
+def _verified(references, verify):
+    """
+    Return False if there are orphans and @verify did not accept them.
+    """
+    if references:
+        orphans = references.orphans()
+        if orphans:
+            return verify(orphans)
+    return True
+
+
+def _loaded_diagrams(factory):
+    """
+    Return the ids of the diagrams whose canvas items have been created.
+    Not every change of a canvas item is reported, so these diagrams are
+    always serialized again. Diagrams that are not loaded yet (see
+    storage.load_elements_generator()) did not change.
+    """
+    return set(d.id for d in factory.select_type(UML.Diagram)
+               if d.canvas.materialized)
+
+
+def _patches(filename, index, elements, dirty, serialize, head, references):
+    """
+    Return the changed fragments as (offset, data) tuples, to be written over
+    the old ones. This is only possible if the elements, their classes and
+    their order did not change, and the new fragments have the same size as
+    the old ones. The item ids and references of the changed fragments are
+    updated in @index.
+    None is returned otherwise. All fragments are added to @references, if
+    it is not None. Only the head of the old file is read.
+    """
+    fragments = index.fragments
+    if len(head) != index.head or \
+            [(e.id, e.__class__.__name__) for e in elements] != \
+            [(id, f[2]) for id, f in fragments.iteritems()]:
+        return None
+
+    f = open(filename, 'rb')
+    try:
+        old = f.read(len(head))
+    finally:
+        f.close()
+    if old != head:
+        return None
+
+    patches = []
+    changed = {}
+    for e in elements:
+        offset, length, type, ids, refs = fragments[e.id]
+        if e.id in dirty:
+            data = serialize(e)
+            if len(data) != length:
+                return None
+            patches.append((offset, data))
+            ids, refs = _scan(data)
+            changed[e.id] = (offset, length, type, ids, refs)
+        if references is not None:
+            references.add(e.id, ids, refs)
+    fragments.update(changed)
+    return patches
+
+
+def _patch(filename, patches):
+    """
+    Write the changed fragments over the old ones.
+    """
+    f = open(filename, 'r+b')
+    try:
+        for offset, data in patches:
+            f.seek(offset)
+            f.write(data)
+    finally:
+        f.close()
+
+
+def save_generator(filename, factory, dirty=None, encoding=None, verify=None):
+    """
+    Save the model in @factory to @filename. @dirty is a set of ids of the
+    elements that changed since the model was loaded from or saved to
+    @filename. If it is None, the whole model is saved.
+
+    If elements refer to elements that are not saved, @verify is called
+    with their ids before @filename is changed. If it returns False, the
+    model has been changed (e.g. the orphans have been unlinked) and it is
+    saved again in full.
+
+    The status (percentage) is yielded while saving.
+    """
+    encoding = encoding or sys.getdefaultencoding()
+    serialize = storage.element_serializer(encoding)
+    head = storage.document_head(encoding)
+    elements = factory.values()
+    size = len(elements)
+
+    index = None
+    if dirty is not None:
+        index = ElementIndex.read(filename)
+        if index and index.saves + 1 >= COMPACT_EVERY:
+            index = None
+        else:
+            dirty = dirty | _loaded_diagrams(factory)
+
+    if index:
+        references = verify and References() or None
+        patches = _patches(filename, index, elements, dirty, serialize, head,
+                           references)
+        if patches is not None:
+            if _verified(references, verify):
+                _patch(filename, patches)
+                index.saves += 1
+                index.write(filename)
+            else:
+                for status in save_generator(filename, factory,
+                                             encoding=encoding):
+                    yield status
+            return
+
+    references = verify and References() or None
+
+    if index:
+        old = open(filename, 'rb')
+        fragments = index.fragments
+        new_index = ElementIndex(len(head), index.saves + 1)
+    else:
+        old = None
+        fragments = {}
+        new_index = ElementIndex(len(head))
+
+    tmpname = filename + '.tmp'
+    out = open(tmpname, 'wb')
+    try:
+        out.write(head)
+        offset = len(head)
+        sep = '>\n'
+        n = 0
+        for e in elements:
+            id = e.id
+            type = e.__class__.__name__
+            if id in fragments and id not in dirty and \
+                    fragments[id][2] == type:
+                o, length, t, ids, refs = fragments[id]
+                old.seek(o)
+                data = old.read(length)
+            else:
+                data = serialize(e)
+                ids, refs = _scan(data)
+            out.write(sep)
+            offset += len(sep)
+            new_index.fragments[id] = (offset, len(data), type, ids, refs)
+            if references:
+                references.add(id, ids, refs)
+            out.write(data)
+            offset += len(data)
+            sep = '\n'
+
+            n += 1
+            if n % 25 == 0:
+                yield (n * 100) / size
+
+        if n:
+            out.write('\n</gaphor>')
+        else:
+            out.write('/>')
+    except:
+        out.close()
+        os.remove(tmpname)
+        raise
+    finally:
+        out.close()
+        if old:
+            old.close()
+
+    try:
+        verified = _verified(references, verify)
+    except:
+        os.remove(tmpname)
+        raise
+    if not verified:
+        os.remove(tmpname)
+        for status in save_generator(filename, factory, encoding=encoding):
+            yield status
+        return
+
+    if os.name == 'nt' and os.path.exists(filename):
+        os.remove(filename)
+    os.rename(tmpname, filename)
+    new_index.write(filename)
+
+
+def save(filename, factory, dirty=None, status_queue=None, verify=None):
+    for status in save_generator(filename, factory, dirty, verify=verify):
+        if status_queue:
+            status_queue(status)
+
+
+# vim:sw=4:et:ai
@@ -28,13 +28,19 @@ class name in the gaphor.diagram module.
 
 The generator parse_generator(filename, loader) may be used if the loading
 takes a long time. The yielded values are the percentage of the file read.
+
+Two parser backends are available: 'sax' feeds the file to a SAX handler
+(GaphorLoader), 'iterparse' lets cElementTree build the XML tree of each
+model element and converts it in one go. Both produce the same elements.
+parse_batch() parses several files in parallel, in a process pool.
 """
 
-__all__ = [ 'parse', 'ParserException' ]
+__all__ = [ 'parse', 'parse_batch', 'ParserException' ]
 
 import os
 import types
 from xml.sax import handler
+from xml.etree import cElementTree
 from cStringIO import InputType
 
 from gaphor.misc.odict import odict
@@ -48,6 +54,8 @@ class base(object):
         self.references = { }
 
     def __getattr__(self, key):
+        if key.startswith('__'):
+            raise AttributeError, key
         return self[key]
 
     def __getitem__(self, key):
@@ -163,7 +171,7 @@ class GaphorLoader(handler.ContentHandler):
         if state == GAPHOR:
             id = attrs['id']
             e = element(id, name)
-            assert id not in self.elements.keys(), '%s already defined' % (id)#, self.elements[id])
+            assert id not in self.elements, '%s already defined' % (id)#, self.elements[id])
             self.elements[id] = e
             self.push(e, name == 'Diagram' and DIAGRAM or ELEMENT)
 
@@ -177,7 +185,7 @@ class GaphorLoader(handler.ContentHandler):
         elif state in (CANVAS, ITEM) and name == 'item':
             id = attrs['id']
             c = canvasitem(id, attrs['type'])
-            assert id not in self.elements.keys(), '%s already defined' % id
+            assert id not in self.elements, '%s already defined' % id
             self.elements[id] = c
             self.peek().canvasitems.append(c)
             self.push(c, ITEM)
@@ -252,21 +260,50 @@ class GaphorLoader(handler.ContentHandler):
         self.text = self.text + content
 
 
-def parse(filename):
+def parse(filename, backend='sax'):
     """Parse a file and return a dictionary ID:element/canvasitem.
     """
     loader = GaphorLoader()
 
-    for x in parse_generator(filename, loader):
+    for x in parse_generator(filename, loader, backend):
         pass
     return loader.elements
 
 
-def parse_generator(filename, loader):
+def _parse_loader(args):
+    filename, backend = args
+    loader = GaphorLoader()
+    for x in parse_generator(filename, loader, backend):
+        pass
+    return loader
+
+
+def parse_batch(filenames, processes=None, backend='iterparse'):
+    """Parse several files in a pool of processes (by default one per CPU).
+    A list of GaphorLoader instances is returned, one per file, in order.
+    """
+    from multiprocessing import Pool
+    pool = Pool(processes)
+    try:
+        return pool.map(_parse_loader, [ (f, backend) for f in filenames ])
+    finally:
+        pool.close()
+        pool.join()
+
+
+def parse_generator(filename, loader, backend='sax'):
     """The generator based version of parse().
     parses the file filename and load it with ContentHandler loader.
+    Backend is the name of the parser backend, 'sax' or 'iterparse'.
     """
     assert isinstance(loader, GaphorLoader), 'loader should be a GaphorLoader'
+    if backend == 'iterparse':
+        for percentage in iterparse_generator(filename, loader):
+            yield percentage
+        return
+    elif backend != 'sax':
+        raise ValueError, 'Unknown parser backend %s' % backend
+
     from xml.sax import make_parser
     parser = make_parser()
 
@@ -277,6 +314,151 @@ def parse_generator(filename, loader):
         yield percentage
 
 
+class _Reader(object):
+    """Read a file in big blocks, whatever size is asked for. The number
+    of bytes read so far is kept in ``pos``.
+    """
+
+    def __init__(self, input, block_size):
+        self.input = input
+        self.block_size = block_size
+        self.pos = 0
+
+    def read(self, size=-1):
+        block = self.input.read(self.block_size)
+        self.pos += len(block)
+        return block
+
+
+def _tagname(tag, _cache={}):
+    """Strip the Gaphor namespace from a cElementTree tag. Tags in other
+    namespaces return None.
+    """
+    try:
+        return _cache[tag]
+    except KeyError:
+        if tag[0] != '{':
+            name = tag
+        elif tag.startswith('{' + XMLNS + '}'):
+            name = tag[len(XMLNS) + 2:]
+        else:
+            name = None
+        _cache[tag] = name
+        return name
+
+
+def _unicode(text):
+    """cElementTree returns plain strings for ASCII text, the SAX parser
+    always returns unicode.
+    """
+    if text is None:
+        return ''
+    return unicode(text)
+
+
+def _load_properties(obj, node, elements):
+    """Load the values and references in the children of node into obj,
+    the element, canvas or canvasitem node represents. Canvas items are
+    created as well and added to the elements dictionary.
+    """
+    for child in node:
+        name = _tagname(child.tag)
+        if name is None:
+            continue
+        if name == 'item' and isinstance(obj, (canvas, canvasitem)):
+            id = _unicode(child.get('id'))
+            c = canvasitem(id, _unicode(child.get('type')))
+            assert id not in elements, '%s already defined' % id
+            elements[id] = c
+            obj.canvasitems.append(c)
+            _load_properties(c, child, elements)
+        elif name == 'canvas' and isinstance(obj, element) \
+                and obj.type == 'Diagram':
+            c = obj.canvas = canvas()
+            _load_properties(c, child, elements)
+        else:
+            name = _unicode(name)
+            for content in child:
+                tag = _tagname(content.tag)
+                if tag == 'val':
+                    obj.values[name] = _unicode(content.text)
+                elif tag == 'ref':
+                    obj.references[name] = _unicode(content.get('refid'))
+                elif tag == 'reflist':
+                    refs = [ _unicode(ref.get('refid')) for ref in content
+                             if _tagname(ref.tag) == 'ref' ]
+                    if refs:
+                        obj.references.setdefault(name, []).extend(refs)
+                elif tag is not None:
+                    raise ParserException, 'Invalid XML: tag <%s> not known' % tag
+
+
+def iterparse_generator(filename, loader, block_size=65536):
+    """Parse filename with cElementTree and store the result in loader.
+    The XML tree of each model element is converted as soon as it has been
+    read and is discarded afterwards. The progress is yielded as percentage
+    of the file read.
+    """
+    if isinstance(filename, (types.FileType, InputType)):
+        file_obj = filename
+        if isinstance(file_obj, InputType):
+            file_obj.reset()
+    else:
+        file_obj = open(filename, 'rb')
+
+    try:
+        if isinstance(file_obj, InputType):
+            file_size = len(file_obj.getvalue())
+        else:
+            file_size = os.fstat(file_obj.fileno())[6]
+        reader = _Reader(file_obj, block_size)
+
+        loader.startDocument()
+        elements = loader.elements
+        root = None
+        depth = 0
+        percentage = 0
+        try:
+            for event, node in cElementTree.iterparse(reader, ('start', 'end')):
+                if event == 'start':
+                    if depth == 0:
+                        if _tagname(node.tag) != 'gaphor':
+                            raise ParserException, 'Invalid XML: tag <%s> not known (state = %s)' % (node.tag, ROOT)
+                        assert node.get('version') in ('3.0',)
+                        loader.version = _unicode(node.get('version'))
+                        loader.gaphor_version = node.get('gaphor-version') \
+                                or node.get('gaphor_version')
+                        if loader.gaphor_version:
+                            loader.gaphor_version = _unicode(loader.gaphor_version)
+                        root = node
+                    depth += 1
+                    continue
+
+                depth -= 1
+                if depth != 1:
+                    continue
+
+                # A model element has been read:
+                name = _tagname(node.tag)
+                if name is not None:
+                    id = _unicode(node.get('id'))
+                    e = element(id, _unicode(name))
+                    assert id not in elements, '%s already defined' % (id)
+                    elements[id] = e
+                    _load_properties(e, node, elements)
+                root.clear()
+
+                if reader.pos * 100 / file_size != percentage:
+                    percentage = reader.pos * 100 / file_size
+                    yield percentage
+        except SyntaxError, e:
+            raise ParserException, 'Invalid XML document: %s' % e
+    finally:
+        if file_obj is not filename:
+            file_obj.close()
+    yield 100
+
+
 class ProgressGenerator(object):
     """A generator that yields the progress of taking from a file input object 
     and feeding it into an output object.  The supplied file object is neither
@@ -0,0 +1,190 @@
+"""
+Binary snapshots of parsed Gaphor models.
+
+For a model file a snapshot may be kept in the snapshot directory of the
+user (see snapshot_dir()), named after the SHA-1 digest of the absolute
+path of the model file. It contains the elements read by the parser (see
+gaphor.storage.parser), so a model that did not change can be opened again
+without parsing the XML.
+
+A snapshot starts with a header line: the snapshot format version, the
+size, modification time and SHA-1 digest of the model file it was made
+from. The snapshot is only used if the model file still matches and the
+format version is the current one. Otherwise, or if the snapshot can not
+be read at all, None is returned and the model file should be parsed.
+
+The elements are pickled as plain tuples, dicts, lists and strings. They
+are unpickled without access to any class or function, so a snapshot can
+not execute code when it is read.
+"""
+
+import gc
+import os
+import hashlib
+import cPickle as pickle
+
+from gaphor.misc import get_user_data_dir
+from gaphor.misc.odict import odict
+from gaphor.storage import parser
+
+__all__ = [ 'SNAPSHOT_EXT', 'snapshot_dir', 'path', 'read', 'dumps', 'write',
+            'remove' ]
+
+SNAPSHOT_EXT = '.snapshot'
+SNAPSHOT_VERSION = '2'
+
+
+def snapshot_dir():
+    """
+    Return the directory the snapshots are kept in.
+    """
+    return os.path.join(get_user_data_dir(), 'snapshots')
+
+
+def path(filename):
+    """
+    Return the name of the snapshot file for model file @filename.
+    """
+    key = hashlib.sha1(os.path.abspath(filename)).hexdigest()
+    return os.path.join(snapshot_dir(), key + SNAPSHOT_EXT)
+
+
+def digest(filename, block_size=1 << 20):
+    """
+    Return the SHA-1 digest (hex) of the contents of file @filename.
+    """
+    h = hashlib.sha1()
+    f = open(filename, 'rb')
+    try:
+        data = f.read(block_size)
+        while data:
+            h.update(data)
+            data = f.read(block_size)
+    finally:
+        f.close()
+    return h.hexdigest()
+
+
+def _dump_item(item):
+    return (item.id, item.type, item.values, item.references,
+            map(_dump_item, item.canvasitems))
+
+
+def _dump_element(e):
+    c = e.canvas
+    if c is not None:
+        c = (c.values, c.references, map(_dump_item, c.canvasitems))
+    return (e.id, e.type, e.values, e.references, c)
+
+
+def _load_items(obj, values, elements):
+    """
+    Create the canvas items in @values for canvas or canvas item @obj. The
+    items are added to @elements in document order, like the parser does.
+    """
+    for id, type, values, references, children in values:
+        item = parser.canvasitem(id, type)
+        item.values = values
+        item.references = references
+        obj.canvasitems.append(item)
+        elements[id] = item
+        _load_items(item, children, elements)
+
+
+def _load_elements(values):
+    elements = odict()
+    for id, type, values, references, c in values:
+        e = parser.element(id, type)
+        e.values = values
+        e.references = references
+        elements[id] = e
+        if c is not None:
+            e.canvas = parser.canvas()
+            e.canvas.values, e.canvas.references, items = c
+            _load_items(e.canvas, items, elements)
+    return elements
+
+
+def read(filename):
+    """
+    Read the snapshot for model file @filename. A tuple (gaphor_version,
+    elements) is returned, elements is an ordered dict of id: parsed
+    element, like the parser returns. None is returned if there is no
+    usable snapshot.
+    """
+    try:
+        st = os.stat(filename)
+        f = open(path(filename), 'rb')
+    except (IOError, OSError):
+        return None
+    try:
+        try:
+            fields = f.readline().split()
+            if len(fields) != 5 or fields[0] != 'gaphor-snapshot' \
+                    or fields[1] != SNAPSHOT_VERSION \
+                    or int(fields[2]) != st.st_size \
+                    or float(fields[3]) != st.st_mtime \
+                    or fields[4] != digest(filename):
+                return None
+            unpickler = pickle.Unpickler(f)
+            # Do not look up classes or functions: only builtin values
+            unpickler.find_global = None
+            # Unpickling creates many objects that are all kept: skip the
+            # garbage collection runs that would be triggered meanwhile
+            gc.disable()
+            try:
+                gaphor_version, values = unpickler.load()
+                elements = _load_elements(values)
+            finally:
+                gc.enable()
+        except Exception, e:
+            log.warning('Snapshot for %s can not be read: %s' % (filename, e))
+            return None
+    finally:
+        f.close()
+    return gaphor_version, elements
+
+
+def dumps(gaphor_version, elements):
+    """
+    Return the pickled data for a snapshot of @elements. The elements
+    should be pickled before they are loaded, since loading alters them.
+    """
+    values = [ _dump_element(e) for e in elements.itervalues()
+               if isinstance(e, parser.element) ]
+    return pickle.dumps((gaphor_version, values), pickle.HIGHEST_PROTOCOL)
+
+
+def write(filename, data):
+    """
+    Write a snapshot for model file @filename. @data is the result of
+    dumps(). If the snapshot can not be written, the error is logged and
+    no snapshot is left behind.
+    """
+    try:
+        st = os.stat(filename)
+        if not os.path.exists(snapshot_dir()):
+            os.makedirs(snapshot_dir())
+        f = open(path(filename), 'wb')
+        try:
+            f.write('gaphor-snapshot %s %d %r %s\n' % (SNAPSHOT_VERSION,
+                    st.st_size, st.st_mtime, digest(filename)))
+            f.write(data)
+        finally:
+            f.close()
+    except (IOError, OSError), e:
+        log.warning('Snapshot for %s can not be written: %s' % (filename, e))
+        remove(filename)
+
+
+def remove(filename):
+    """
+    Remove the snapshot for model file @filename, if there is one.
+    """
+    try:
+        os.remove(path(filename))
+    except OSError:
+        pass
+
+
+# vim:sw=4:et:ai
@@ -9,23 +9,25 @@ save(filename)
 """
 
 from cStringIO import StringIO, InputType
-from xml.sax.saxutils import escape
+from xml.sax.saxutils import escape, quoteattr
 import types
 import sys
 import os.path
 import gc
+import weakref
 
 import gaphas
 
 from gaphor import UML
 from gaphor.UML.collection import collection
+from gaphor.UML.diagram import materialize_presentation, pending_canvases
 from gaphor.UML.elementfactory import ElementChangedEventBlocker
 from gaphor import diagram
-from gaphor.storage import parser
+from gaphor.storage import parser, snapshot
 from gaphor.application import Application, NotInitializedError
 from gaphor.diagram import items
 from gaphor.i18n import _
-#from gaphor.misc.xmlwriter import XMLWriter
+from gaphor.misc.xmlwriter import XMLWriter, _error_handling
 
 # import gaphor.adapters.connectors package, so diagram items can find
 # their appropriate connectors (i.e. diagram line requires this);
@@ -48,7 +50,15 @@ def save_generator(writer, factory):
     """
     Save the current model using @writer, which is a
     gaphor.misc.xmlwriter.XMLWriter instance.
+
+    If @writer is a plain XMLWriter, the model is written by
+    fast_save_generator(), which produces the same output.
     """
+    if writer.__class__ is XMLWriter:
+        for status in fast_save_generator(writer._out, factory,
+                                          writer._encoding):
+            yield status
+        return
 
     # Maintain a set of id's, one for elements, one for references.
     # Write only to file if references is a subset of elements
@@ -168,15 +178,392 @@ def save_generator(writer, factory):
     writer.endDocument()
 
 
-def load_elements(elements, factory, status_queue=None):
-    for status in load_elements_generator(elements, factory):
+def document_head(encoding):
+    """
+    Return the XML declaration and the start of the root tag, up to (not
+    including) the closing '>', as written by save_generator().
+    """
+    head = ['<?xml version="1.0" encoding="%s"?>\n' % encoding,
+            '<gaphor xmlns="%s"' % NAMESPACE_MODEL]
+    # Attributes are written in the same (dict) order as save_generator() does
+    attrs = { (NAMESPACE_MODEL, 'version'): FILE_FORMAT_VERSION,
+              (NAMESPACE_MODEL, 'gaphor-version'): Application.distribution.version }
+    for (ns, name), value in attrs.items():
+        head.append(' %s=%s' % (name, quoteattr(value)))
+    return ''.join(head)
+
+
+def element_serializer(encoding, materialize=True):
+    """
+    Return a function that serializes a model element to a string, the way
+    save_generator() writes it to a file with a XMLWriter.
+
+    XML fragments are built as strings instead of through SAX events. Tags
+    and references are escaped once and cached.
+
+    Lazily loaded diagrams are loaded before an element they present is
+    serialized. If materialize is False they are left alone: their canvas
+    items, and the presentation of the elements on them, are written from
+    the parsed items kept by the loader (see canvas_loader()). The result
+    loads the same, but the items are not necessarily written in the same
+    order.
+    """
+    def encode(text):
+        if isinstance(text, unicode):
+            return text.encode(encoding, _error_handling)
+        return text
+
+    # An element is written as '<tag' + attrs + '/>' if it has no content,
+    # or as '<tag' + attrs + '>\n' + '\n'.join(content) + '\n</tag>'.
+    # Scalar values are written as '<name>\n<val>text</val>\n</name>'.
+
+    tag_cache = {}
+    def tag(name):
+        try:
+            return tag_cache[name]
+        except KeyError:
+            t = tag_cache[name] = ('<%s>\n' % encode(name),
+                                   '\n</%s>' % encode(name))
+            return t
+
+    def escape(text):
+        # Same as xml.sax.saxutils.escape(), without the function calls
+        return text.replace('&', '&amp;').replace('>', '&gt;') \
+                   .replace('<', '&lt;')
+
+    def quote(value):
+        # Same as xml.sax.saxutils.quoteattr(), ids seldom need more than
+        # a pair of quotes
+        for c in '"\n\r\t':
+            if c in value:
+                return encode(quoteattr(value))
+        return encode('"%s"' % escape(value))
+
+    ref_cache = {}
+    def ref_xml(id):
+        try:
+            return ref_cache[id]
+        except KeyError:
+            r = ref_cache[id] = '<ref refid=%s/>' % quote(id)
+            return r
+
+    def reference_xml((start, end), value):
+        if value.id:
+            return start + ref_xml(value.id) + end
+
+    def collection_xml((start, end), value, extra=()):
+        if len(value) > 0 or extra:
+            refs = [ref_xml(v.id) for v in value if v.id]
+            refs.extend(map(ref_xml, extra))
+            if refs:
+                return '%s<reflist>\n%s\n</reflist>%s' % \
+                        (start, '\n'.join(refs), end)
+            return start + '<reflist/>' + end
+
+    def value_xml((start, end), value):
+        if value is not None:
+            if isinstance(value, types.StringTypes):
+                value = encode(escape(value))
+            elif isinstance(value, bool):
+                value = str(int(value))
+            else:
+                value = escape(str(value))
+            return '%s<val>%s</val>%s' % (start, value, end)
+
+    def element_xml(head, tagname, content):
+        if content:
+            return '%s>\n%s\n</%s>' % (head, '\n'.join(content), tagname)
+        return head + '/>'
+
+    def element_saver(content):
+        def save_element(name, value):
+            if isinstance(value, (UML.Element, gaphas.Item)):
+                fragment = reference_xml(tag(name), value)
+            elif isinstance(value, collection):
+                fragment = collection_xml(tag(name), value)
+            elif isinstance(value, gaphas.Canvas):
+                if not (materialize or getattr(value, 'materialized', True)):
+                    fragment = pending_canvas_xml(value.loader)
+                else:
+                    items = []
+                    value.save(canvasitem_saver(items))
+                    fragment = element_xml('<canvas', 'canvas', items)
+            else:
+                fragment = value_xml(tag(name), value)
+            if fragment:
+                content.append(fragment)
+        return save_element
+
+    def canvasitem_saver(content):
+        def save_canvasitem(name, value, reference=False):
+            if isinstance(value, collection) or \
+                    (isinstance(value, (list, tuple)) and reference == True):
+                fragment = collection_xml(tag(name), value)
+            elif reference:
+                fragment = reference_xml(tag(name), value)
+            elif isinstance(value, gaphas.Item):
+                attrs = []
+                for n, v in { 'id': value.id,
+                              'type': value.__class__.__name__ }.items():
+                    attrs.append(' %s=%s' % (n, quote(v)))
+                subcontent = []
+                save_subitem = canvasitem_saver(subcontent)
+                value.save(save_subitem)
+                for child in value.canvas.get_children(value):
+                    save_subitem(None, child)
+                fragment = element_xml('<item' + ''.join(attrs), 'item',
+                                       subcontent)
+            elif isinstance(value, UML.Element):
+                fragment = reference_xml(tag(name), value)
+            else:
+                fragment = value_xml(tag(name), value)
+            if fragment:
+                content.append(fragment)
+        return save_canvasitem
+
+    # Lazily loaded canvases are written from the parsed canvas items.
+    # References to elements that have been removed are skipped, like the
+    # loader does.
+
+    def parsed_item_xml(item, exists):
+        content = []
+        for name, value in item.values.iteritems():
+            fragment = value_xml(tag(name), value)
+            if fragment:
+                content.append(fragment)
+        for name, refids in item.references.iteritems():
+            start, end = tag(name)
+            if type(refids) == list:
+                refs = [ref_xml(id) for id in refids if exists(id)]
+                if refs:
+                    content.append('%s<reflist>\n%s\n</reflist>%s' % \
+                                   (start, '\n'.join(refs), end))
+            elif exists(refids):
+                content.append(start + ref_xml(refids) + end)
+        for child in item.canvasitems:
+            content.append(parsed_item_xml(child, exists))
+        head = '<item id=%s type=%s' % (quote(item.id), quote(item.type))
+        return element_xml(head, 'item', content)
+
+    def pending_canvas_xml(loader):
+        ids = set(item.id for item in walk_canvasitems(loader.canvasitems))
+        lookup = loader.factory.lookup
+        def exists(id):
+            return id in ids or lookup(id) is not None
+        items = [parsed_item_xml(item, exists)
+                 for item in loader.canvasitems]
+        return element_xml('<canvas', 'canvas', items)
+
+    # The ids of the parsed canvas items by subject id, per loader:
+    subjects_cache = weakref.WeakKeyDictionary()
+
+    def pending_presentation(e):
+        ids = []
+        for canvas in pending_canvases(e):
+            loader = canvas.loader
+            try:
+                subjects = subjects_cache[loader]
+            except KeyError:
+                subjects = subjects_cache[loader] = {}
+                for item in walk_canvasitems(loader.canvasitems):
+                    subject = item.references.get('subject')
+                    if subject:
+                        subjects.setdefault(subject, []).append(item.id)
+            ids.extend(subjects.get(e.id, ()))
+        return ids
+
+    # Elements that are saved by Element.save() are written according to a
+    # plan: a list of (attribute name, tags, fragment function) entries,
+    # one per persistent property, so no save function has to be called.
+    element_save = UML.Element.save.im_func
+    presentation_attr = UML.Element.presentation._name
+    plans = {}
+    def plan_for(class_):
+        try:
+            return plans[class_]
+        except KeyError:
+            pass
+        if class_.save.im_func is not element_save:
+            plan = plans[class_] = None
+            return plan
+        plan = plans[class_] = []
+        for prop in UML.element.propertytable_for(class_).persistent:
+            if isinstance(prop, UML.properties.redefine):
+                prop = prop.original
+            if isinstance(prop, UML.properties.association):
+                if prop.upper == 1:
+                    fragment_xml = reference_xml
+                else:
+                    fragment_xml = collection_xml
+            else:
+                fragment_xml = value_xml
+            plan.append((prop._name, tag(prop.name), fragment_xml))
+        return plan
+
+    def serialize(e):
+        clazz = e.__class__.__name__
+        assert e.id
+        plan = plan_for(e.__class__)
+        # Ids of the canvas items on lazily loaded diagrams presenting e:
+        pending = ()
+        if materialize or plan is None:
+            materialize_presentation(e)
+        else:
+            pending = pending_presentation(e)
+        content = []
+        if plan is None:
+            e.save(element_saver(content))
+        else:
+            for attr, tags, fragment_xml in plan:
+                value = getattr(e, attr, None)
+                if pending and attr == presentation_attr:
+                    fragment = collection_xml(tags, value or (), pending)
+                elif value is not None:
+                    fragment = fragment_xml(tags, value)
+                else:
+                    continue
+                if fragment:
+                    content.append(fragment)
+        head = '<%s id=%s' % (clazz, quote(str(e.id)))
+        return element_xml(head, clazz, content)
+
+    return serialize
+
+
+def fast_save_generator(out, factory, encoding=None):
+    """
+    Save the current model to the file object @out.
+
+    The output is the same as the output of save_generator() with a
+    XMLWriter (see element_serializer()). Output is written once every 25
+    elements.
+    """
+    encoding = encoding or sys.getdefaultencoding()
+    serialize = element_serializer(encoding)
+
+    buf = [document_head(encoding)]
+    size = factory.size()
+    n = 0
+    sep = '>\n'
+    for e in factory.values():
+        buf.append(sep)
+        buf.append(serialize(e))
+        sep = '\n'
+
+        n += 1
+        if n % 25 == 0:
+            out.write(''.join(buf))
+            del buf[:]
+            yield (n * 100) / size
+
+    if n:
+        buf.append('\n</gaphor>')
+    else:
+        buf.append('/>')
+    out.write(''.join(buf))
+
+
+def load_elements(elements, factory, status_queue=None, lazy=False):
+    for status in load_elements_generator(elements, factory, lazy=lazy):
         if status_queue:
             status_queue(status)
 
-def load_elements_generator(elements, factory, gaphor_version=None):
+
+def walk_canvasitems(canvasitems):
+    """
+    Iterate the parser.canvasitem's in canvasitems and their children.
+    """
+    for item in canvasitems:
+        yield item
+        for child in walk_canvasitems(item.canvasitems):
+            yield child
+
+
+def canvas_loader(canvasitems, factory):
+    """
+    Return a function that creates the canvas items for a lazily loaded
+    diagram, and the ids of the elements outside the canvas they refer to.
+
+    The items are created as they would have been at load time. References
+    to elements that have been removed from the factory in the mean time
+    are skipped. Change events and gaphas state changes are not emitted
+    while loading, so the items do not end up on the undo stack.
+
+    The parsed items and the factory are kept as attributes canvasitems and
+    factory of the function, so the canvas can be saved without creating
+    its items (see element_serializer()).
+    """
+    subjects = set()
+    ids = set()
+    for item in walk_canvasitems(canvasitems):
+        ids.add(item.id)
+        for refids in item.references.itervalues():
+            if type(refids) == list:
+                subjects.update(refids)
+            else:
+                subjects.add(refids)
+    subjects.difference_update(ids)
+
+    def create_canvasitems(canvas, canvasitems, created, parent=None):
+        for item in canvasitems:
+            cls = getattr(items, item.type)
+            element = created[item.id] = diagram.create_as(cls, item.id)
+            canvas.add(element, parent=parent)
+            create_canvasitems(canvas, item.canvasitems, created, parent=element)
+
+    def load_canvas(canvas):
+        try:
+            component_registry = Application.get_service('component_registry')
+        except NotInitializedError:
+            component_registry = None
+        if component_registry:
+            component_registry.register_subscription_adapter(ElementChangedEventBlocker)
+        acquired = gaphas.state.mutex.acquire(False)
+        try:
+            created = {}
+            canvas.block_updates = True
+            create_canvasitems(canvas, canvasitems, created)
+
+            for item in walk_canvasitems(canvasitems):
+                element = created[item.id]
+                for name, value in item.values.items():
+                    element.load(name, value)
+                for name, refids in item.references.items():
+                    if type(refids) != list:
+                        refids = [ refids ]
+                    for refid in refids:
+                        ref = created.get(refid) or factory.lookup(refid)
+                        if ref:
+                            element.load(name, ref)
+
+            canvas.block_updates = False
+            for element in created.itervalues():
+                element.postload()
+
+            # The items watched their paths before the subjects were set,
+            # and the change events were blocked: register them again
+            for element in created.itervalues():
+                element.unregister_handlers()
+                element.register_handlers()
+        finally:
+            if acquired:
+                gaphas.state.mutex.release()
+            if component_registry:
+                component_registry.unregister_subscription_adapter(ElementChangedEventBlocker)
+
+    load_canvas.canvasitems = canvasitems
+    load_canvas.factory = factory
+    return load_canvas, subjects
+
+
+def load_elements_generator(elements, factory, gaphor_version=None, lazy=False):
     """
     Load a file and create a model if possible.
     Exceptions: IOError, ValueError.
+
+    If lazy is True, the canvas items of the diagrams are not created
+    right away, but when a diagram is first used
+    (see DiagramCanvas.load_lazily()).
     """
     # TODO: restructure loading code, first load model, then add canvas items
     log.debug(_('Loading %d elements...') % len(elements))
@@ -200,6 +587,14 @@ def load_elements_generator(elements, factory, gaphor_version=None):
 
     #log.debug("Still have %d elements" % len(elements))
 
+    # Models written by older versions are fixed up after loading,
+    # which requires all canvas items to be present.
+    if lazy and gaphor_version and version_lower_than(gaphor_version, (0, 14, 99)):
+        lazy = False
+
+    # Ids of the canvas items that are loaded lazily:
+    deferred = set()
+
     # First create elements and canvas items in the factory
     # The elements are stored as attribute 'element' on the parser objects:
 
@@ -221,7 +616,10 @@ def load_elements_generator(elements, factory, gaphor_version=None):
             cls = getattr(UML, elem.type)
             #log.debug('Creating UML element for %s (%s)' % (elem, elem.id))
             elem.element = factory.create_as(cls, id)
-            if elem.canvas:
+            if elem.canvas and lazy:
+                deferred.update(item.id for item in walk_canvasitems(elem.canvas.canvasitems))
+                elem.element.canvas.load_lazily(*canvas_loader(elem.canvas.canvasitems, factory))
+            elif elem.canvas:
                 elem.element.canvas.block_updates = True
                 create_canvasitems(elem.element.canvas, elem.canvas.canvasitems)
         elif not isinstance(elem, parser.canvasitem):
@@ -231,6 +629,8 @@ def load_elements_generator(elements, factory, gaphor_version=None):
     for id, elem in elements.items():
         st = update_status_queue()
         if st: yield st
+        if id in deferred:
+            continue
         # Ensure that all elements have their element instance ready...
         assert hasattr(elem, 'element')
 
@@ -250,6 +650,9 @@ def load_elements_generator(elements, factory, gaphor_version=None):
                     except:
                         raise ValueError, 'Invalid ID for reference (%s) for element %s.%s' % (refid, elem.type, name)
                     else:
+                        # The item will add itself when it is created
+                        if refid in deferred:
+                            continue
                         try:
                             elem.element.load(name, ref.element)
                         except:
@@ -261,6 +664,8 @@ def load_elements_generator(elements, factory, gaphor_version=None):
                 except:
                     raise ValueError, 'Invalid ID for reference (%s)' % refids
                 else:
+                    if refids in deferred:
+                        continue
                     try:
                         elem.element.load(name, ref.element)
                     except:
@@ -284,7 +689,7 @@ def load_elements_generator(elements, factory, gaphor_version=None):
     # Data model, loaded from file, is updated automatically, so there is
     # no need for special function.
 
-    for d in factory.select(lambda e: isinstance(e, UML.Diagram)):
+    for d in factory.select_type(UML.Diagram):
         # update_now() is implicitly called when lock is released
         d.canvas.block_updates = False
 
@@ -292,47 +697,70 @@ def load_elements_generator(elements, factory, gaphor_version=None):
     for id, elem in elements.items():
         st = update_status_queue()
         if st: yield st
-        elem.element.postload()
+        if id not in deferred:
+            elem.element.postload()
 
     factory.notify_model()
 
 
-def load(filename, factory, status_queue=None):
+def load(filename, factory, status_queue=None, lazy=False, backend='sax',
+         use_snapshot=False):
     """
     Load a file and create a model if possible.
     Optionally, a status queue function can be given, to which the
     progress is written (as status_queue(progress)).
     """
-    for status in load_generator(filename, factory):
+    for status in load_generator(filename, factory, lazy, backend,
+                                 use_snapshot):
         if status_queue:
             status_queue(status)
 
-def load_generator(filename, factory):
+def load_generator(filename, factory, lazy=False, backend='sax',
+                   use_snapshot=False):
     """
     Load a file and create a model if possible.
     This function is a generator. It will yield values from 0 to 100 (%)
     to indicate its progression.
+
+    If lazy is True, the canvas items of a diagram are created when the
+    diagram is first used. Backend selects the parser backend, 'sax' or
+    'iterparse' (see gaphor.storage.parser). If use_snapshot is True, the
+    parsed elements are read from the snapshot of the file if it is up to
+    date, and a new snapshot is written after the file is parsed
+    and loaded (see gaphor.storage.snapshot).
     """
     if isinstance(filename, (file, InputType)):
         log.info('Loading file from file descriptor')
+        use_snapshot = False
     else:
         log.info('Loading file %s' % os.path.basename(filename))
-    try:
-        # Use the incremental parser and yield the percentage of the file.
-        loader = parser.GaphorLoader()
-        for percentage in parser.parse_generator(filename, loader):
-            pass
-            if percentage:
-                yield percentage / 2
-            else:
-                yield percentage
-        elements = loader.elements
-        gaphor_version = loader.gaphor_version
-        #elements = parser.parse(filename)
-        #yield 100
-    except Exception, e:
-        log.error('File could no be parsed', exc_info=True)
-        raise
+
+    snapshot_data = None
+    cached = use_snapshot and snapshot.read(filename)
+    if cached:
+        log.info('Using snapshot of %s' % os.path.basename(filename))
+        gaphor_version, elements = cached
+        yield 50
+    else:
+        try:
+            # Use the incremental parser and yield the percentage of the file.
+            loader = parser.GaphorLoader()
+            for percentage in parser.parse_generator(filename, loader, backend):
+                pass
+                if percentage:
+                    yield percentage / 2
+                else:
+                    yield percentage
+            elements = loader.elements
+            gaphor_version = loader.gaphor_version
+            #elements = parser.parse(filename)
+            #yield 100
+        except Exception, e:
+            log.error('File could no be parsed', exc_info=True)
+            raise
+        if use_snapshot:
+            # Loading alters the parsed elements, pickle them beforehand
+            snapshot_data = snapshot.dumps(gaphor_version, elements)
 
     try:
         component_registry = Application.get_service('component_registry')
@@ -346,7 +774,7 @@ def load_generator(filename, factory):
         if component_registry:
             component_registry.register_subscription_adapter(ElementChangedEventBlocker)
         try:
-            for percentage in load_elements_generator(elements, factory, gaphor_version):
+            for percentage in load_elements_generator(elements, factory, gaphor_version, lazy):
                 if percentage:
                     yield percentage / 2 + 50
                 else:
@@ -358,6 +786,8 @@ def load_generator(filename, factory):
                 component_registry.unregister_subscription_adapter(ElementChangedEventBlocker)
 
         gc.collect()
+        if snapshot_data:
+            snapshot.write(filename, snapshot_data)
         yield 100
     except Exception, e:
         log.info('file %s could not be loaded' % filename)
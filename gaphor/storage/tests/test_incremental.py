@@ -0,0 +1,241 @@
+"""
+Test incremental saving.
+"""
+
+import os
+import shutil
+import tempfile
+from cStringIO import StringIO
+
+from gaphor.tests.testcase import TestCase
+from gaphor import UML
+from gaphor.application import Application
+from gaphor.diagram import items
+from gaphor.misc.xmlwriter import XMLWriter
+from gaphor.storage import storage, incremental
+
+
+class IncrementalSaveTestCase(TestCase):
+
+    def setUp(self):
+        super(IncrementalSaveTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'model.gaphor')
+        self.tracker = incremental.DirtyTracker(
+                Application.get_service('component_registry'))
+        self.tracker.connect()
+
+    def tearDown(self):
+        self.tracker.disconnect()
+        shutil.rmtree(self.tmpdir)
+        super(IncrementalSaveTestCase, self).tearDown()
+
+    def save(self, full=False, verify=None):
+        if full:
+            dirty = None
+        else:
+            dirty = self.tracker.dirty(self.element_factory)
+        incremental.save(self.filename, self.element_factory, dirty,
+                         verify=verify)
+        self.tracker.clear()
+
+        out = StringIO()
+        storage.save(XMLWriter(out), factory=self.element_factory)
+        with open(self.filename, 'rb') as f:
+            self.assertEquals(out.getvalue(), f.read())
+        return incremental.ElementIndex.read(self.filename)
+
+    def create_model(self):
+        factory = self.element_factory
+        self.package = factory.create(UML.Package)
+        self.package.name = 'model'
+        self.classes = []
+        for i in range(10):
+            c = factory.create(UML.Class)
+            c.name = 'Class%d' % i
+            c.package = self.package
+            self.classes.append(c)
+
+    def test_full_save(self):
+        self.create_model()
+        index = self.save(full=True)
+        assert index
+        self.assertEquals(0, index.saves)
+        self.assertEquals([e.id for e in self.element_factory.values()],
+                          index.fragments.keys())
+
+    def test_patch(self):
+        self.create_model()
+        self.save(full=True)
+
+        self.classes[3].name = 'ClassX'
+        assert self.tracker.dirty(self.element_factory) == \
+                set([self.classes[3].id])
+        ino = os.stat(self.filename).st_ino
+        index = self.save()
+        self.assertEquals(1, index.saves)
+        # The file is patched in place:
+        self.assertEquals(ino, os.stat(self.filename).st_ino)
+
+    def test_rewrite(self):
+        self.create_model()
+        self.save(full=True)
+
+        self.classes[3].name = 'A longer class name'
+        self.save()
+
+        c = self.element_factory.create(UML.Class)
+        c.name = 'New'
+        c.package = self.package
+        self.save()
+
+        self.classes[5].unlink()
+        index = self.save()
+        self.assertEquals(3, index.saves)
+
+        self.element_factory.flush()
+        storage.load(self.filename, factory=self.element_factory)
+        self.assertEquals(10, len(self.element_factory.lselect(
+                lambda e: isinstance(e, UML.Class))))
+
+    def test_stale_index(self):
+        self.create_model()
+        self.save(full=True)
+        with open(self.filename, 'ab') as f:
+            f.write('\n')
+        assert incremental.ElementIndex.read(self.filename) is None
+
+        self.classes[3].name = 'ClassX'
+        self.save()
+
+    def test_compact(self):
+        self.create_model()
+        self.save(full=True)
+        for i in range(incremental.COMPACT_EVERY):
+            self.classes[0].name = 'Class%d' % (i % 10)
+            index = self.save()
+        self.assertEquals(0, index.saves)
+
+    def test_orphans(self):
+        self.create_model()
+        found = []
+        def verify(orphans):
+            found.append(orphans)
+            return True
+        self.save(full=True, verify=verify)
+        self.assertEquals([], found)
+
+        # A comment that is not part of the model:
+        comment = UML.Comment(id='orphan1')
+        comment.annotatedElement = self.classes[3]
+        self.save(full=True, verify=verify)
+        self.assertEquals([set(['orphan1'])], found)
+
+        # Orphans are found in fragments that are not serialized again
+        self.classes[4].name = 'ClassX'
+        index = self.save(verify=verify)
+        self.assertEquals(1, index.saves)
+        self.assertEquals([set(['orphan1'])] * 2, found)
+
+    def test_index_references(self):
+        self.create_model()
+        item = self.create(items.ClassItem, UML.Class)
+        index = self.save(full=True)
+        offset, length, type, ids, refs = index.fragments[self.diagram.id]
+        self.assertEquals((item.id,), ids)
+        assert item.subject.id in refs, refs
+        assert self.package.id in index.fragments[self.classes[3].id][4]
+
+        # Fragments that are serialized again are scanned again
+        comment = self.element_factory.create(UML.Comment)
+        comment.annotatedElement = self.classes[3]
+        index = self.save()
+        self.assertEquals(1, index.saves)
+        self.assertEquals((self.classes[3].id,),
+                          index.fragments[comment.id][4])
+
+    def test_unlink_orphans(self):
+        self.create_model()
+        self.save(full=True)
+        comment = UML.Comment(id='orphan1')
+        comment.annotatedElement = self.classes[3]
+        def verify(orphans):
+            comment.unlink()
+            return False
+        self.classes[4].name = 'ClassX'
+        index = self.save(verify=verify)
+        self.assertEquals(0, index.saves)
+        assert 'orphan1' not in open(self.filename, 'rb').read()
+
+    def test_failed_save(self):
+        self.create_model()
+        self.save(full=True)
+        data = open(self.filename, 'rb').read()
+
+        comment = UML.Comment(id='orphan1')
+        comment.annotatedElement = self.classes[3]
+        def verify(orphans):
+            raise IOError('failed')
+        self.classes[4].name = 'A longer class name'
+        self.assertRaises(IOError, self.save, verify=verify)
+        self.assertEquals(data, open(self.filename, 'rb').read())
+        self.assertEquals(['model.gaphor', 'model.gaphor.index'],
+                          sorted(os.listdir(self.tmpdir)))
+
+    def test_canvas_changes(self):
+        diagram = self.diagram
+        self.save(full=True)
+        self.assertEquals(set(), self.tracker.dirty(self.element_factory))
+
+        item = diagram.create(items.CommentItem,
+                              subject=self.element_factory.create(UML.Comment))
+        dirty = self.tracker.dirty(self.element_factory)
+        assert diagram.id in dirty, dirty
+        self.save()
+
+        item.matrix.translate(10, 10)
+        assert diagram.id in self.tracker.dirty(self.element_factory)
+        self.save()
+
+        item.handles()[0].pos = (5, 5)
+        assert diagram.id in self.tracker.dirty(self.element_factory)
+        self.save()
+
+    def test_item_properties(self):
+        association = self.create(items.AssociationItem, UML.Association)
+        dependency = self.create(items.DependencyItem, UML.Dependency)
+        self.save(full=True)
+
+        association.show_direction = True
+        assert self.diagram.id in self.tracker.dirty(self.element_factory)
+        self.save()
+
+        dependency.auto_dependency = False
+        assert self.diagram.id in self.tracker.dirty(self.element_factory)
+        self.save()
+
+    def test_untracked_item_changes(self):
+        association = self.create(items.AssociationItem, UML.Association)
+        self.save(full=True)
+
+        # Loaded diagrams are always saved again, changes can go unnoticed
+        association._show_direction = True
+        assert not self.tracker.dirty(self.element_factory)
+        self.save()
+
+    def test_swap_element(self):
+        dependency = self.element_factory.create(UML.Dependency)
+        self.save(full=True)
+
+        self.element_factory.swap_element(dependency, UML.Usage)
+        assert dependency.id in self.tracker.dirty(self.element_factory)
+        index = self.save()
+        self.assertEquals('Usage', index.fragments[dependency.id][2])
+
+        # The class is checked also if the element is not known to be dirty
+        self.element_factory.swap_element(dependency, UML.Dependency)
+        self.tracker.clear()
+        self.save()
+
+
+# vim:sw=4:et:ai
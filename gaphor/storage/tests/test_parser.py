@@ -0,0 +1,91 @@
+"""
+Test the parser backends.
+"""
+
+import glob
+import os.path
+import unittest
+import pkg_resources
+from cStringIO import StringIO
+
+from gaphor.misc.odict import odict
+from gaphor.storage import parser
+
+
+def dump(obj):
+    """
+    Return a comparable representation of parsed objects, including types.
+    """
+    if isinstance(obj, parser.base):
+        return type(obj).__name__, dump(obj.__dict__)
+    elif isinstance(obj, list):
+        return map(dump, obj)
+    elif isinstance(obj, odict):
+        return [ (dump(k), dump(v)) for k, v in obj.items() ]
+    elif isinstance(obj, dict):
+        return sorted((dump(k), dump(v)) for k, v in obj.items())
+    return type(obj).__name__, obj
+
+
+class ParserTestCase(unittest.TestCase):
+
+    def load(self, f, backend):
+        loader = parser.GaphorLoader()
+        for x in parser.parse_generator(f, loader, backend):
+            pass
+        return loader
+
+    def assertSameResult(self, f):
+        sax = self.load(f, 'sax')
+        fast = self.load(f, 'iterparse')
+        self.assertEquals(sax.version, fast.version)
+        self.assertEquals(sax.gaphor_version, fast.gaphor_version)
+        self.assertEquals(dump(sax.elements), dump(fast.elements))
+
+    def test_test_diagrams(self):
+        dist = pkg_resources.get_distribution('gaphor')
+        path = os.path.join(dist.location, 'test-diagrams', '*.gaphor')
+        filenames = glob.glob(path)
+        assert filenames
+        for filename in filenames:
+            self.assertSameResult(filename)
+
+    def test_model(self):
+        self.assertSameResult(StringIO("""<?xml version="1.0" encoding="utf-8"?>
+<gaphor xmlns="http://gaphor.sourceforge.net/model" version="3.0" gaphor-version="0.17.1">
+<Diagram id="d1">
+<canvas>
+<item id="i1" type="ClassItem">
+<subject><ref refid="c1"/></subject>
+<item id="i2" type="CommentItem"/>
+</item>
+</canvas>
+<package><ref refid="p1"/></package>
+</Diagram>
+<Package id="p1">
+<name><val>caf\xc3\xa9 &amp; more</val></name>
+<ownedClassifier><reflist><ref refid="c1"/></reflist></ownedClassifier>
+<ownedDiagram><reflist/></ownedDiagram>
+</Package>
+<Class id="c1">
+<name><val></val></name>
+<package><ref refid="p1"/></package>
+</Class>
+</gaphor>"""))
+
+    def test_invalid(self):
+        for backend in ('sax', 'iterparse'):
+            self.assertRaises(Exception, self.load,
+                    StringIO('<gaphor version="3.0"><Class id="c1">'), backend)
+
+    def test_parse_batch(self):
+        dist = pkg_resources.get_distribution('gaphor')
+        path = os.path.join(dist.location, 'test-diagrams', '*.gaphor')
+        filenames = sorted(glob.glob(path))[:3]
+        loaders = parser.parse_batch(filenames, processes=2)
+        self.assertEquals(len(filenames), len(loaders))
+        for filename, loader in zip(filenames, loaders):
+            self.assertEquals(dump(parser.parse(filename)), dump(loader.elements))
+
+
+# vim:sw=4:et:ai
@@ -0,0 +1,162 @@
+"""
+Test model snapshots.
+"""
+
+import os
+import shutil
+import tempfile
+import cPickle as pickle
+
+from gaphor.tests.testcase import TestCase
+from gaphor import UML
+from gaphor.diagram import items
+from gaphor.misc.xmlwriter import XMLWriter
+from gaphor.storage import parser, storage, snapshot
+
+
+class MakeDir(object):
+    """
+    Creates a directory when it is unpickled.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def __reduce__(self):
+        return os.mkdir, (self.path,)
+
+
+class SnapshotTestCase(TestCase):
+
+    def setUp(self):
+        super(SnapshotTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'model.gaphor')
+        self.snapshot_dir = snapshot.snapshot_dir
+        snapshot.snapshot_dir = lambda: os.path.join(self.tmpdir, 'snapshots')
+
+    def tearDown(self):
+        snapshot.snapshot_dir = self.snapshot_dir
+        shutil.rmtree(self.tmpdir)
+        super(SnapshotTestCase, self).tearDown()
+
+    def save(self):
+        f = open(self.filename, 'w')
+        try:
+            storage.save(XMLWriter(f), factory=self.element_factory)
+        finally:
+            f.close()
+
+    def load(self):
+        storage.load(self.filename, self.element_factory, use_snapshot=True)
+
+    def create_model(self):
+        factory = self.element_factory
+        package = factory.create(UML.Package)
+        package.name = 'model'
+        diagram = factory.create(UML.Diagram)
+        diagram.package = package
+        for i in range(5):
+            item = self.create(items.ClassItem, UML.Class)
+            item.subject.name = 'Class%d' % i
+            item.subject.package = package
+        self.save()
+
+    def test_write_on_load(self):
+        self.create_model()
+        assert not os.path.exists(snapshot.path(self.filename))
+        self.load()
+        assert os.path.exists(snapshot.path(self.filename))
+        # No files are added next to the model
+        self.assertEquals(['model.gaphor', 'snapshots'],
+                          sorted(os.listdir(self.tmpdir)))
+
+        gaphor_version, elements = snapshot.read(self.filename)
+        parsed = parser.parse(self.filename)
+        self.assertEquals(parsed.keys(), elements.keys())
+        for id, e in parsed.items():
+            self.assertEquals(type(e), type(elements[id]))
+            self.assertEquals(e.values, elements[id].values)
+            self.assertEquals(e.references, elements[id].references)
+
+    def test_load_snapshot(self):
+        self.create_model()
+        self.load()
+        names = sorted(c.name for c in self.element_factory.select(
+                lambda e: e.isKindOf(UML.Class)))
+
+        # Parsing is skipped if the snapshot is up to date
+        parse_generator = parser.parse_generator
+        def fail(*args):
+            raise AssertionError, 'model is parsed'
+        parser.parse_generator = fail
+        try:
+            self.load()
+        finally:
+            parser.parse_generator = parse_generator
+
+        self.assertEquals(names, sorted(c.name for c in
+                self.element_factory.select(lambda e: e.isKindOf(UML.Class))))
+        diagram = self.element_factory.lselect(
+                lambda e: e.isKindOf(UML.Diagram))[0]
+        self.assertEquals(5, len(diagram.canvas.get_root_items()))
+
+    def test_stale_snapshot(self):
+        self.create_model()
+        self.load()
+        assert snapshot.read(self.filename)
+
+        self.element_factory.create(UML.Class)
+        self.save()
+        assert snapshot.read(self.filename) is None
+
+        self.load()
+        assert snapshot.read(self.filename)
+
+    def test_broken_snapshot(self):
+        self.create_model()
+        self.load()
+        size = self.element_factory.size()
+
+        f = open(snapshot.path(self.filename), 'r+b')
+        try:
+            f.seek(-10, 2)
+            f.truncate()
+        finally:
+            f.close()
+        assert snapshot.read(self.filename) is None
+
+        self.load()
+        self.assertEquals(size, self.element_factory.size())
+
+    def test_snapshot_version(self):
+        self.create_model()
+        self.load()
+
+        version = snapshot.SNAPSHOT_VERSION
+        snapshot.SNAPSHOT_VERSION = 'x'
+        try:
+            assert snapshot.read(self.filename) is None
+        finally:
+            snapshot.SNAPSHOT_VERSION = version
+
+    def test_no_code_execution(self):
+        self.create_model()
+        self.load()
+
+        # A snapshot that calls a function when it is unpickled
+        f = open(snapshot.path(self.filename), 'r+b')
+        try:
+            header = f.readline()
+            f.seek(0)
+            f.truncate()
+            f.write(header)
+            f.write(pickle.dumps(MakeDir(os.path.join(self.tmpdir, 'x')),
+                                 pickle.HIGHEST_PROTOCOL))
+        finally:
+            f.close()
+        assert snapshot.read(self.filename) is None
+        assert not os.path.exists(os.path.join(self.tmpdir, 'x'))
+
+
+# vim:sw=4:et:ai
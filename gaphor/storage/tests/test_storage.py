@@ -101,6 +101,22 @@ class StorageTestCase(TestCase):
         assert len(self.element_factory.lselect(lambda e: e.isKindOf(UML.Class))) == 1
         
 
+    def test_load_lookup_name(self):
+        """
+        The name index of the factory reflects the names of a loaded model.
+        """
+        factory = self.element_factory
+        c = factory.create(UML.Class)
+        c.name = 'A'
+        f = StringIO()
+        storage.save(XMLWriter(f), factory=factory)
+        c.name = 'B'
+        self.assertEquals([c], factory.lookup_name('B'))
+
+        storage.load(StringIO(f.getvalue()), factory)
+        self.assertEquals([], factory.lookup_name('B'))
+        self.assertEquals(['A'], [e.name for e in factory.lookup_name('A')])
+
     def test_load_uml_2(self):
         """
         Test loading of a freshly saved model.
@@ -285,6 +301,150 @@ class StorageTestCase(TestCase):
 
         self.assertEquals(copy, orig, 'Saved model does not match copy')
 
+    def test_fast_save(self):
+        """The fast serializer writes the same data as the XMLWriter"""
+
+        class SlowXMLWriter(XMLWriter):
+            pass
+
+        def save():
+            slow = PseudoFile()
+            storage.save(SlowXMLWriter(slow), factory=self.element_factory)
+            fast = PseudoFile()
+            storage.save(XMLWriter(fast), factory=self.element_factory)
+            self.assertEquals(slow.data, fast.data)
+
+        save()
+
+        factory = self.element_factory
+        package = factory.create(UML.Package)
+        c1 = factory.create(UML.Class)
+        c1.name = 'caf\xc3\xa9 & <"x">'
+        c1.isAbstract = True
+        c1.package = package
+        c2 = factory.create(UML.Class)
+        c2.package = package
+        factory.create(UML.Diagram)
+        diagram = factory.create(UML.Diagram)
+        diagram.package = package
+        diagram.create(items.CommentItem, subject=factory.create(UML.Comment))
+        ci1 = diagram.create(items.ClassItem, subject=c1)
+        ci2 = diagram.create(items.ClassItem, subject=c2)
+        a = diagram.create(items.AssociationItem)
+        self.connect(a, a.head, ci1)
+        self.connect(a, a.tail, ci2)
+
+        save()
+
+    def create_lazy_model(self):
+        factory = self.element_factory
+        package = factory.create(UML.Package)
+        self.diagram.package = package
+        c1 = self.create(items.ClassItem, UML.Class)
+        c1.subject.name = 'A'
+        c1.matrix.translate(10, 10)
+        c2 = self.create(items.ClassItem, UML.Class)
+        c2.subject.name = 'B'
+        a = self.create(items.AssociationItem)
+        self.connect(a, a.head, c1)
+        self.connect(a, a.tail, c2)
+        self.create(items.CommentItem, UML.Comment)
+        f = StringIO()
+        storage.save(XMLWriter(f), factory=factory)
+        data = f.getvalue()
+        factory.flush()
+        storage.load(StringIO(data), factory, lazy=True)
+        return data
+
+    def lookup_class(self, name):
+        return self.element_factory.lselect(lambda e: e.isKindOf(UML.Class) and e.name == name)[0]
+
+    def test_load_lazily(self):
+        """Canvas items are created when the diagram is first used"""
+        self.create_lazy_model()
+        d = self.element_factory.lselect(lambda e: e.isKindOf(UML.Diagram))[0]
+        assert not d.canvas.materialized
+        assert d.canvas._tree.nodes == []
+
+        assert len(d.canvas.select(lambda e: isinstance(e, items.ClassItem))) == 2
+        assert d.canvas.materialized
+        assert len(d.canvas.get_all_items()) == 4
+        for item in d.canvas.get_all_items():
+            if not isinstance(item, items.AssociationItem):
+                assert item.subject, 'No subject for %s' % item
+        a = d.canvas.select(lambda e: isinstance(e, items.AssociationItem))[0]
+        assert a.subject.memberEnd[0].type is self.lookup_class('A')
+
+    def test_load_lazily_watch(self):
+        """Lazily loaded items are notified of changes of their subjects"""
+        self.create_lazy_model()
+        c = self.lookup_class('A')
+        item = c.presentation[0]
+        self.assertEquals('A', item._name.text)
+        c.name = 'C'
+        self.assertEquals('C', item._name.text)
+
+    def test_load_lazily_presentation(self):
+        """Reading the presentation of an element creates the canvas items"""
+        self.create_lazy_model()
+        d = self.element_factory.lselect(lambda e: e.isKindOf(UML.Diagram))[0]
+        c = self.lookup_class('A')
+        assert len(c.presentation) == 1
+        assert d.canvas.materialized
+        assert tuple(c.presentation[0].matrix) == (1, 0, 0, 1, 10, 10)
+
+    def test_load_lazily_unlink(self):
+        """Unlinked elements take their lazily loaded presentation with them"""
+        self.create_lazy_model()
+        d = self.element_factory.lselect(lambda e: e.isKindOf(UML.Diagram))[0]
+        self.lookup_class('B').unlink()
+        assert d.canvas.materialized
+        assert len(d.canvas.select(lambda e: isinstance(e, items.ClassItem))) == 1
+
+    def test_load_lazily_save(self):
+        """A model that is loaded lazily is saved as if it was not"""
+        data = self.create_lazy_model()
+        f = StringIO()
+        storage.save(XMLWriter(f), factory=self.element_factory)
+        lazy_data = f.getvalue()
+
+        storage.load(StringIO(data), self.element_factory)
+        f = StringIO()
+        storage.save(XMLWriter(f), factory=self.element_factory)
+        self.assertEquals(f.getvalue(), lazy_data)
+
+    def test_load_lazily_serialize(self):
+        """Lazily loaded diagrams can be serialized without loading them"""
+        data = self.create_lazy_model()
+        factory = self.element_factory
+        serialize = storage.element_serializer('utf-8', materialize=False)
+        fragments = [serialize(e) for e in factory.values()]
+        class_data = serialize(self.lookup_class('A'))
+        d = factory.lselect(lambda e: e.isKindOf(UML.Diagram))[0]
+        assert not d.canvas.materialized
+
+        f = StringIO()
+        storage.load(StringIO(data), factory)
+        storage.save(XMLWriter(f), factory=factory)
+        expected = f.getvalue()
+        self.assertEquals(storage.element_serializer('utf-8')(
+                self.lookup_class('A')), class_data)
+
+        storage.load(StringIO('%s>\n%s\n</gaphor>' % (
+                storage.document_head('utf-8'), '\n'.join(fragments))), factory)
+        f = StringIO()
+        storage.save(XMLWriter(f), factory=factory)
+        self.assertEquals(expected, f.getvalue())
+
+    def test_load_lazily_flush(self):
+        """Flushing the factory does not create lazily loaded items"""
+        self.create_lazy_model()
+        d = self.element_factory.lselect(lambda e: e.isKindOf(UML.Diagram))[0]
+        self.element_factory.flush()
+        assert d.canvas.materialized
+        assert d.canvas._tree.nodes == []
+        assert not UML.diagram._pending
+
 
 class FileUpgradeTestCase(TestCase):
     def test_association_upgrade(self):
@@ -16,6 +16,7 @@ from gaphor.core import _, inject, transactional, action, toggle_action, build_a
 from gaphor.UML.interfaces import IAttributeChangeEvent, IElementDeleteEvent
 from gaphor.diagram import get_diagram_item
 from gaphor.diagram.items import DiagramItem
+from gaphor.diagram.textelement import text_cache
 from gaphor.transaction import Transaction
 from gaphor.ui.diagramtoolbox import DiagramToolbox
 from gaphor.ui.event import DiagramSelectionChange
@@ -111,6 +112,7 @@ class DiagramTab(object):
         view.connect_after('key-press-event', self._on_key_press_event)
         view.connect('drag-drop', self._on_drag_drop)
         view.connect('drag-data-received', self._on_drag_data_received)
+        view.connect('style-set', self._on_style_set)
 
         self.view = view
         
@@ -272,6 +274,17 @@ class DiagramTab(object):
                 self.delete_selected_items()
 
 
+    def _on_style_set(self, view, previous_style):
+        """
+        Fonts may have changed: drop the cached text layouts and resize
+        the items.
+        """
+        if previous_style:
+            text_cache.clear()
+            canvas = view.canvas
+            for item in canvas.get_all_items():
+                canvas.request_update(item)
+
     def _on_view_selection_changed(self, view, selection_or_focus):
         self.component_registry.handle(DiagramSelectionChange(view, view.focused_item, view.selected_items))
 
@@ -420,7 +420,7 @@ class MainWindow(object):
         Open the toplevel element and load toplevel diagrams.
         """
         # TODO: Make handlers for ModelFactoryEvent from within the GUI obj
-        for diagram in self.element_factory.select(lambda e: e.isKindOf(UML.Diagram) and not (e.namespace and e.namespace.namespace)):
+        for diagram in self.element_factory.select_type(UML.Diagram, lambda e: not (e.namespace and e.namespace.namespace)):
             self.show_diagram(diagram)
     
 
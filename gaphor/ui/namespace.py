@@ -8,6 +8,7 @@ import gobject
 import gtk
 import operator
 import stock
+from bisect import bisect_right
 
 from zope import component
 
@@ -44,6 +45,92 @@ _default_filter_list = (
 _tree_sorter = operator.attrgetter('name')
 
 
+class NodeList(object):
+    """
+    The children of a node in the namespace tree, sorted by name.
+
+    The names are kept in a separate list, so new children can be inserted
+    with a binary search. The position of each child is cached. Inserting or
+    removing a child only invalidates the positions of the children after
+    it.
+    """
+
+    def __init__(self, elements=()):
+        self._elements = []
+        self._keys = []
+        self._index = {}
+        self._valid = 0
+        self.extend(elements)
+
+    def __len__(self):
+        return len(self._elements)
+
+    def __iter__(self):
+        return iter(self._elements)
+
+    def __getitem__(self, index):
+        return self._elements[index]
+
+    def __contains__(self, element):
+        try:
+            self.index(element)
+        except ValueError:
+            return False
+        return True
+
+    def index(self, element):
+        """
+        Return the position of @element. ValueError is raised if the
+        element is not in the list.
+        """
+        elements = self._elements
+        pos = self._index.get(element)
+        if pos is not None and pos < self._valid and elements[pos] is element:
+            return pos
+        index = self._index
+        for i in xrange(self._valid, len(elements)):
+            index[elements[i]] = i
+        self._valid = len(elements)
+        try:
+            return index[element]
+        except KeyError:
+            raise ValueError('%s is not in the list' % (element,))
+
+    def insert(self, element):
+        """
+        Insert @element at its sorted position, after children with the
+        same name. The position is returned.
+        """
+        key = _tree_sorter(element)
+        pos = bisect_right(self._keys, key)
+        self._elements.insert(pos, element)
+        self._keys.insert(pos, key)
+        self._valid = min(self._valid, pos)
+        return pos
+
+    def extend(self, elements):
+        """
+        Add a number of elements and sort the list again.
+        """
+        elements = list(self._elements) + list(elements)
+        elements.sort(key=_tree_sorter)
+        self._elements = elements
+        self._keys = map(_tree_sorter, elements)
+        self._index = {}
+        self._valid = 0
+
+    def remove(self, element):
+        """
+        Remove @element and return its former position.
+        """
+        pos = self.index(element)
+        del self._elements[pos]
+        del self._keys[pos]
+        del self._index[element]
+        self._valid = pos
+        return pos
+
+
 def catchall(func):
     def catchall_wrapper(*args, **kwargs):
         try:
@@ -80,7 +167,7 @@ class NamespaceModel(gtk.GenericTreeModel):
 
         self.factory = factory
 
-        self._nodes = { None: [] }
+        self._nodes = { None: NodeList() }
 
         self.filter = _default_filter_list
 
@@ -161,43 +248,60 @@ class NamespaceModel(gtk.GenericTreeModel):
                 return
             self.row_changed(path, self.get_iter(path))
             parent_nodes = self._nodes[element.namespace]
-            parent_path = self.path_from_element(element.namespace)
-            if not parent_path:
-                return
-
-            original = list(parent_nodes)
-            parent_nodes.sort(key=_tree_sorter)
-            if parent_nodes != original:
-                # reorder the list:
-                self.rows_reordered(parent_path, self.get_iter(parent_path),
-                                    map(list.index,
-                                        [original] * len(parent_nodes),
-                                        parent_nodes))
+            parent_path = path[:-1]
+
+            old = parent_nodes.remove(element)
+            new = parent_nodes.insert(element)
+            if new != old:
+                if parent_path:
+                    # reorder the list:
+                    order = range(len(parent_nodes))
+                    del order[old]
+                    order.insert(new, old)
+                    self.rows_reordered(parent_path,
+                                        self.get_iter(parent_path), order)
+                else:
+                    # Top level rows can not be reordered, move it instead
+                    self.row_deleted(path)
+                    path = (new,)
+                    self.row_inserted(path, self.get_iter(path))
 
 
     def _add_elements(self, element):
         """
-        Add a single element.
+        Add a single element, and its owned members. Only the element
+        itself is signalled: its children are new to the view as well.
         """
         if type(element) not in self.filter:
             return
         if element.namespace not in self._nodes:
             return
 
-        self._nodes.setdefault(element, [])
-        parent = self._nodes[element.namespace]
-        parent.append(element)
-        parent.sort(key=_tree_sorter)
-        path = self.path_from_element(element)
+        self._build_nodes(element)
+        pos = self._nodes[element.namespace].insert(element)
+        path = self.path_from_element(element.namespace) + (pos,)
         self.row_inserted(path, self.get_iter(path))
 
-        # Add children
+
+    def _build_nodes(self, element):
+        """
+        Create the node for an element and its owned members. No signals
+        are emitted.
+        """
+        try:
+            nodes = self._nodes[element]
+        except KeyError:
+            nodes = self._nodes[element] = NodeList()
+
         if isinstance(element, UML.Namespace):
-            for e in element.ownedMember:
-                # check if owned member is indeed within parent's namespace
-                # the check is important in case on Node classes
-                if element is e.namespace:
-                    self._add_elements(e)
+            # check if owned member is indeed within parent's namespace
+            # the check is important in case on Node classes
+            members = [ e for e in element.ownedMember
+                        if type(e) in self.filter and element is e.namespace
+                        and e not in self._nodes ]
+            for e in members:
+                self._build_nodes(e)
+            nodes.extend(members)
 
 
     def _remove_element(self, element):
@@ -269,11 +373,10 @@ class NamespaceModel(gtk.GenericTreeModel):
             # Remove entry from old place
             if self._nodes.has_key(old_value):
                 try:
-                    path = self.path_from_element(old_value) + (self._nodes[old_value].index(element),)
+                    path = self.path_from_element(old_value) + (self._nodes[old_value].remove(element),)
                 except ValueError:
-                    log.error('Unable to create path for element %s and old_value %s' % (element, self._nodes[old_value]))
+                    log.error('Unable to create path for element %s and old_value %s' % (element, list(self._nodes[old_value])))
                 else:
-                    self._nodes[old_value].remove(element)
                     self.row_deleted(path)
                     path = path[:-1] #self.path_from_element(old_value)
                     if path:
@@ -284,10 +387,8 @@ class NamespaceModel(gtk.GenericTreeModel):
             log.debug('Trying to add %s to %s' % (element, new_value))
             if self._nodes.has_key(new_value):
                 if self._nodes.has_key(element):
-                    parent = self._nodes[new_value]
-                    parent.append(element)
-                    parent.sort(key=_tree_sorter)
-                    path = self.path_from_element(element)
+                    pos = self._nodes[new_value].insert(element)
+                    path = self.path_from_element(new_value) + (pos,)
                     self.row_inserted(path, self.get_iter(path))
                 else:
                     self._add_elements(element)
@@ -306,14 +407,24 @@ class NamespaceModel(gtk.GenericTreeModel):
     def flush(self, event=None):
         for n in self._nodes[None]:
             self.row_deleted((0,))
-        self._nodes = {None: []}
+        self._nodes = {None: NodeList()}
 
 
     def _build_model(self):
-        toplevel = self.factory.select(lambda e: isinstance(e, UML.Namespace) and not e.namespace)
+        """
+        Build the tree. Only the top level rows are signalled, the view
+        queries their children when they are expanded.
+        """
+        toplevel = [ e for e in self.factory.select_type(UML.Namespace, lambda e: not e.namespace)
+                     if type(e) in self.filter ]
 
         for element in toplevel:
-            self._add_elements(element)
+            self._build_nodes(element)
+        root = self._nodes[None]
+        root.extend(toplevel)
+
+        for i in xrange(len(root)):
+            self.row_inserted((i,), self.get_iter((i,)))
 
 
     # TreeModel methods:
@@ -381,8 +492,7 @@ class NamespaceModel(gtk.GenericTreeModel):
         """
         Returns true if this node has children, or None.
         """
-        n = self._nodes.get(node)
-        return n or len(n) > 0
+        return bool(self._nodes.get(node))
 
 
     def on_iter_children(self, node):
@@ -1,8 +1,9 @@
 # vim:sw=4:et:ai
 
+import unittest
 from gaphor.tests.testcase import TestCase
 import gaphor.UML as UML
-from gaphor.ui.namespace import NamespaceModel
+from gaphor.ui.namespace import NamespaceModel, NodeList
 from gaphor.application import Application
 
 class NamespaceTestCase(object): ##TestCase):
@@ -179,6 +180,92 @@ class NewNamespaceTestCase(TestCase):
         assert c not in ns._nodes[a]
 
 
+    def test_rename(self):
+        factory = Application.get_service('element_factory')
+        ns = NamespaceModel(factory)
+
+        m = factory.create(UML.Package)
+        m.name = 'm'
+        classes = []
+        for name in ('a', 'c', 'e'):
+            c = factory.create(UML.Class)
+            c.name = name
+            c.package = m
+            classes.append(c)
+        self.assertEquals(classes, list(ns._nodes[m]))
+
+        reordered = []
+        def rows_reordered(path, iter, order):
+            reordered.append((path, order))
+        ns.rows_reordered = rows_reordered
+
+        classes[0].name = 'd'
+        self.assertEquals([ ((ns.path_from_element(m)), [1, 0, 2]) ], reordered)
+        self.assertEquals([classes[1], classes[0], classes[2]], list(ns._nodes[m]))
+        self.assertEquals(ns.path_from_element(m) + (1,),
+                          ns.path_from_element(classes[0]))
+        self.assertEquals(classes[2], ns.on_iter_next(classes[0]))
+        self.assertEquals(None, ns.on_iter_next(classes[2]))
+
+        ns.close()
+
+
+    def test_refresh(self):
+        factory = Application.get_service('element_factory')
+        m = factory.create(UML.Package)
+        m.name = 'm'
+        for i in range(10):
+            c = factory.create(UML.Class)
+            c.name = 'c%d' % (9 - i)
+            c.package = m
+
+        ns = NamespaceModel(factory)
+        inserted = []
+        ns.row_inserted = lambda path, iter: inserted.append(path)
+        ns.row_deleted = lambda path: None
+        ns.refresh()
+
+        # Only the top level rows are signalled
+        self.assertEquals([ (i,) for i in range(len(ns._nodes[None])) ], inserted)
+        self.assertEquals(['c%d' % i for i in range(10)],
+                          [ c.name for c in ns._nodes[m] ])
+        self.assertEquals(ns.path_from_element(m) + (3,),
+                          ns.path_from_element(ns._nodes[m][3]))
+        ns.close()
+
+
+class NodeListTestCase(unittest.TestCase):
+
+    class Node(object):
+        def __init__(self, name):
+            self.name = name
+
+    def test_insert(self):
+        Node = self.Node
+        nodes = NodeList([ Node('b'), Node('a') ])
+        self.assertEquals(['a', 'b'], [ n.name for n in nodes ])
+
+        c = Node('c')
+        self.assertEquals(2, nodes.insert(c))
+        a2 = Node('a')
+        self.assertEquals(1, nodes.insert(a2))
+        self.assertEquals(['a', 'a', 'b', 'c'], [ n.name for n in nodes ])
+        self.assertEquals(3, nodes.index(c))
+        self.assertEquals(1, nodes.index(a2))
+
+    def test_remove(self):
+        Node = self.Node
+        a, b, c = Node('a'), Node('b'), Node('c')
+        nodes = NodeList([ a, b, c ])
+        self.assertEquals(2, nodes.index(c))
+        self.assertEquals(1, nodes.remove(b))
+        self.assertEquals(1, nodes.index(c))
+        assert b not in nodes
+        self.assertRaises(ValueError, nodes.index, b)
+        self.assertRaises(ValueError, nodes.remove, b)
+        self.assertEquals(2, len(nodes))
+
+
 if __name__ == '__main__':
     import unittest
     unittest.main()
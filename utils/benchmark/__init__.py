@@ -0,0 +1,60 @@
+"""
+Benchmarks for Gaphor.
+
+The scripts in this package measure the throughput of the model, storage
+and event handling code. They do not require a display. Run them from the
+top level directory, e.g.:
+
+    python -m utils.benchmark.loading
+
+This module contains some helpers that are shared by the benchmarks.
+"""
+
+import time
+from cStringIO import StringIO
+from xml.sax.saxutils import escape
+
+SIZES = (1000, 10000, 100000)
+
+
+def timed(func, *args, **kwargs):
+    """
+    Call func(*args, **kwargs) and return a (seconds, result) tuple.
+    """
+    start = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - start, result
+
+
+def report(label, size, seconds, unit='element'):
+    """
+    Print a line with the total time and the time per unit.
+    """
+    print '%-24s %8d %ss: %8.3fs (%6.2f us/%s)' % (label, size, unit,
+            seconds, seconds * 1e6 / max(size, 1), unit)
+
+
+def generate_model(size, version='0.17.1'):
+    """
+    Generate a Gaphor model file with ``size`` elements: one package owning
+    ``size - 1`` classes. The file is returned as a (read-only) StringIO
+    instance, so it can be passed to the parser.
+    """
+    out = StringIO()
+    w = out.write
+    w('<?xml version="1.0" encoding="utf-8"?>\n')
+    w('<gaphor xmlns="http://gaphor.sourceforge.net/model" version="3.0"'
+      ' gaphor-version="%s">\n' % version)
+    w('<Package id="pkg">\n<name>\n<val>%s</val>\n</name>\n' % escape('model'))
+    w('<ownedClassifier>\n<reflist>\n')
+    for i in xrange(1, size):
+        w('<ref refid="c%d"/>\n' % i)
+    w('</reflist>\n</ownedClassifier>\n</Package>\n')
+    for i in xrange(1, size):
+        w('<Class id="c%d">\n<name>\n<val>Class%d</val>\n</name>\n'
+          '<package>\n<ref refid="pkg"/>\n</package>\n</Class>\n' % (i, i))
+    w('</gaphor>\n')
+    return StringIO(out.getvalue())
+
+
+# vim:sw=4:et:ai
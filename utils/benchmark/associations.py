@@ -0,0 +1,58 @@
+"""
+Measure adding and removing elements in large association collections.
+
+A number of classes is added to one package, as happens when a large model
+is loaded or imported. The index of every class in Package.ownedClassifier
+is looked up, and the classes are removed again, both from the end and
+from the start of the collection.
+
+Usage:
+    python -m utils.benchmark.associations [elements ...]
+"""
+
+import sys
+
+from gaphor import UML
+from utils.benchmark import timed, report
+
+SIZES = (1000, 10000, 50000)
+
+
+def add(package, classes):
+    for c in classes:
+        c.package = package
+
+
+def index(package, classes):
+    members = package.ownedClassifier
+    for c in classes:
+        members.index(c)
+
+
+def remove(classes):
+    for c in classes:
+        del c.package
+
+
+def main(sizes=SIZES):
+    for size in sizes:
+        package = UML.Package()
+        classes = [UML.Class() for i in xrange(size)]
+
+        t, _ = timed(add, package, classes)
+        report('add', size, t)
+        t, _ = timed(index, package, classes)
+        report('index', size, t)
+        t, _ = timed(remove, reversed(classes))
+        report('remove (from end)', size, t)
+
+        add(package, classes)
+        t, _ = timed(remove, classes)
+        report('remove (from start)', size, t)
+
+
+if __name__ == '__main__':
+    main(map(int, sys.argv[1:]) or SIZES)
+
+
+# vim:sw=4:et:ai
@@ -0,0 +1,73 @@
+"""
+Measure the backup service for synthetic models of increasing size.
+
+The model is loaded and backed up in full, then a few elements are changed
+and a backup is made again. The backups are made in slices, like they are
+in idle time. Reported are the total time spent in slices, the longest
+slice (this is how long editing is held up at most) and the time it takes
+to write the compressed backup file (which is done in a separate thread).
+
+Usage:
+    python -m utils.benchmark.autosave [size ...]
+"""
+
+import sys
+import time
+import shutil
+import tempfile
+
+from gaphor import UML
+from gaphor.application import Application
+from gaphor.storage import storage
+from utils.benchmark import SIZES, timed, report, generate_model
+
+
+def slices(generator):
+    """
+    Run the generator and return the total and longest time between two
+    yields.
+    """
+    total = longest = 0.0
+    start = time.time()
+    for x in generator:
+        t = time.time() - start
+        total += t
+        longest = max(longest, t)
+        start = time.time()
+    t = time.time() - start
+    return total + t, max(longest, t)
+
+
+def main(sizes=SIZES):
+    Application.init(services=['element_factory', 'properties',
+                               'backup_service'])
+    factory = Application.get_service('element_factory')
+    service = Application.get_service('backup_service')
+    service.backup_dir = tempfile.mkdtemp()
+
+    try:
+        for size in sizes:
+            storage.load(generate_model(size), factory)
+            service._unsaved = True
+
+            total, longest = slices(service.backup_generator())
+            report('full backup', size, total)
+            report('  longest slice', size, longest)
+            t, _ = timed(service._write, '', service._fragments.values())
+            report('  write', size, t)
+
+            for c in factory.lselect(lambda e: e.isKindOf(UML.Class))[:10]:
+                c.name = c.name + 'x'
+            total, longest = slices(service.backup_generator())
+            report('backup of 10 changes', size, total)
+            report('  longest slice', size, longest)
+    finally:
+        Application.shutdown()
+        shutil.rmtree(service.backup_dir)
+
+
+if __name__ == '__main__':
+    main(map(int, sys.argv[1:]) or SIZES)
+
+
+# vim:sw=4:et:ai
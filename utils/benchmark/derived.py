@@ -0,0 +1,79 @@
+"""
+Count the derived union recomputations caused by a single model edit.
+
+A model with a number of associations (each with two member ends) is
+created. After all derived values (lower, upper, endType) have been read,
+one property is edited and all derived values are read again. Ideally only
+the values of the edited element (and the association it belongs to) are
+recomputed.
+
+Usage:
+    python -m utils.benchmark.derived [associations]
+"""
+
+import sys
+
+from gaphor import UML
+from gaphor.UML.properties import derived
+from utils.benchmark import timed, report
+
+
+class counter(object):
+    """
+    Count calls to derived._update().
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        self._update = derived._update
+        def _update(prop, obj):
+            self.count += 1
+            return self._update(prop, obj)
+        derived._update = _update
+        return self
+
+    def __exit__(self, *exc):
+        derived._update = self._update
+
+
+def read_all(properties, associations):
+    for p in properties:
+        p.lower, p.upper
+    for a in associations:
+        a.endType
+
+
+def main(size=5000):
+    factory = UML.ElementFactory()
+    associations = []
+    properties = []
+    for i in xrange(size):
+        a = factory.create(UML.Association)
+        for j in range(2):
+            p = factory.create(UML.Property)
+            p.lowerValue = '0'
+            p.upperValue = '*'
+            p.type = factory.create(UML.Class)
+            a.memberEnd = p
+            properties.append(p)
+        associations.append(a)
+    read_all(properties, associations)
+
+    edits = (('lowerValue', lambda: setattr(properties[0], 'lowerValue', '1')),
+             ('type', lambda: setattr(properties[0], 'type',
+                                      factory.create(UML.Class))))
+    for label, edit in edits:
+        edit()
+        with counter() as c:
+            t, _ = timed(read_all, properties, associations)
+        print '%-24s %8d recomputations' % ('edit ' + label, c.count)
+        report('read after edit', len(properties) + size, t, unit='value')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
+
+
+# vim:sw=4:et:ai
@@ -0,0 +1,94 @@
+"""
+Measure loading time of models with many diagrams, with and without lazy
+canvas loading.
+
+The model consists of a number of diagrams, each showing ten classes with
+an association between each pair of neighbours. It is loaded with
+storage.load(), once with all canvas items created up front and once with
+lazy=True. For the latter the time it takes to open one diagram is
+reported as well. Memory is reported as the number of objects tracked by
+the garbage collector after loading.
+
+Usage:
+    python -m utils.benchmark.diagrams [diagrams ...]
+"""
+
+import gc
+import sys
+from cStringIO import StringIO
+
+from gaphor import UML
+from gaphor.application import Application
+from gaphor.diagram import items
+from gaphor.misc.xmlwriter import XMLWriter
+from gaphor.storage import storage
+from gaphas.aspect import Connector, ConnectionSink
+from utils.benchmark import timed, report
+
+SIZES = (10, 50, 100)
+
+
+def connect(line, handle, item):
+    Connector(line, handle).connect(ConnectionSink(item, item.ports()[0]))
+
+
+def create_model(factory, size):
+    package = factory.create(UML.Package)
+    package.name = 'model'
+    for n in xrange(size):
+        diagram = factory.create(UML.Diagram)
+        diagram.package = package
+        previous = None
+        for i in xrange(10):
+            item = diagram.create(items.ClassItem,
+                                  subject=factory.create(UML.Class))
+            item.subject.name = 'Class%d_%d' % (n, i)
+            item.subject.package = package
+            item.matrix.translate(i * 150, 0)
+            if previous:
+                line = diagram.create(items.AssociationItem)
+                connect(line, line.head, previous)
+                connect(line, line.tail, item)
+            previous = item
+    out = StringIO()
+    storage.save(XMLWriter(out), factory)
+    return out.getvalue()
+
+
+def objects():
+    gc.collect()
+    return len(gc.get_objects())
+
+
+def main(sizes=SIZES):
+    Application.init(services=['element_factory', 'component_registry',
+            'element_dispatcher', 'adapter_loader'])
+    factory = Application.get_service('element_factory')
+
+    for size in sizes:
+        data = create_model(factory, size)
+        factory.flush()
+        base = objects()
+
+        t, _ = timed(storage.load, StringIO(data), factory)
+        report('load', size, t, 'diagram')
+        print '%d objects' % (objects() - base)
+        factory.flush()
+
+        t, _ = timed(storage.load, StringIO(data), factory, lazy=True)
+        report('load (lazy)', size, t, 'diagram')
+        print '%d objects' % (objects() - base)
+
+        diagram = list(factory.select_type(UML.Diagram))[0]
+        t, _ = timed(diagram.canvas.get_all_items)
+        report('open diagram (lazy)', 1, t, 'diagram')
+        factory.flush()
+
+    Application.shutdown()
+
+
+if __name__ == '__main__':
+    main(map(int, sys.argv[1:]) or SIZES)
+
+
+# vim:sw=4:et:ai
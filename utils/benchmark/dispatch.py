@@ -0,0 +1,87 @@
+"""
+Measure the cost of dispatching model change events to derived properties.
+
+Derived properties (derived, derivedunion and redefine) used to register an
+event handler each. Every IElementChangeEvent was dispatched to all of them,
+only to be discarded by most. This is emulated by the "per property"
+registry. Now one handler looks up the dependent properties in an index.
+
+In both cases the actual work done by the derived properties is left out:
+only the dispatching is measured.
+
+Usage:
+    python -m utils.benchmark.dispatch [events]
+"""
+
+import sys
+from zope import component
+from zope.component import registry
+
+from gaphor import UML
+from gaphor.UML.element import Element
+from gaphor.UML.properties import derived, redefine, dependents
+from gaphor.UML.interfaces import IElementChangeEvent
+from gaphor.UML.event import AttributeChangeEvent, AssociationSetEvent
+from utils.benchmark import timed, report
+
+
+def derived_properties():
+    props = set()
+    for c in vars(UML).values():
+        if isinstance(c, type) and issubclass(c, Element):
+            for p in c().umlproperties():
+                if isinstance(p, (derived, redefine)):
+                    props.add(p)
+    return props
+
+
+def per_property_registry(props):
+    reg = registry.Components('per property')
+    for p in props:
+        if isinstance(p, redefine):
+            def handler(event, original=p.original):
+                if event.property is original:
+                    pass
+        else:
+            def handler(event, subsets=p.subsets):
+                if event.property in subsets:
+                    pass
+        reg.registerHandler(handler, (IElementChangeEvent,))
+    return reg
+
+
+def indexed_registry():
+    reg = registry.Components('indexed')
+    @component.adapter(IElementChangeEvent)
+    def handler(event):
+        for d in dependents.get(event.property):
+            pass
+    reg.registerHandler(handler)
+    return reg
+
+
+def fire(reg, events):
+    handle = reg.handle
+    for e in events:
+        handle(e)
+
+
+def main(n=100000):
+    props = derived_properties()
+    print '%d derived properties' % len(props)
+
+    c = UML.Class()
+    events = [AttributeChangeEvent(c, UML.Class.name, None, 'name'),
+              AssociationSetEvent(c, UML.Class.package, None, None)] * (n / 2)
+
+    for label, reg in (('per property handlers', per_property_registry(props)),
+                       ('indexed handler', indexed_registry())):
+        t, _ = timed(fire, reg, events)
+        report(label, len(events), t, unit='event')
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
+
+
+# vim:sw=4:et:ai
@@ -0,0 +1,82 @@
+"""
+Measure the cost of sending events through the component registry.
+
+Each event used to be checked against the registered event filters
+(``subscribers(objects, IEventFilter)``) and was then handed to
+``Components.handle()``, which looks up the handlers for every single event.
+Both lookups are now cached per event class.
+
+Usage:
+    python -m utils.benchmark.events [events]
+"""
+
+import sys
+from zope import component
+
+from gaphor import UML
+from gaphor.application import Application
+from gaphor.interfaces import IEventFilter
+from gaphor.UML.interfaces import IElementChangeEvent
+from gaphor.UML.event import AttributeChangeEvent
+from gaphor.UML.elementfactory import ElementChangedEventBlocker
+from utils.benchmark import timed, report
+
+
+def generic_handle(registry, *events):
+    """
+    The old implementation of ZopeComponentRegistry.handle().
+    """
+    components = registry._components
+    objects = list(events)
+    for o in events:
+        for adapter in components.subscribers(events, IEventFilter):
+            if adapter.filter():
+                objects.remove(o)
+                break
+    if objects:
+        map(components.handle, events)
+
+
+def fire(handle, events):
+    for e in events:
+        handle(e)
+
+
+def fire_generic(registry, events):
+    for e in events:
+        generic_handle(registry, e)
+
+
+def main(n=1000000):
+    Application.init(services=['component_registry'])
+    registry = Application.get_service('component_registry')
+
+    @component.adapter(IElementChangeEvent)
+    def handler(event):
+        pass
+    registry.register_handler(handler)
+
+    c = UML.Class()
+    events = [AttributeChangeEvent(c, UML.Class.name, None, 'name')] * n
+
+    t, _ = timed(fire_generic, registry, events)
+    report('generic lookup', n, t, unit='event')
+    t, _ = timed(fire, registry.handle, events)
+    report('cached lookup', n, t, unit='event')
+
+    registry.register_subscription_adapter(ElementChangedEventBlocker)
+    t, _ = timed(fire_generic, registry, events)
+    report('generic lookup, blocked', n, t, unit='event')
+    t, _ = timed(fire, registry.handle, events)
+    report('cached lookup, blocked', n, t, unit='event')
+    registry.unregister_subscription_adapter(ElementChangedEventBlocker)
+
+    registry.unregister_handler(handler)
+    Application.shutdown()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
+
+
+# vim:sw=4:et:ai
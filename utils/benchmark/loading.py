@@ -0,0 +1,51 @@
+"""
+Measure model loading time for synthetic models of increasing size.
+
+Parsing the XML into parser.element objects is measured separately, as
+well as a full storage.load() (parsing and creating the model elements)
+and flushing the element factory afterwards. The time per element should
+stay (roughly) constant as the model grows.
+
+Usage:
+    python -m utils.benchmark.loading [size ...]
+"""
+
+import sys
+
+from gaphor.application import Application
+from gaphor.storage import parser, storage
+from utils.benchmark import SIZES, timed, report, generate_model
+
+
+def parse(f):
+    loader = parser.GaphorLoader()
+    for x in parser.parse_generator(f, loader):
+        pass
+    return loader.elements
+
+
+def main(sizes=SIZES):
+    Application.init(services=['element_factory'])
+    factory = Application.get_service('element_factory')
+
+    for size in sizes:
+        f = generate_model(size)
+        t, elements = timed(parse, f)
+        assert len(elements) == size
+        report('parse', size, t)
+
+        t, _ = timed(storage.load, generate_model(size), factory)
+        assert factory.size() == size
+        report('load', size, t)
+
+        t, _ = timed(factory.flush)
+        report('flush', size, t)
+
+    Application.shutdown()
+
+
+if __name__ == '__main__':
+    main(map(int, sys.argv[1:]) or SIZES)
+
+
+# vim:sw=4:et:ai
@@ -0,0 +1,90 @@
+"""
+Measure the memory used by model elements.
+
+A model is loaded from a generated file (one package owning a number of
+classes, see utils.benchmark.generate_model()) and a model is created
+with classes that have an attribute and an operation. The growth of the
+resident set size is reported per element. Every measurement is done in a
+child process, so memory freed by one run does not hide the next one.
+This works on Linux only (it reads /proc/self/statm).
+
+Usage:
+    python -m utils.benchmark.memory [elements ...]
+"""
+
+import gc
+import os
+import sys
+
+from gaphor import UML
+from gaphor.application import Application
+from gaphor.storage import storage
+from utils.benchmark import generate_model
+
+SIZES = (10000, 100000)
+
+
+def rss():
+    f = open('/proc/self/statm')
+    try:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    finally:
+        f.close()
+
+
+def load(factory, size):
+    storage.load(generate_model(size), factory)
+
+
+def create(factory, size):
+    for i in xrange(size / 3):
+        c = factory.create(UML.Class)
+        c.name = 'Class%d' % i
+        a = factory.create(UML.Property)
+        a.name = 'attr%d' % i
+        c.ownedAttribute = a
+        o = factory.create(UML.Operation)
+        o.name = 'op%d' % i
+        c.ownedOperation = o
+
+
+def measure(func, factory, size):
+    """
+    Run func(factory, size) in a child process and return the number of
+    elements created and the growth of the resident set size.
+    """
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        gc.collect()
+        before = rss()
+        func(factory, size)
+        gc.collect()
+        os.write(w, '%d %d' % (factory.size(), rss() - before))
+        os._exit(0)
+    os.close(w)
+    result = os.read(r, 100)
+    os.close(r)
+    os.waitpid(pid, 0)
+    return map(int, result.split())
+
+
+def main(sizes=SIZES):
+    Application.init(services=['element_factory'])
+    factory = Application.get_service('element_factory')
+
+    for size in sizes:
+        for label, func in (('load', load), ('create', create)):
+            n, growth = measure(func, factory, size)
+            print '%-24s %8d elements: %10d bytes (%6d bytes/element)' % (
+                    label, n, growth, growth / max(n, 1))
+
+    Application.shutdown()
+
+
+if __name__ == '__main__':
+    main(map(int, sys.argv[1:]) or SIZES)
+
+
+# vim:sw=4:et:ai
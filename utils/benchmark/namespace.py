@@ -0,0 +1,100 @@
+"""
+Measure the namespace tree model on large models.
+
+The model consists of packages with a few thousand classes each. The tree
+model is built, then the callbacks a tree view uses when scrolling through
+all rows are called (on_iter_children, on_iter_next, on_get_path and
+on_get_iter). Next some classes are renamed, classes are added to a
+package, and the model is refreshed. No display is needed, but PyGTK
+should be installed.
+
+Usage:
+    python -m utils.benchmark.namespace [elements ...]
+"""
+
+import sys
+
+from gaphor import UML
+from gaphor.application import Application
+from gaphor.ui.namespace import NamespaceModel
+from utils.benchmark import timed, report
+
+SIZES = (10000, 100000)
+PACKAGE_SIZE = 5000
+CHANGES = 1000
+
+
+def create_model(factory, size):
+    for p in xrange(max(size / PACKAGE_SIZE, 1)):
+        package = factory.create(UML.Package)
+        package.name = 'package%d' % p
+        for i in xrange(min(size, PACKAGE_SIZE) - 1):
+            c = factory.create(UML.Class)
+            c.name = 'Class%d' % i
+            c.package = package
+
+
+def scroll(model):
+    """
+    Visit every row, as a tree view does with all rows expanded.
+    """
+    n = 0
+    node = model.on_iter_children(None)
+    while node:
+        child = model.on_iter_children(node)
+        while child:
+            path = model.on_get_path(child)
+            assert model.on_get_iter(path) is child
+            child = model.on_iter_next(child)
+            n += 1
+        node = model.on_iter_next(node)
+        n += 1
+    return n
+
+
+def rename(classes):
+    for c in classes:
+        c.name = 'Renamed' + c.name
+
+
+def add(factory, package):
+    for i in xrange(CHANGES):
+        c = factory.create(UML.Class)
+        c.name = 'Added%d' % i
+        c.package = package
+
+
+def main(sizes=SIZES):
+    Application.init(services=['element_factory', 'component_registry',
+            'element_dispatcher', 'adapter_loader'])
+    factory = Application.get_service('element_factory')
+
+    for size in sizes:
+        create_model(factory, size)
+        size = factory.size()
+
+        t, model = timed(NamespaceModel, factory)
+        report('build', size, t)
+        t, n = timed(scroll, model)
+        report('scroll', n, t, 'row')
+
+        package = model.on_iter_children(None)
+        classes = list(model._nodes[package])[:CHANGES]
+        t, _ = timed(rename, classes)
+        report('rename', len(classes), t)
+        t, _ = timed(add, factory, package)
+        report('add', CHANGES, t)
+        t, _ = timed(model.refresh)
+        report('refresh', factory.size(), t)
+
+        model.close()
+        factory.flush()
+
+    Application.shutdown()
+
+
+if __name__ == '__main__':
+    main(map(int, sys.argv[1:]) or SIZES)
+
+
+# vim:sw=4:et:ai
@@ -0,0 +1,77 @@
+"""
+Compare the parser backends on the models in test-diagrams/ and on
+synthetic models of increasing size.
+
+Each file is parsed with the SAX backend and with the iterparse backend,
+the results are checked to be the same. The files in test-diagrams/ are
+finally parsed in one batch, in a process pool.
+
+Usage:
+    python -m utils.benchmark.parsing [size ...]
+"""
+
+import glob
+import os
+import shutil
+import sys
+import tempfile
+
+from gaphor.storage import parser
+from utils.benchmark import SIZES, timed, report, generate_model
+
+
+def parse(f, backend):
+    if hasattr(f, 'reset'):
+        f.reset()
+    loader = parser.GaphorLoader()
+    for x in parser.parse_generator(f, loader, backend):
+        pass
+    return loader.elements
+
+
+def compare(label, f):
+    t_sax, elements = timed(parse, f, 'sax')
+    report('%s (sax)' % label, len(elements), t_sax)
+    t_iter, iter_elements = timed(parse, f, 'iterparse')
+    report('%s (iterparse)' % label, len(elements), t_iter)
+    assert elements.keys() == iter_elements.keys()
+    print '%.1fx' % (t_sax / t_iter)
+    return t_sax, t_iter
+
+
+def main(sizes=SIZES):
+    filenames = sorted(glob.glob('test-diagrams/*.gaphor'))
+    total_sax = total_iter = 0.0
+    for filename in filenames:
+        t_sax, t_iter = compare(os.path.basename(filename), filename)
+        total_sax += t_sax
+        total_iter += t_iter
+    print 'test-diagrams: %.3fs vs %.3fs' % (total_sax, total_iter)
+
+    for size in sizes:
+        compare('generated', generate_model(size))
+
+    # The batch mode needs real files:
+    tmpdir = tempfile.mkdtemp()
+    try:
+        batch = []
+        for size in sizes:
+            filename = os.path.join(tmpdir, 'model%d.gaphor' % size)
+            with open(filename, 'wb') as f:
+                f.write(generate_model(size).getvalue())
+            batch.append(filename)
+        batch.extend(filenames)
+
+        t, _ = timed(map, lambda f: parse(f, 'iterparse'), batch)
+        report('sequential', len(batch), t, 'file')
+        t, _ = timed(parser.parse_batch, batch)
+        report('batch', len(batch), t, 'file')
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main(map(int, sys.argv[1:]) or SIZES)
+
+
+# vim:sw=4:et:ai
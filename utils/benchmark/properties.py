@@ -0,0 +1,72 @@
+"""
+Measure save and unlink throughput over the full UML meta model.
+
+For every class in gaphor.UML one element is created per round. The elements
+are saved (with a save function that does nothing) and unlinked. As a
+reference, the time needed to look up the UML properties with a dir() scan
+of the class is shown as well.
+
+Usage:
+    python -m utils.benchmark.properties [rounds]
+"""
+
+import sys
+
+from gaphor import UML
+from gaphor.UML.element import Element
+from gaphor.UML.properties import umlproperty
+from utils.benchmark import timed, report
+
+
+def uml_classes():
+    return [c for c in vars(UML).values()
+            if isinstance(c, type) and issubclass(c, Element)]
+
+
+def dir_scan(elements):
+    for e in elements:
+        class_ = type(e)
+        for propname in dir(class_):
+            if not propname.startswith('_'):
+                prop = getattr(class_, propname)
+                if isinstance(prop, umlproperty):
+                    pass
+
+
+def table_scan(elements):
+    for e in elements:
+        for prop in e.umlproperties():
+            pass
+
+
+def save(elements):
+    def save_func(name, value):
+        pass
+    for e in elements:
+        e.save(save_func)
+
+
+def unlink(elements):
+    for e in elements:
+        e.unlink()
+
+
+def main(rounds=100):
+    factory = UML.ElementFactory()
+    classes = uml_classes()
+    elements = [factory.create(c) for r in xrange(rounds) for c in classes]
+    size = len(elements)
+
+    for label, func in (('dir() scan', dir_scan),
+                        ('property table scan', table_scan),
+                        ('save', save),
+                        ('unlink', unlink)):
+        t, _ = timed(func, elements)
+        report(label, size, t)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
+
+
+# vim:sw=4:et:ai
@@ -0,0 +1,59 @@
+"""
+Measure query expressions on collections, as used by scripts and plugins.
+
+A class is created with a number of operations. The operations are looked
+up by name with a query like ``c.ownedOperation['it.name=="op1"']``, both
+on the collection (which can use the name index of the element factory)
+and on a plain collectionlist. Other queries filter the list with the
+compiled expression.
+
+Usage:
+    python -m utils.benchmark.queries [operations ...]
+"""
+
+import sys
+
+from gaphor import UML
+from gaphor.UML.collection import collectionlist
+from utils.benchmark import timed, report
+
+SIZES = (100, 1000, 10000)
+QUERIES = 1000
+
+
+def create_class(factory, size):
+    c = factory.create(UML.Class)
+    for i in xrange(size):
+        o = factory.create(UML.Operation)
+        o.name = 'op%d' % i
+        c.ownedOperation = o
+    return c
+
+
+def query(items, expressions):
+    for expr in expressions:
+        items[expr]
+
+
+def main(sizes=SIZES):
+    factory = UML.ElementFactory()
+    for size in sizes:
+        c = create_class(factory, size)
+        by_name = ['it.name=="op%d"' % (i % size) for i in xrange(QUERIES)]
+        other = ['it.isQuery or it.name=="op%d"' % (i % size)
+                 for i in xrange(QUERIES)]
+
+        t, _ = timed(query, c.ownedOperation, by_name)
+        report('name (collection)', QUERIES, t, 'lookup')
+        t, _ = timed(query, collectionlist(c.ownedOperation), by_name)
+        report('name (list)', QUERIES, t, 'lookup')
+        t, _ = timed(query, c.ownedOperation, other)
+        report('expression', QUERIES, t, 'lookup')
+        factory.flush()
+
+
+if __name__ == '__main__':
+    main(map(int, sys.argv[1:]) or SIZES)
+
+
+# vim:sw=4:et:ai
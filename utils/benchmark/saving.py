@@ -0,0 +1,117 @@
+"""
+Measure model saving time for synthetic models of increasing size.
+
+The model consists of classes with two attributes and an operation each.
+It is saved through the generic SAX based path (save_generator() with a
+XMLWriter subclass) and through the fast serializer. Both write to an in
+memory file. Throughput is reported in elements and in megabytes per second.
+
+Then the model is saved to a file the way the file manager does it: once
+by checking for orphan references first (verify.orphan_references()) and
+saving next, and once by checking references while saving.
+
+Last, the saved file is saved again incrementally, with references
+checked: once with a class renamed to a name of the same length (the
+fragment is written over the old one), and once with a longer name (the
+file is written again).
+
+Usage:
+    python -m utils.benchmark.saving [size ...]
+"""
+
+import os
+import sys
+import tempfile
+from cStringIO import StringIO
+
+from gaphor import UML
+from gaphor.storage import storage, verify, incremental
+from gaphor.misc.xmlwriter import XMLWriter
+from utils.benchmark import SIZES, timed, report
+
+
+class SAXWriter(XMLWriter):
+    """
+    A XMLWriter subclass is not picked up by the fast serializer.
+    """
+
+
+def create_model(factory, size):
+    package = factory.create(UML.Package)
+    package.name = 'model'
+    while factory.size() < size:
+        c = factory.create(UML.Class)
+        c.name = 'Class%d' % factory.size()
+        c.package = package
+        for name in ('a', 'b'):
+            p = factory.create(UML.Property)
+            p.name = name
+            p.isStatic = False
+            c.ownedAttribute = p
+        o = factory.create(UML.Operation)
+        o.name = 'op'
+        c.ownedOperation = o
+
+
+def save(writer_class, factory):
+    out = StringIO()
+    storage.save(writer_class(out), factory)
+    return out.getvalue()
+
+
+def verify_and_save(filename, factory):
+    assert not verify.orphan_references(factory)
+    incremental.save(filename, factory)
+
+
+def no_orphans(orphans):
+    raise AssertionError('orphans found: %s' % orphans)
+
+
+def save_changed(filename, factory, name):
+    """
+    Rename a class and save the model incrementally.
+    """
+    c = factory.select_type(UML.Class).next()
+    c.name = name
+    incremental.save(filename, factory, set([c.id]), verify=no_orphans)
+
+
+def main(sizes=SIZES):
+    fd, filename = tempfile.mkstemp(suffix='.gaphor')
+    os.close(fd)
+    for size in sizes:
+        factory = UML.ElementFactory()
+        create_model(factory, size)
+
+        t_sax, data = timed(save, SAXWriter, factory)
+        report('save (SAX)', factory.size(), t_sax)
+        t_fast, fast_data = timed(save, XMLWriter, factory)
+        report('save (fast)', factory.size(), t_fast)
+
+        assert data == fast_data
+        mb = len(data) / 1e6
+        print '%.1f MB: %.1f MB/s vs %.1f MB/s (%.1fx)' % (mb,
+                mb / t_sax, mb / t_fast, t_sax / t_fast)
+
+        t_separate, _ = timed(verify_and_save, filename, factory)
+        report('verify, save file', factory.size(), t_separate)
+        t_checked, _ = timed(incremental.save, filename, factory,
+                             verify=no_orphans)
+        report('save file (checked)', factory.size(), t_checked)
+
+        t_patch, _ = timed(save_changed, filename, factory, 'ClassX')
+        report('save changed (patch)', factory.size(), t_patch)
+        t_rewrite, _ = timed(save_changed, filename, factory, 'Class XYZ')
+        report('save changed (rewrite)', factory.size(), t_rewrite)
+
+        factory.flush()
+    os.remove(filename)
+    os.remove(filename + incremental.INDEX_EXT)
+
+
+if __name__ == '__main__':
+    main(map(int, sys.argv[1:]) or SIZES)
+
+
+# vim:sw=4:et:ai
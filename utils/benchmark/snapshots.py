@@ -0,0 +1,80 @@
+"""
+Measure model loading time with and without snapshots.
+
+A synthetic model is written to a file. It is loaded the normal way
+(parsing the XML), once more while a snapshot is written, and finally from
+the snapshot. Every load runs in a child process, so it starts with an
+empty element factory and is not slowed down by the garbage of an earlier
+load. Reading the snapshot alone (validation included) is measured as well.
+
+This works on Unix only (it forks).
+
+Usage:
+    python -m utils.benchmark.snapshots [size ...]
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+from gaphor.application import Application
+from gaphor.storage import storage, snapshot
+from utils.benchmark import SIZES, timed, report, generate_model
+
+
+def measure(func, *args, **kwargs):
+    """
+    Run func(*args, **kwargs) in a child process and return the time it
+    took.
+    """
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        t, _ = timed(func, *args, **kwargs)
+        os.write(w, repr(t))
+        os._exit(0)
+    os.close(w)
+    result = os.read(r, 100)
+    os.close(r)
+    os.waitpid(pid, 0)
+    return float(result)
+
+
+def main(sizes=SIZES):
+    Application.init(services=['element_factory'])
+    factory = Application.get_service('element_factory')
+    tmpdir = tempfile.mkdtemp()
+
+    try:
+        for size in sizes:
+            filename = os.path.join(tmpdir, 'model%d.gaphor' % size)
+            f = open(filename, 'wb')
+            f.write(generate_model(size).getvalue())
+            f.close()
+
+            t = measure(storage.load, filename, factory)
+            report('load xml', size, t)
+
+            t = measure(storage.load, filename, factory, use_snapshot=True)
+            report('load xml + snapshot', size, t)
+
+            t = measure(snapshot.read, filename)
+            report('read snapshot', size, t)
+
+            t = measure(storage.load, filename, factory, use_snapshot=True)
+            report('load snapshot', size, t)
+            # Snapshots are kept in the user's snapshot directory
+            snapshot.remove(filename)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    Application.shutdown()
+
+
+if __name__ == '__main__':
+    main(map(int, sys.argv[1:]) or SIZES)
+
+
+# vim:sw=4:et:ai
@@ -0,0 +1,89 @@
+"""
+Measure updating and painting class diagrams with many features.
+
+A diagram shows a number of classes with attributes and operations. All
+items are updated (as happens when a diagram is opened) and the diagram is
+painted on an image surface, as is done on export. Updates are done both
+with an empty text cache and with a warm one. PyGTK should be installed,
+no display is needed.
+
+Usage:
+    python -m utils.benchmark.textlayout [features ...]
+"""
+
+import sys
+import cairo
+
+from gaphas.view import View
+from gaphas.painter import ItemPainter
+
+from gaphor import UML
+from gaphor.application import Application
+from gaphor.diagram import items
+from gaphor.diagram.textelement import text_cache
+from utils.benchmark import timed, report
+
+SIZES = (100, 500)
+CLASSES = 10
+
+
+def create_diagram(factory, features):
+    diagram = factory.create(UML.Diagram)
+    for i in xrange(CLASSES):
+        c = factory.create(UML.Class)
+        c.name = 'Class%d' % i
+        for j in xrange(features / 2):
+            a = factory.create(UML.Property)
+            UML.parse(a, '+attr%d: int = 0' % j)
+            c.ownedAttribute = a
+            o = factory.create(UML.Operation)
+            UML.parse(o, '+op%d(x: int): bool' % j)
+            c.ownedOperation = o
+        item = diagram.create(items.ClassItem, subject=c)
+        item.matrix.translate(i * 200, 0)
+    return diagram
+
+
+def update(canvas):
+    for item in canvas.get_all_items():
+        canvas.request_update(item)
+    canvas.update_now()
+
+
+def paint(view):
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 400, 400)
+    cr = cairo.Context(surface)
+    view.paint(cr)
+    surface.flush()
+
+
+def main(sizes=SIZES):
+    Application.init(services=['element_factory', 'component_registry',
+            'element_dispatcher', 'adapter_loader'])
+    factory = Application.get_service('element_factory')
+
+    for size in sizes:
+        canvas = create_diagram(factory, size).canvas
+        n = size * CLASSES
+
+        text_cache.clear()
+        t, _ = timed(update, canvas)
+        report('update (cold)', n, t, 'feature')
+        t, _ = timed(update, canvas)
+        report('update (warm)', n, t, 'feature')
+
+        view = View(canvas)
+        view.painter = ItemPainter()
+        t, _ = timed(paint, view)
+        report('paint', n, t, 'feature')
+
+        factory.flush()
+
+    Application.shutdown()
+
+
+if __name__ == '__main__':
+    main(map(int, sys.argv[1:]) or SIZES)
+
+
+# vim:sw=4:et:ai
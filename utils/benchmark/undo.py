@@ -0,0 +1,85 @@
+"""
+Measure the undo log of deleting large selections.
+
+A diagram with a number of comment items is created, then all items are
+deleted in one transaction (as the delete action in the diagram tab does).
+The time it takes to delete the items and to undo and redo the deletion is
+reported, as well as the number of recorded undo actions and the memory
+taken by the actions themselves (not counting the model objects they refer
+to).
+
+Usage:
+    python -m utils.benchmark.undo [items ...]
+"""
+
+import sys
+
+from gaphor import UML
+from gaphor.application import Application
+from gaphor.diagram import items
+from gaphor.transaction import Transaction
+from utils.benchmark import timed, report
+
+SIZES = (1000, 5000)
+
+
+def action_size(action):
+    """
+    Return the size in bytes of an undo action: a tuple, or a function and
+    its closure.
+    """
+    size = sys.getsizeof(action)
+    closure = getattr(action, 'func_closure', None)
+    if closure:
+        size += sys.getsizeof(closure) + sum(map(sys.getsizeof, closure))
+    return size
+
+
+def delete(selection):
+    tx = Transaction()
+    for item in selection:
+        item.unlink()
+    tx.commit()
+
+
+def main(sizes=SIZES):
+    Application.init(services=['element_factory', 'component_registry',
+            'element_dispatcher', 'adapter_loader', 'undo_manager'])
+    factory = Application.get_service('element_factory')
+    undo_manager = Application.get_service('undo_manager')
+
+    for size in sizes:
+        diagram = factory.create(UML.Diagram)
+        selection = []
+        for i in xrange(size):
+            item = diagram.create(items.CommentItem,
+                                  subject=factory.create(UML.Comment))
+            item.subject.body = 'Comment %d' % i
+            item.matrix.translate(i, i)
+            selection.append(item)
+        undo_manager.clear_undo_stack()
+
+        t, _ = timed(delete, selection)
+        report('delete', size, t, 'item')
+        actions = undo_manager._undo_stack[-1]._actions
+        print '%d undo actions, %d bytes' % (len(actions),
+                sum(map(action_size, actions)))
+        del selection, actions
+
+        t, _ = timed(undo_manager.undo_transaction)
+        report('undo', size, t, 'item')
+        t, _ = timed(undo_manager.redo_transaction)
+        report('redo', size, t, 'item')
+
+        undo_manager.clear_undo_stack()
+        undo_manager.clear_redo_stack()
+        factory.flush()
+
+    Application.shutdown()
+
+
+if __name__ == '__main__':
+    main(map(int, sys.argv[1:]) or SIZES)
+
+
+# vim:sw=4:et:ai
@@ -0,0 +1,104 @@
+"""
+Measure the cost of registering and unregistering the event watchers of
+diagram items.
+
+A diagram is populated with class items. Each class has a few attributes
+and operations, so the watched paths fan out. The handlers of all items
+are unregistered and registered again (as happens when a diagram is
+opened) and the time per item is reported. The best of a few rounds is
+taken.
+
+Then operations are added to and removed from the first ten classes a number
+of times, as happens during an editing session. The size of the dispatcher's
+reverse index and the time it takes to unregister afterwards are reported.
+
+Usage:
+    python -m utils.benchmark.watchers [items ...]
+"""
+
+import sys
+
+from gaphor import UML
+from gaphor.application import Application
+from gaphor.diagram import items
+from utils.benchmark import timed, report
+
+SIZES = (500, 2000)
+ROUNDS = 3
+CHURN = 10
+
+
+def create_items(factory, size):
+    diagram = factory.create(UML.Diagram)
+    result = []
+    for i in xrange(size):
+        c = factory.create(UML.Class)
+        c.name = 'Class%d' % i
+        for j in range(3):
+            a = factory.create(UML.Property)
+            a.name = 'attr%d' % j
+            c.ownedAttribute = a
+            o = factory.create(UML.Operation)
+            o.name = 'op%d' % j
+            c.ownedOperation = o
+        result.append(diagram.create(items.ClassItem, subject=c))
+    return result
+
+
+def register(class_items):
+    for item in class_items:
+        item.register_handlers()
+
+
+def unregister(class_items):
+    for item in class_items:
+        item.unregister_handlers()
+
+
+def churn(factory, class_items, rounds=10):
+    for i in xrange(rounds):
+        for item in class_items[:CHURN]:
+            o = factory.create(UML.Operation)
+            item.subject.ownedOperation = o
+            o.unlink()
+
+
+def reverse_size(dispatcher):
+    return sum(len(keys) for keys in dispatcher._reverse.itervalues())
+
+
+def main(sizes=SIZES):
+    Application.init(services=['element_factory', 'component_registry',
+            'element_dispatcher', 'adapter_loader'])
+    factory = Application.get_service('element_factory')
+    dispatcher = Application.get_service('element_dispatcher')
+
+    for size in sizes:
+        class_items = create_items(factory, size)
+        print '%d paths per item' % len(class_items[0].watcher._watched_paths)
+
+        times = []
+        for i in range(ROUNDS):
+            t_unregister, _ = timed(unregister, class_items)
+            t_register, _ = timed(register, class_items)
+            times.append((t_unregister, t_register))
+        report('unregister', size, min(t[0] for t in times), 'item')
+        report('register', size, min(t[1] for t in times), 'item')
+        print '%d handler keys' % len(dispatcher._handlers)
+
+        before = reverse_size(dispatcher)
+        t, _ = timed(churn, factory, class_items)
+        report('churn', min(size, CHURN), t, 'item')
+        print 'reverse index: %d -> %d' % (before, reverse_size(dispatcher))
+        t, _ = timed(unregister, class_items)
+        report('unregister (churned)', size, t, 'item')
+        factory.flush()
+
+    Application.shutdown()
+
+
+if __name__ == '__main__':
+    main(map(int, sys.argv[1:]) or SIZES)
+
+
+# vim:sw=4:et:ai
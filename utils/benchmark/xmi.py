@@ -0,0 +1,70 @@
+"""
+Measure XMI export of large models.
+
+The model consists of one package with a number of classes, each with an
+attribute and an operation. Every other class is a specialization of the
+first class. The model is exported to a temporary file.
+
+Usage:
+    python -m utils.benchmark.xmi [elements ...]
+"""
+
+import os
+import sys
+import tempfile
+
+from gaphor import UML
+from gaphor.application import Application
+from gaphor.plugins.xmiexport.exportmodel import XMIExport
+from utils.benchmark import timed, report
+
+SIZES = (1000, 10000, 50000)
+
+
+def create_model(factory, size):
+    package = factory.create(UML.Package)
+    package.name = 'model'
+    first = None
+    for i in xrange(size / 4):
+        c = factory.create(UML.Class)
+        c.name = 'Class%d' % i
+        c.package = package
+        a = factory.create(UML.Property)
+        a.name = 'attr%d' % i
+        c.ownedAttribute = a
+        o = factory.create(UML.Operation)
+        o.name = 'op%d' % i
+        c.ownedOperation = o
+        if first is None:
+            first = c
+        elif i % 2:
+            g = factory.create(UML.Generalization)
+            g.general = first
+            g.specific = c
+
+
+def main(sizes=SIZES):
+    Application.init(services=['element_factory', 'component_registry',
+            'element_dispatcher'])
+    factory = Application.get_service('element_factory')
+    fd, filename = tempfile.mkstemp(suffix='.xmi')
+    os.close(fd)
+
+    try:
+        for size in sizes:
+            create_model(factory, size)
+            t, _ = timed(XMIExport(factory).export, filename)
+            report('export', factory.size(), t)
+            print '%d bytes' % os.path.getsize(filename)
+            factory.flush()
+    finally:
+        os.remove(filename)
+
+    Application.shutdown()
+
+
+if __name__ == '__main__':
+    main(map(int, sys.argv[1:]) or SIZES)
+
+
+# vim:sw=4:et:ai
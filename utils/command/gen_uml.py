@@ -57,6 +57,113 @@ def camelCase_to_underscore(str):
 _ = camelCase_to_underscore
 
 
+# Elements of these classes are swapped for one another (see
+# ElementFactory.swap_element()), so they should have the same slots.
+swappable = (
+    ('Class', 'Stereotype'),
+    ('Dependency', 'Usage', 'Realization', 'Implementation'),
+    ('DecisionNode', 'MergeNode'),
+    ('ForkNode', 'JoinNode'),
+)
+
+# Properties that store their value in the instance
+stored_property = re.compile(r'^(\w+)\.(\w+) = (?:attribute|enumeration|association|derived|derivedunion|presentation)\(', re.M)
+
+
+def slot_layout(bases, storage, overridden=(), swappable=()):
+    """
+    Return a dict with the __slots__ for each class.
+
+    bases maps class names to the names of their base classes, storage maps
+    class names to the attributes their properties store values in. A class
+    gets slots for its own storage and for the storage of base classes that
+    have no slots. Overridden classes get no slots. The classes in each
+    tuple in swappable should have the same slots: their storage goes to
+    their nearest common base class.
+
+    Python allows only one line of slotted classes among the bases of a
+    class. If the bases conflict, the class with the fewest slots loses its
+    slots and the layout is computed again. Attributes without a slot are
+    stored in the instance __dict__ (see Element).
+
+    >>> bases = { 'A': [], 'B': ['A'], 'C': ['A'], 'D': ['B', 'C'] }
+    >>> storage = { 'A': ['_a'], 'B': ['_b'], 'C': ['_c1', '_c2'] }
+    >>> layout = slot_layout(bases, storage, overridden=['A'])
+    >>> sorted(layout.items())
+    [('A', ()), ('B', ()), ('C', ('_a', '_c1', '_c2')), ('D', ('_b',))]
+    >>> layout = slot_layout(bases, storage, swappable=[('B', 'C')])
+    >>> sorted(layout.items())
+    [('A', ('_a', '_b', '_c1', '_c2')), ('B', ()), ('C', ()), ('D', ())]
+    """
+    ancestors = {}
+    def ancestors_of(name):
+        try:
+            return ancestors[name]
+        except KeyError:
+            a = set([name])
+            for b in bases.get(name, ()):
+                a.update(ancestors_of(b))
+            ancestors[name] = a
+            return a
+
+    candidates = set(bases).difference(overridden)
+    storage = dict((name, set(s)) for name, s in storage.iteritems())
+    for classes in swappable:
+        common = reduce(set.intersection, map(ancestors_of, classes))
+        common = max(common, key=lambda a: len(ancestors_of(a)))
+        for name in classes:
+            for a in ancestors_of(name) - ancestors_of(common):
+                candidates.discard(a)
+                storage.setdefault(common, set()).update(storage.get(a, ()))
+
+    while True:
+        slots = {}
+        solid = {}
+
+        def layout(name):
+            """
+            Set the slots for class name and return its solid base: the
+            nearest class that adds slots.
+            """
+            if name in solid:
+                return solid[name]
+            head = None
+            for b in bases.get(name, ()):
+                s = layout(b)
+                if s is None or head is not None and s in ancestors_of(head):
+                    continue
+                if head is None or head in ancestors_of(s):
+                    head = s
+                elif len(slots[head]) < len(slots[s]):
+                    raise _Conflict(head)
+                else:
+                    raise _Conflict(s)
+            own = ()
+            if name in candidates:
+                names = set()
+                for a in ancestors_of(name):
+                    names.update(storage.get(a, ()))
+                for a in ancestors_of(name):
+                    if a != name:
+                        names.difference_update(slots[a])
+                own = tuple(sorted(names))
+            slots[name] = own
+            solid[name] = own and name or head
+            return solid[name]
+
+        try:
+            for name in bases:
+                layout(name)
+        except _Conflict, e:
+            candidates.discard(e.args[0])
+        else:
+            return slots
+
+
+class _Conflict(Exception):
+    pass
+
+
 def msg(s):
     sys.stderr.write('  ')
     sys.stderr.write(s)
@@ -72,11 +179,28 @@ class Writer:
             self.out = hasattr(filename, 'write') and filename or open(filename, 'w')
         else:
             self.out = sys.stdout
+        # Output is held back until the slots of the classes are known
+        self.chunks = []
+        self.bases = {}
+        self.storage = {}
+        self.overridden = set()
 
     def write(self, data):
-        self.out.write(data)
+        self.chunks.append(data)
+        for class_name, name in stored_property.findall(data):
+            self.storage.setdefault(str(class_name), set()).add(str('_' + name))
 
     def close(self):
+        slots = slot_layout(self.bases, self.storage, self.overridden,
+                            swappable)
+        for chunk in self.chunks:
+            if isinstance(chunk, tuple):
+                name, bases = chunk
+                if slots[name]:
+                    chunk = 'class %s(%s):\n    __slots__ = %r\n' % (name, bases, slots[name])
+                else:
+                    chunk = 'class %s(%s): pass\n' % (name, bases)
+            self.out.write(chunk)
         self.out.close()
 
     def write_classdef(self, clazz):
@@ -92,9 +216,13 @@ class Writer:
                 self.write_classdef(g)
                 if s: s += ', '
                 s = s + g['name']
-            if not s: s = 'object'
-            if not self.overrides.write_override(self, clazz['name']):
-                self.write('class %s(%s): pass\n' % (clazz['name'], s))
+            self.bases[clazz['name']] = [g['name'] for g in clazz.generalization]
+            if self.overrides.write_override(self, clazz['name']):
+                self.overridden.add(clazz['name'])
+            else:
+                # The class statement is written on close()
+                if not s: s = 'object'
+                self.chunks.append((clazz['name'], s))
         clazz.written = True
 
     def write_property(self, full_name, value):